@@ -1,14 +1,56 @@
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
 from django.shortcuts import redirect
 from django.urls import reverse
 
+
+async def _loaded(user):
+    return user
+
+
 class AdminRedirectMiddleware:
+    """Keep a logged-in superuser on the admin dashboard.
+
+    Runs on every request, so it bails out before touching the session or
+    the user for static and media files and for visitors without a session
+    cookie, who cannot be logged in. Works natively under WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        self.dashboard_url = None
+        self.exempt_prefixes = None
+
+    def may_redirect(self, request):
+        if self.exempt_prefixes is None:
+            # Resolved on first use: the URLconf may still be loading in __init__.
+            self.dashboard_url = reverse('admin_dashboard')
+            static = ('/' + prefix.lstrip('/') for prefix in (settings.STATIC_URL, settings.MEDIA_URL) if prefix)
+            self.exempt_prefixes = (self.dashboard_url, '/logout/', *static)
+        return settings.SESSION_COOKIE_NAME in request.COOKIES and not request.path.startswith(self.exempt_prefixes)
 
     def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
         # If superuser is logged in and not already at dashboard → redirect
-        if request.user.is_authenticated and request.user.is_superuser:
-            dashboard_url = reverse('admin_dashboard')
-            if not request.path.startswith(dashboard_url) and not request.path.startswith('/logout/'):
-                return redirect(dashboard_url)
+        if self.may_redirect(request):
+            user = request.user
+            if user.is_authenticated and user.is_superuser:
+                return redirect(self.dashboard_url)
+            # Async views await request.auser(), which would load the row again.
+            request.auser = partial(_loaded, user)
         return self.get_response(request)
+
+    async def __acall__(self, request):
+        if self.may_redirect(request):
+            user = await request.auser()
+            if user.is_authenticated and user.is_superuser:
+                return redirect(self.dashboard_url)
+        return await self.get_response(request)
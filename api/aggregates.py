@@ -0,0 +1,234 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, F, Max, Min, Q, Value, When
+from django.db.models.functions import Greatest
+
+from .models import CatalogAggregate, Product
+
+
+# Product count, price range and newest listing for the whole catalog
+# ('all', key 0), each category and each seller. Product signals apply
+# deltas (api/signals.py) and the importer applies a whole batch at once,
+# so reading a count is one indexed row. A row's
+# extremes are only re-read from Product when a delete or edit takes away
+# the value it holds as minimum, maximum or latest. Bulk deletes run inside
+# deferred_removals(), which applies all their rows at once, like the
+# importer does for inserts. rebuild() recomputes everything.
+
+GROUPS = {'all': None, 'category': 'category_id', 'seller': 'seller_id'}
+FIELDS = ('product_count', 'min_price', 'max_price', 'latest_product_id', 'latest_created_at')
+EMPTY = dict.fromkeys(FIELDS) | {'product_count': 0}
+
+_pending_removals = ContextVar('pending_removals', default=None)
+
+
+def keys_for(category_id, seller_id):
+    return {('all', 0), ('category', category_id), ('seller', seller_id)}
+
+
+def _price(value):
+    return Product._meta.get_field('price').to_python(value)
+
+
+def _products(scope, key):
+    return Product.objects.filter(**{GROUPS[scope]: key}) if GROUPS[scope] else Product.objects.all()
+
+
+def _update_or_create(scope, key, **updates):
+    if CatalogAggregate.objects.filter(scope=scope, key=key).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            CatalogAggregate.objects.create(scope=scope, key=key)
+    except IntegrityError:
+        pass  # created concurrently
+    CatalogAggregate.objects.filter(scope=scope, key=key).update(**updates)
+
+
+def _widen_prices(low, high):
+    decimal = models.DecimalField(max_digits=10, decimal_places=2)
+    return {
+        'min_price': Case(When(Q(min_price__isnull=True) | Q(min_price__gt=low), then=Value(low)),
+                          default=F('min_price'), output_field=decimal),
+        'max_price': Case(When(Q(max_price__isnull=True) | Q(max_price__lt=high), then=Value(high)),
+                          default=F('max_price'), output_field=decimal),
+    }
+
+
+def _extremes(scope, key):
+    products = _products(scope, key)
+    # Two ordered lookups rather than one MIN/MAX aggregate: each is a single
+    # seek on a (group, price) index, where SQLite scans the whole group to
+    # compute both in one query.
+    prices = products.values_list('price', flat=True)
+    stats = {'min_price': prices.order_by('price').first(), 'max_price': prices.order_by('-price').first()}
+    latest = products.order_by('-created_at', '-id').values_list('pk', 'created_at').first() or (None, None)
+    return {**stats, 'latest_product_id': latest[0], 'latest_created_at': latest[1]}
+
+
+def recompute(scope, key):
+    """Recompute one row from Product."""
+    _update_or_create(scope, key, product_count=_products(scope, key).count(), **_extremes(scope, key))
+
+
+def recompute_extremes(scope, key):
+    """Recompute a row's price range and latest product, leaving its count alone.
+
+    Deletes run before their post_delete signals, so when a batch is
+    deleted every signal already sees the final table: re-reading the
+    extremes is idempotent, while the count must stay a per-row delta.
+    """
+    CatalogAggregate.objects.filter(scope=scope, key=key).update(**_extremes(scope, key))
+
+
+def _add(scope, key, products):
+    product = max(products, key=lambda p: (p.created_at, p.pk))
+    prices = [_price(p.price) for p in products]
+    newer = Q(latest_created_at__isnull=True) | Q(latest_created_at__lt=product.created_at) | Q(
+        latest_created_at=product.created_at, latest_product_id__lt=product.pk,
+    )
+    _update_or_create(
+        scope, key,
+        product_count=F('product_count') + len(products),
+        latest_product_id=Case(When(newer, then=Value(product.pk)), default=F('latest_product_id'),
+                               output_field=models.BigIntegerField()),
+        latest_created_at=Case(When(newer, then=Value(product.created_at)), default=F('latest_created_at'),
+                               output_field=models.DateTimeField()),
+        **_widen_prices(min(prices), max(prices)),
+    )
+
+
+def _remove(scope, key, removed):
+    """Take the ``(pk, price)`` pairs in ``removed`` out of one row."""
+    rows = CatalogAggregate.objects.filter(scope=scope, key=key)
+    rows.update(product_count=Greatest(F('product_count') - len(removed), 0))
+    pks, prices = {pk for pk, _ in removed}, {price for _, price in removed}
+    # The FK's SET_NULL has already cleared latest_product if it was one of these.
+    stale = (Q(min_price__in=prices) | Q(max_price__in=prices) | Q(latest_product_id__in=pks)
+             | Q(latest_product_id__isnull=True))
+    if rows.filter(stale).exists():
+        recompute_extremes(scope, key)
+
+
+def product_added(product):
+    products_added([product])
+
+
+def products_added(products):
+    """Apply a batch of new rows, e.g. from bulk_create, with one update per aggregate row."""
+    groups = {}
+    for product in products:
+        for scope_key in keys_for(product.category_id, product.seller_id):
+            groups.setdefault(scope_key, []).append(product)
+    for (scope, key), group in groups.items():
+        _add(scope, key, group)
+
+
+def product_removed(pk, category_id, seller_id, price):
+    pending = _pending_removals.get()
+    if pending is not None:
+        pending.append((pk, category_id, seller_id, price))
+    else:
+        products_removed([(pk, category_id, seller_id, price)])
+
+
+def products_removed(rows):
+    """Apply a batch of deleted ``(pk, category_id, seller_id, price)`` rows, one update per aggregate row."""
+    groups = {}
+    for pk, category_id, seller_id, price in rows:
+        for scope_key in keys_for(category_id, seller_id):
+            groups.setdefault(scope_key, []).append((pk, _price(price)))
+    for (scope, key), removed in groups.items():
+        _remove(scope, key, removed)
+
+
+@contextmanager
+def deferred_removals():
+    """Collect the product_removed() calls made inside the block and apply them together on exit.
+
+    For deletes of many rows, whose post_delete signals would otherwise
+    update every aggregate row once per product.
+    """
+    pending = []
+    token = _pending_removals.set(pending)
+    try:
+        yield
+    finally:
+        _pending_removals.reset(token)
+    products_removed(pending)
+
+
+def product_changed(product, category_id, seller_id, price):
+    """Apply an edit of ``product`` whose previous values are given."""
+    old_keys, new_keys = keys_for(category_id, seller_id), keys_for(product.category_id, product.seller_id)
+    price, new_price = _price(price), _price(product.price)
+    for scope, key in old_keys - new_keys:
+        _remove(scope, key, [(product.pk, price)])
+    for scope, key in new_keys - old_keys:
+        _add(scope, key, [product])
+    if new_price != price:
+        for scope, key in old_keys & new_keys:
+            rows = CatalogAggregate.objects.filter(scope=scope, key=key)
+            if rows.filter(Q(min_price=price) | Q(max_price=price)).exists():
+                recompute_extremes(scope, key)
+            else:
+                rows.update(**_widen_prices(new_price, new_price))
+
+
+def forget(scope, key):
+    CatalogAggregate.objects.filter(scope=scope, key=key).delete()
+
+
+def expected():
+    """Every row as recomputed from Product, keyed by (scope, key)."""
+    stats = {'product_count': Count('id'), 'min_price': Min('price'), 'max_price': Max('price'),
+             'latest_created_at': Max('created_at')}
+    rows = {('all', 0): Product.objects.aggregate(**stats)}
+    for scope in ('category', 'seller'):
+        for row in Product.objects.values(GROUPS[scope]).annotate(**stats).order_by():
+            rows[scope, row.pop(GROUPS[scope])] = row
+    for (scope, key), row in rows.items():
+        row['latest_product_id'] = _products(scope, key).order_by('-created_at', '-id').values_list('pk', flat=True).first()
+    return rows
+
+
+def differences():
+    """(scope, key, stored, expected) for every row that disagrees with Product."""
+    have = {
+        (row.pop('scope'), row.pop('key')): row
+        for row in CatalogAggregate.objects.values('scope', 'key', *FIELDS)
+    }
+    want = expected()
+    return [
+        (scope, key, have.get((scope, key)), want.get((scope, key), EMPTY))
+        for scope, key in sorted(set(have) | set(want))
+        if have.get((scope, key), EMPTY) != want.get((scope, key), EMPTY)
+    ]
+
+
+def rebuild():
+    """Replace every row with values recomputed from Product; return the row count."""
+    rows = expected()
+    with transaction.atomic():
+        CatalogAggregate.objects.all().delete()
+        CatalogAggregate.objects.bulk_create(
+            [CatalogAggregate(scope=scope, key=key, **values) for (scope, key), values in rows.items()],
+            batch_size=500,
+        )
+    return len(rows)
+
+
+def counts(scope):
+    """{key: product_count} for every row of ``scope``."""
+    return dict(CatalogAggregate.objects.filter(scope=scope).values_list('key', 'product_count'))
+
+
+async def acounts(scope):
+    """Async version of counts."""
+    return {key: count async for key, count in CatalogAggregate.objects.filter(scope=scope).values_list('key', 'product_count')}
+
+
+def count(scope, key=0):
+    return CatalogAggregate.objects.filter(scope=scope, key=key).values_list('product_count', flat=True).first() or 0
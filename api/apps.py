@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # Importing these registers signal receivers and job handlers.
+        from . import importer, moderation, signals  # noqa: F401
+        from .instrumentation import install_sql_wrapper
+        from .search import install_search_backend, recover_search_backend
+        post_migrate.connect(install_search_backend, sender=self)
+        connection_created.connect(install_sql_wrapper)
+        connection_created.connect(recover_search_backend)
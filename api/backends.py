@@ -1,18 +1,79 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import load_backend
 from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.signals import user_login_failed
+from django.core.cache import caches
+from django.views.decorators.debug import sensitive_variables
+from .metrics import AUTH_LATENCY
 from .models import User
 
+
+# The session user is resolved on every authenticated request, so the row
+# is kept in USER_CACHE_ALIAS for USER_CACHE_TIMEOUT seconds. Any save or
+# delete drops the entry (see api/signals.py), so after a password change
+# the session hash check in django.contrib.auth runs against the new hash.
+# That only holds on a cache every worker shares; the settings leave
+# USER_CACHE_ALIAS unset otherwise, and rows are then read each time.
+
+def user_cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def forget_cached_users(user_ids):
+    if settings.USER_CACHE_ALIAS:
+        caches[settings.USER_CACHE_ALIAS].delete_many([user_cache_key(pk) for pk in user_ids])
+
+
+@sensitive_variables('credentials')
+def authenticate(request, **credentials):
+    """Check ``credentials`` against the one backend that owns their type.
+
+    django.contrib.auth.authenticate offers the credentials to every
+    backend in turn; here an ``email`` login only reaches EmailBackend and
+    a ``username`` login only ModelBackend (AUTH_CREDENTIAL_BACKENDS), so a
+    login costs exactly one password hash, found user or not.
+    """
+    kind = next((kind for kind in settings.AUTH_CREDENTIAL_BACKENDS if kind in credentials), None)
+    if kind is None:
+        return None
+    path = settings.AUTH_CREDENTIAL_BACKENDS[kind]
+    started = time.perf_counter()
+    user = load_backend(path).authenticate(request, **credentials)
+    AUTH_LATENCY.observe(time.perf_counter() - started, backend=kind, outcome='success' if user else 'failure')
+    if user is None:
+        user_login_failed.send(sender=__name__, credentials={kind: credentials[kind]}, request=request)
+        return None
+    user.backend = path
+    return user
+
+
 class EmailBackend(ModelBackend):
     def authenticate(self, request, email=None, password=None, **kwargs):
         if email is None or password is None:
             return None
         try:
             user = User.objects.get(email=email)
-            if user.check_password(password):
-                return user
         except User.DoesNotExist:
+            # Hash anyway so a missing account takes as long as a wrong password.
+            User().set_password(password)
             return None
+        # check_password re-hashes and saves when the hasher settings changed.
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
+
     def get_user(self, user_id):
-        try:
-            return User.objects.get(pk=user_id)
-        except User.DoesNotExist:
-            return None
+        cache = caches[settings.USER_CACHE_ALIAS] if settings.USER_CACHE_ALIAS else None
+        key = user_cache_key(user_id)
+        user = cache.get(key) if cache else None
+        if user is None:
+            try:
+                user = User.objects.get(pk=user_id)
+            except User.DoesNotExist:
+                return None
+            if cache:
+                cache.set(key, user, settings.USER_CACHE_TIMEOUT)
+        # A deactivated user's existing sessions stop working too.
+        return user if self.user_can_authenticate(user) else None
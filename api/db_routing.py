@@ -0,0 +1,101 @@
+import random
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+
+# Read-replica routing. Views decorated with @read_only send their reads to
+# one of DATABASE_REPLICAS; everything else, all writes, sessions and the
+# job queue stay on 'default'. A client that just wrote is pinned to the
+# primary for REPLICA_PIN_SECONDS by ReplicaPinningMiddleware, so it reads
+# its own writes even when the replicas lag.
+
+PIN_COOKIE = 'primary_pin'
+PRIMARY_ONLY = {'sessions', 'api.job'}
+
+_read_only = ContextVar('read_only', default=False)
+_pinned = ContextVar('pinned', default=False)
+
+
+def use_replicas():
+    return _read_only.get() and not _pinned.get() and bool(settings.DATABASE_REPLICAS)
+
+
+def read_only(view):
+    """Route the reads made while ``view`` runs to a replica."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            token = _read_only.set(request.method in ('GET', 'HEAD'))
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _read_only.reset(token)
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            token = _read_only.set(request.method in ('GET', 'HEAD'))
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                _read_only.reset(token)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_ONLY or model._meta.label_lower in PRIMARY_ONLY:
+            return 'default'
+        if use_replicas():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication.
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaPinningMiddleware:
+    """Pin a client's reads to the primary for a while after it writes."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def pin(self, response):
+        response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = _pinned.set(PIN_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            _pinned.reset(token)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and settings.DATABASE_REPLICAS:
+            self.pin(response)
+        return response
+
+    async def __acall__(self, request):
+        token = _pinned.set(PIN_COOKIE in request.COOKIES)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _pinned.reset(token)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and settings.DATABASE_REPLICAS:
+            self.pin(response)
+        return response
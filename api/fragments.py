@@ -0,0 +1,62 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+from django.db.models import Count, Max
+from django.template.loader import render_to_string
+
+from . import aggregates
+from .models import Category, Product
+
+
+# Rendered-HTML cache for the catalog. Product cards are cached per
+# (id, updated_at) by the {% cache %} tag in _product_card.html; whole grids
+# are cached per (category, cursor) under a digest of catalog_state(). Both
+# keys come from the database, which every worker and job process shares,
+# so a change made anywhere moves them on even with a per-process cache.
+
+
+def fragment_cache():
+    return caches[settings.FRAGMENT_CACHE_ALIAS]
+
+
+def catalog_state():
+    """Newest product and category edits and their counts: what a catalog grid depends on.
+
+    MAX() over an indexed column is a single index seek in SQLite, and the
+    product count is precomputed; the counts catch deletes, which
+    MAX(updated_at) misses. Edits that change what a card shows (thumbnails,
+    deduplicated media) touch the product's updated_at.
+    """
+    product = Product.objects.aggregate(latest=Max('updated_at'))['latest']
+    categories = Category.objects.aggregate(latest=Max('updated_at'), count=Count('id'))
+    return product, categories['latest'], aggregates.count('all'), categories['count']
+
+
+def forget_product_card(product):
+    fragment_cache().delete(make_template_fragment_key('product_card', [product.pk, product.updated_at.timestamp()]))
+
+
+def render_product_grid(products, empty_message='No products available.'):
+    return render_to_string('_product_grid.html', {
+        'products': products,
+        'empty_message': empty_message,
+        'card_cache_alias': settings.FRAGMENT_CACHE_ALIAS,
+        'card_cache_timeout': settings.FRAGMENT_CACHE_TIMEOUT,
+    })
+
+
+async def acached_grid(state, category, cursor, build):
+    """Return the cached ``(html, next_cursor)`` for a catalog page, awaiting ``build()`` on a miss.
+
+    ``state`` is the catalog_state() the page was built from.
+    """
+    version = hashlib.md5(repr(state).encode()).hexdigest()
+    key = f"catalog:grid:{version}:{category or 'all'}:{cursor or ''}"
+    cache = fragment_cache()
+    entry = await cache.aget(key)
+    if entry is None:
+        entry = await build()
+        await cache.aset(key, entry, settings.FRAGMENT_CACHE_TIMEOUT)
+    return entry
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+# Password hashers whose cost is read from settings instead of being fixed
+# per Django release. Changing a cost makes must_update() true for hashes
+# made with the old one, and AbstractBaseUser.check_password re-hashes those
+# on the user's next successful login.
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return settings.PASSWORD_PBKDF2_ITERATIONS
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """Argon2id with a per-deployment memory budget. Requires argon2-cffi."""
+
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2_MEMORY_KIB
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2_PARALLELISM
@@ -0,0 +1,175 @@
+import hashlib
+import logging
+import os
+import urllib.request
+from functools import lru_cache, wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db.models import Max
+from django.template.loader import get_template
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from . import aggregates
+from .fragments import catalog_state
+from .jobs import enqueue_batched, job
+from .models import Product, User
+
+logger = logging.getLogger(__name__)
+
+
+# HTTP validators and shared-cache headers for the public pages.
+#
+# Only anonymous requests (no session or messages cookie) are made
+# publicly cacheable: the navbar is personalised for logged-in users, so
+# their responses stay private. Each cacheable response is tagged with
+# surrogate keys that are purged from the reverse proxy when the data
+# behind them changes (see purge_keys below and api/signals.py).
+
+def is_anonymous_request(request):
+    return settings.SESSION_COOKIE_NAME not in request.COOKIES and 'messages' not in request.COOKIES
+
+
+def _private(response):
+    patch_cache_control(response, private=True)
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+def public_page(keys, validators, max_age='HTTP_CACHE_MAX_AGE', s_maxage='HTTP_CACHE_S_MAXAGE'):
+    """Decorate a GET view with cheap validators, Cache-Control and Surrogate-Key.
+
+    ``keys`` and ``validators`` are called with the view's arguments;
+    ``validators`` returns ``(etag_state, last_modified)`` and must not
+    render anything, only read versions or indexed timestamps. ``max_age``
+    and ``s_maxage`` name the settings holding the lifetimes. Works on
+    sync and async views.
+    """
+    def decorator(view):
+        def cacheable(request):
+            return request.method in ('GET', 'HEAD') and is_anonymous_request(request)
+
+        def check(request, *args, **kwargs):
+            state, modified = validators(request, *args, **kwargs)
+            digest = hashlib.md5(repr((view.__name__, request.get_full_path(), state)).encode()).hexdigest()
+            etag = f'"{digest}"'
+            return etag, modified, get_conditional_response(request, etag=etag, last_modified=modified)
+
+        def finish(response, etag, modified, request, *args, **kwargs):
+            if response.status_code not in (200, 304):
+                return response
+            response['ETag'] = etag
+            if modified:
+                response['Last-Modified'] = http_date(modified)
+            patch_cache_control(
+                response, public=True,
+                max_age=getattr(settings, max_age), s_maxage=getattr(settings, s_maxage),
+            )
+            # Logged-in visitors must never be served the anonymous copy.
+            patch_vary_headers(response, ['Cookie'])
+            response[settings.SURROGATE_KEY_HEADER] = ' '.join(keys(request, *args, **kwargs))
+            return response
+
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                if not cacheable(request):
+                    return _private(await view(request, *args, **kwargs))
+                # One thread hop for all validator queries.
+                etag, modified, response = await sync_to_async(check)(request, *args, **kwargs)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return finish(response, etag, modified, request, *args, **kwargs)
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                if not cacheable(request):
+                    return _private(view(request, *args, **kwargs))
+                etag, modified, response = check(request, *args, **kwargs)
+                if response is None:
+                    response = view(request, *args, **kwargs)
+                return finish(response, etag, modified, request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _timestamp(value):
+    return int(value.timestamp()) if value else None
+
+
+@lru_cache(maxsize=None)
+def template_mtime(*names):
+    return int(max(os.path.getmtime(get_template(name).origin.name) for name in names))
+
+
+def static_page(template_name):
+    """Validators for pages that only change on deploy."""
+    names = (template_name, 'base.html')
+    return public_page(
+        keys=lambda request: ['pages'],
+        validators=lambda request: (template_mtime(*names), template_mtime(*names)),
+        max_age='HTTP_CACHE_STATIC_MAX_AGE',
+        s_maxage='HTTP_CACHE_STATIC_MAX_AGE',
+    )
+
+
+def catalog_validators(request, *args, **kwargs):
+    # The state the cached grids are keyed on (api/fragments.py); kept on
+    # the request so the view does not read it again.
+    request.catalog_state = state = catalog_state()
+    product, category = state[:2]
+    return state, _timestamp(max(filter(None, [product, category]), default=None))
+
+
+def catalog_keys(request, *args, **kwargs):
+    category = request.GET.get('category', '')
+    return ['catalog', f'category-{category}'] if category.isdigit() else ['catalog']
+
+
+catalog_page = public_page(keys=catalog_keys, validators=catalog_validators)
+
+
+def product_validators(request, pk):
+    updated_at = Product.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    return updated_at, _timestamp(updated_at)
+
+
+product_page = public_page(keys=lambda request, pk: [f'product-{pk}'], validators=product_validators)
+
+
+def profile_validators(request, pk):
+    # Users carry no updated_at: the ETag covers the displayed fields, and
+    # the latest edit and product count cover the seller's product list.
+    fields = User.objects.filter(pk=pk).values_list(
+        'full_name', 'mobile_no', 'email', 'photo', 'facebook_link', 'role',
+    ).first()
+    latest = Product.objects.filter(seller_id=pk).aggregate(latest=Max('updated_at'))['latest']
+    return (fields, latest, aggregates.count('seller', pk)), None
+
+
+profile_page = public_page(keys=lambda request, pk: [f'seller-{pk}'], validators=profile_validators)
+
+
+def product_keys(product):
+    return ['catalog', f'category-{product.category_id}', f'product-{product.pk}', f'seller-{product.seller_id}']
+
+
+def purge_keys(keys):
+    """Ask the reverse proxy to drop responses tagged with ``keys``, off the request path.
+
+    A bulk delete fires a signal per row; inside a transaction the keys are
+    merged so it queues one purge instead of one per row.
+    """
+    if settings.SURROGATE_PURGE_URL:
+        enqueue_batched('http_cache.purge', 'keys', keys)
+
+
+@job('http_cache.purge')
+def purge_surrogate_keys(keys):
+    request = urllib.request.Request(
+        settings.SURROGATE_PURGE_URL, method='PURGE',
+        headers={settings.SURROGATE_PURGE_HEADER: ' '.join(keys)},
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        logger.info("Purged %s: HTTP %s", keys, response.status)
@@ -0,0 +1,320 @@
+import csv
+import io
+import json
+import os
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from PIL import Image
+
+from . import aggregates
+from .http_cache import purge_keys
+from .jobs import enqueue_many, job
+from .models import Category, Product, User
+from .moderation import release_media
+
+
+# Bulk catalog import. Records are streamed from JSON Lines or CSV (or a
+# small JSON seed file such as testing/products.json) and handled in
+# batches of IMPORT_BATCH_SIZE: each batch is validated, its images are
+# verified and stored by a thread pool, and its products are written with
+# one bulk_create in their own transaction. bulk_create skips the model
+# signals, so the batch refreshes the aggregates, the proxy purge and the
+# thumbnail queue itself. Images are stored before the transaction; if it
+# rolls back, the new ones are passed to release_media().
+#
+# With a checkpoint file the number of records already committed is saved
+# after every batch, and a later run with the same file skips them. The
+# file is written just after the commit, so a crash in between replays at
+# most that one batch.
+
+FORMATS = {'.jsonl': 'jsonl', '.ndjson': 'jsonl', '.csv': 'csv', '.json': 'json'}
+MAX_REPORTED_ERRORS = 100
+
+
+def detect_format(name):
+    fmt = FORMATS.get(os.path.splitext(name)[1].lower())
+    if fmt is None:
+        raise ValueError(f"Can't tell the format of {name!r}; expected one of {', '.join(FORMATS)}.")
+    return fmt
+
+
+def read_records(stream, fmt):
+    """Yield (number, record) from the binary ``stream``, one record at a time.
+
+    JSON files are seed files and are loaded whole: either a list of
+    records or an object of them keyed by slug.
+    """
+    if fmt == 'json':
+        data = json.load(stream)
+        yield from enumerate(data.values() if isinstance(data, dict) else data, 1)
+        return
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        yield from enumerate(csv.DictReader(text), 1)
+        return
+    for number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            yield number, line  # reported as a row error by validation
+
+
+class ImageSource:
+    """The images named by import records, read from a directory or a zip archive."""
+
+    def __init__(self, location=None):
+        self.root = self.archive = None
+        if location is None:
+            return
+        if not isinstance(location, (str, os.PathLike)) or zipfile.is_zipfile(location):
+            self.archive = zipfile.ZipFile(location)
+        else:
+            self.root = os.path.realpath(location)
+
+    def read(self, name):
+        name = name.replace('\\', '/').lstrip('/')
+        if self.archive is not None:
+            try:
+                return self.archive.read(name)
+            except KeyError:
+                raise FileNotFoundError(name) from None
+        if self.root is None:
+            raise FileNotFoundError(name)
+        path = os.path.realpath(os.path.join(self.root, name))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise FileNotFoundError(name)
+        with open(path, 'rb') as file:
+            return file.read()
+
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def store_image(source, name):
+    """Verify the image ``name`` from ``source`` and save it under Product.image's upload_to."""
+    data = source.read(name)
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.verify()
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as exc:
+        raise ValidationError(f"{name} is not a valid image ({exc}).") from None
+    field = Product._meta.get_field('image')
+    return field.storage.save(field.generate_filename(None, os.path.basename(name)), ContentFile(data))
+
+
+def _load_checkpoint(path, fingerprint):
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path) as file:
+        saved = json.load(file)
+    if saved.get('source') != fingerprint:
+        raise ValueError(f"Checkpoint {path} belongs to a different input file.")
+    return saved['position']
+
+
+def _save_checkpoint(path, fingerprint, position, result):
+    if not path:
+        return
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as file:
+        json.dump({'source': fingerprint, 'position': position, 'created': result['created']}, file)
+    os.replace(tmp, path)
+
+
+class _Batch:
+    """Validates records against the catalog and turns them into products."""
+
+    def __init__(self, seller, create_categories, result):
+        self.seller = seller
+        self.create_categories = create_categories
+        self.result = result
+        self.categories = {name.lower(): pk for pk, name in Category.objects.values_list('pk', 'name')}
+        self.images = {}
+        self.fields = {name: Product._meta.get_field(name) for name in ('title', 'details', 'price')}
+
+    def error(self, number, message):
+        self.result['skipped'] += 1
+        if len(self.result['errors']) < MAX_REPORTED_ERRORS:
+            self.result['errors'].append((number, message))
+
+    def category(self, name):
+        name = (name or '').strip()
+        if not name:
+            raise ValidationError("This field cannot be blank.")
+        pk = self.categories.get(name.lower())
+        if pk is None:
+            if not self.create_categories:
+                raise ValidationError(f"Unknown category {name!r}.")
+            pk = self.categories[name.lower()] = Category.objects.get_or_create(name=name)[0].pk
+        return pk
+
+    def clean(self, number, record):
+        """Validated field values of ``record``, or None after recording why not."""
+        if not isinstance(record, dict):
+            self.error(number, "Expected an object with title, details, price, image and category.")
+            return None
+        values = {}
+        for name, field in self.fields.items():
+            value = record.get(name)
+            if isinstance(value, float):
+                value = Decimal(str(value))
+            try:
+                values[name] = field.clean(value.strip() if isinstance(value, str) else value, None)
+            except ValidationError as exc:
+                self.error(number, f"{name}: {' '.join(exc.messages)}")
+                return None
+        try:
+            values['category_id'] = self.category(record.get('category'))
+        except ValidationError as exc:
+            self.error(number, f"category: {' '.join(exc.messages)}")
+            return None
+        values['image'] = (record.get('image') or '').strip()
+        if not values['image']:
+            self.error(number, "image: This field cannot be blank.")
+            return None
+        return values
+
+    def store_images(self, rows, source, pool):
+        """Store each new image named by ``rows`` once; drop the rows whose image failed.
+
+        Returns the products and the storage names saved by this call.
+        """
+        names = list({values['image'] for _, values in rows} - set(self.images))
+        stored = []
+        for name, outcome in zip(names, pool.map(lambda name: _attempt(store_image, source, name), names)):
+            self.images[name] = outcome
+            if not isinstance(outcome, Exception):
+                stored.append(outcome)
+        kept = []
+        for number, values in rows:
+            outcome = self.images[values['image']]
+            if isinstance(outcome, FileNotFoundError):
+                self.error(number, f"image: {values['image']} not found.")
+            elif isinstance(outcome, ValidationError):
+                self.error(number, f"image: {' '.join(outcome.messages)}")
+            elif isinstance(outcome, Exception):
+                self.error(number, f"image: {outcome}")
+            else:
+                kept.append(Product(seller=self.seller, **{**values, 'image': outcome}))
+        return kept, stored
+
+
+def _attempt(func, *args):
+    try:
+        return func(*args)
+    except (OSError, ValidationError) as exc:
+        return exc
+
+
+def _after_batch(products, seller, queued_images):
+    """Do what the per-row signals would have done for ``products``."""
+    aggregates.products_added(products)
+    purge_keys(['catalog', f'seller-{seller.pk}', *{f'category-{p.category_id}' for p in products}])
+    # Derivatives are per file, so a shared image is thumbnailed once.
+    thumbnails = []
+    for product in products:
+        if product.image.name not in queued_images:
+            queued_images.add(product.image.name)
+            thumbnails.append({'model': 'api.product', 'pk': product.pk, 'field': 'image'})
+    enqueue_many('thumbnails.generate', thumbnails)
+
+
+def import_products(stream, fmt, seller, images=None, batch_size=None, workers=None,
+                    checkpoint=None, fingerprint=None, create_categories=False, progress=None):
+    """Import the records in the binary ``stream`` as products of ``seller``.
+
+    ``images`` is a directory, a zip file path or an open zip file;
+    ``progress`` is called with the running result after every batch.
+    Returns counts of the rows read, created and skipped, and the first
+    MAX_REPORTED_ERRORS (record number, message) pairs.
+    """
+    if seller.role != 'seller':
+        raise ValueError("Products can only be imported for a seller.")
+    started = time.perf_counter()
+    batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+    position = _load_checkpoint(checkpoint, fingerprint)
+    result = {'rows': 0, 'created': 0, 'skipped': 0, 'errors': [], 'resumed_from': position}
+    batch = _Batch(seller, create_categories, result)
+    queued_images = set()
+    records = read_records(stream, fmt)
+
+    with ImageSource(images) as source, ThreadPoolExecutor(workers or settings.IMPORT_IMAGE_WORKERS) as pool:
+        while True:
+            rows, last = [], position
+            for number, record in records:
+                if number <= position:
+                    continue
+                result['rows'] += 1
+                last = number
+                values = batch.clean(number, record)
+                if values is not None:
+                    rows.append((number, values))
+                    if len(rows) >= batch_size:
+                        break
+            if last == position:
+                break
+            products, stored = batch.store_images(rows, source, pool)
+            try:
+                with transaction.atomic():
+                    created = Product.objects.bulk_create(products)
+                    if created:
+                        _after_batch(created, seller, queued_images)
+            except BaseException:
+                # The images went to storage outside the transaction; those
+                # no committed row uses are removed again.
+                release_media(stored)
+                raise
+            result['created'] += len(created)
+            position = last
+            _save_checkpoint(checkpoint, fingerprint, position, result)
+            if progress:
+                progress(result)
+
+    result['errors'].sort()
+    result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return result
+
+
+def file_fingerprint(path):
+    stat = os.stat(path)
+    return f'{os.path.basename(path)}:{stat.st_size}:{int(stat.st_mtime)}'
+
+
+def upload_storage():
+    """Uploaded import files: kept out of MEDIA_ROOT, which is served publicly."""
+    return FileSystemStorage(location=settings.IMPORT_WORK_DIR)
+
+
+@job('catalog.import')
+def import_upload(seller_id, source, fmt, images=None):
+    """Import an uploaded file; a retried job resumes from its checkpoint."""
+    storage = upload_storage()
+    seller = User.objects.get(pk=seller_id)
+    path = storage.path(source)
+    with open(path, 'rb') as stream:
+        result = import_products(
+            stream, fmt, seller,
+            images=storage.path(images) if images else None,
+            checkpoint=f'{path}.checkpoint', fingerprint=file_fingerprint(path),
+        )
+    for name in (source, f'{source}.checkpoint', images):
+        if name and storage.exists(name):
+            storage.delete(name)
+    return result
@@ -0,0 +1,175 @@
+import logging
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+from .metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+# Per-request timings for /metrics/. RequestMetricsMiddleware opens a
+# RequestStats for each request; the SQL wrapper every connection gets on
+# creation and the template backend below add to it through a ContextVar,
+# which sync_to_async carries into the ORM's thread for async views.
+#
+# A request picked for tracing (INSTRUMENTATION_TRACE_SAMPLE_RATE) also
+# keeps its SQL text, and is logged with its slowest statements if it takes
+# longer than INSTRUMENTATION_SLOW_SECONDS. Other requests only pay for a
+# few perf_counter() calls.
+
+# Any other method is labelled 'other', for the same reason as 'unresolved'.
+HTTP_METHODS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS', 'TRACE', 'CONNECT'})
+
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+BYTE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+REQUEST_LATENCY = Histogram(
+    'nokshibox_request_seconds', 'Time to produce a response, by view.',
+    labelnames=('view', 'method', 'status'),
+)
+REQUEST_QUERIES = Histogram(
+    'nokshibox_request_sql_queries', 'SQL statements run per request.',
+    labelnames=('view',), buckets=COUNT_BUCKETS,
+)
+REQUEST_SQL_TIME = Histogram(
+    'nokshibox_request_sql_seconds', 'Time spent in SQL per request.', labelnames=('view',),
+)
+REQUEST_TEMPLATE_TIME = Histogram(
+    'nokshibox_request_template_seconds', 'Time spent rendering templates per request.', labelnames=('view',),
+)
+RESPONSE_SIZE = Histogram(
+    'nokshibox_response_bytes', 'Response body size.', labelnames=('view',), buckets=BYTE_BUCKETS,
+)
+
+_current = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'sql_time', 'template_time', 'rendering', 'statements')
+
+    def __init__(self, traced):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.rendering = False
+        self.statements = [] if traced else None
+
+
+def record_sql(execute, sql, params, many, context):
+    """execute_wrapper installed on every connection; see install_sql_wrapper."""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        stats.queries += 1
+        stats.sql_time += elapsed
+        if stats.statements is not None:
+            stats.statements.append((elapsed, sql))
+
+
+def install_sql_wrapper(sender, connection, **kwargs):
+    if record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_sql)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        # Only the outermost render is timed; includes are part of it.
+        if stats is None or stats.rendering:
+            return super().render(context, request)
+        stats.rendering = True
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - started
+            stats.rendering = False
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with render time counted towards the request."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def _response_size(response):
+    if response.streaming:
+        return int(response.get('Content-Length') or 0)
+    return len(response.content)
+
+
+class RequestMetricsMiddleware:
+    """Record latency, SQL, template time and response size per view."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def start(self):
+        stats = RequestStats(traced=random.random() < settings.INSTRUMENTATION_TRACE_SAMPLE_RATE)
+        return stats, _current.set(stats), time.perf_counter()
+
+    def finish(self, request, response, stats, token, started):
+        elapsed = time.perf_counter() - started
+        _current.reset(token)
+        match = request.resolver_match
+        # Unmatched URLs share one label so scanners can't grow the series.
+        view = match.view_name if match else 'unresolved'
+        method = request.method if request.method in HTTP_METHODS else 'other'
+        status = f'{response.status_code // 100}xx' if response is not None else '5xx'
+        REQUEST_LATENCY.observe(elapsed, view=view, method=method, status=status)
+        REQUEST_QUERIES.observe(stats.queries, view=view)
+        REQUEST_SQL_TIME.observe(stats.sql_time, view=view)
+        REQUEST_TEMPLATE_TIME.observe(stats.template_time, view=view)
+        if response is not None:
+            RESPONSE_SIZE.observe(_response_size(response), view=view)
+        if stats.statements is not None and elapsed >= settings.INSTRUMENTATION_SLOW_SECONDS:
+            slowest = sorted(stats.statements, key=lambda s: s[0], reverse=True)[:settings.INSTRUMENTATION_TRACE_QUERIES]
+            logger.warning(
+                "Slow request %s %s (%s): %.0f ms, %d queries in %.0f ms, templates %.0f ms\n%s",
+                request.method, request.get_full_path(), view, elapsed * 1000, stats.queries,
+                stats.sql_time * 1000, stats.template_time * 1000,
+                '\n'.join(f'  {duration * 1000:8.1f} ms  {sql}' for duration, sql in slowest),
+            )
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats, token, started = self.start()
+        response = None
+        try:
+            response = self.get_response(request)
+        finally:
+            self.finish(request, response, stats, token, started)
+        return response
+
+    async def __acall__(self, request):
+        stats, token, started = self.start()
+        response = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.finish(request, response, stats, token, started)
+        return response
@@ -0,0 +1,168 @@
+import logging
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+
+def job(name):
+    """Register the decorated function as the handler for jobs called ``name``."""
+    def decorator(func):
+        _handlers[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, **payload):
+    """Queue ``name`` to run in a worker with ``payload`` as keyword arguments.
+
+    The row is written in the caller's transaction, so a job never runs
+    for data that was rolled back. With JOBS_EAGER the handler runs inline.
+    """
+    if name not in _handlers:
+        raise ValueError(f"Unknown job {name!r}")
+    if settings.JOBS_EAGER:
+        _handlers[name](**payload)
+        return None
+    return Job.objects.create(name=name, payload=payload, max_attempts=settings.JOBS_MAX_ATTEMPTS)
+
+
+def enqueue_later(name, delay, **payload):
+    """Queue ``name`` to run ``delay`` seconds from now at the earliest.
+
+    Queued even with JOBS_EAGER: running it inline would ignore the delay.
+    """
+    if name not in _handlers:
+        raise ValueError(f"Unknown job {name!r}")
+    return Job.objects.create(name=name, payload=payload, max_attempts=settings.JOBS_MAX_ATTEMPTS,
+                              run_after=timezone.now() + timedelta(seconds=delay))
+
+
+def enqueue_many(name, payloads):
+    """Queue one ``name`` job per payload with a single INSERT per batch."""
+    if name not in _handlers:
+        raise ValueError(f"Unknown job {name!r}")
+    if settings.JOBS_EAGER:
+        for payload in payloads:
+            _handlers[name](**payload)
+        return []
+    return Job.objects.bulk_create(
+        [Job(name=name, payload=payload, max_attempts=settings.JOBS_MAX_ATTEMPTS) for payload in payloads],
+        batch_size=500,
+    )
+
+
+class _Batch:
+    def __init__(self, name, field):
+        self.name = name
+        self.field = field
+        self.values = set()
+
+    def flush(self):
+        if self.values:
+            values, self.values = sorted(self.values), set()
+            enqueue(self.name, **{self.field: values})
+
+
+def enqueue_batched(name, field, values):
+    """Queue ``name`` with ``field`` set to ``values``, merged per transaction.
+
+    Inside a transaction, every call until it commits feeds one job, queued
+    on commit by whichever of their on_commit callbacks runs first (the rest
+    find nothing left). Values from a rolled-back call may ride along with
+    the next job, so the handler must treat them as hints.
+    """
+    values = set(values)
+    if not values:
+        return
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        enqueue(name, **{field: sorted(values)})
+        return
+    batches = connection.__dict__.setdefault('job_batches', {})
+    batch = batches.get(name)
+    if batch is None:
+        batch = batches[name] = _Batch(name, field)
+    batch.values.update(values)
+    transaction.on_commit(batch.flush)
+
+
+def claim(worker_id):
+    """Atomically take the next runnable job, or return None."""
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT)
+    runnable = Q(status='queued', run_after__lte=now) | Q(status='running', locked_at__lt=stale)
+    for job_id in Job.objects.filter(runnable).order_by('run_after', 'id').values_list('id', flat=True)[:10]:
+        # Conditional UPDATE: whichever worker flips the row first owns it.
+        taken = Job.objects.filter(runnable, pk=job_id).update(
+            status='running', locked_by=worker_id, locked_at=now, updated_at=now,
+        )
+        if taken:
+            return Job.objects.get(pk=job_id)
+    return None
+
+
+def run(job):
+    handler = _handlers.get(job.name)
+    job.attempts += 1
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for job {job.name!r}")
+        handler(**job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = 'failed'
+            logger.error("Job %s failed permanently:\n%s", job, job.last_error)
+        else:
+            job.status = 'queued'
+            job.run_after = timezone.now() + timedelta(seconds=2 ** job.attempts)
+            logger.warning("Job %s failed, retrying at %s", job, job.run_after)
+    else:
+        job.status = 'done'
+        job.last_error = ''
+    job.locked_by = ''
+    job.locked_at = None
+    job.save(update_fields=['status', 'attempts', 'run_after', 'last_error', 'locked_by', 'locked_at', 'updated_at'])
+    return job
+
+
+def run_pending(worker_id='inline'):
+    """Run every job that is currently runnable; return how many ran."""
+    ran = 0
+    while (queued := claim(worker_id)) is not None:
+        run(queued)
+        ran += 1
+    return ran
+
+
+def prune():
+    """Delete finished jobs older than JOBS_KEEP_DONE seconds."""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOBS_KEEP_DONE)
+    return Job.objects.filter(status='done', updated_at__lt=cutoff).delete()[0]
+
+
+def work(worker_id=None, burst=False, poll_interval=None):
+    """Worker loop. With ``burst`` it exits once the queue is empty."""
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    poll_interval = poll_interval or settings.JOBS_POLL_INTERVAL
+    logger.info("Worker %s started", worker_id)
+    while True:
+        close_old_connections()
+        if run_pending(worker_id) == 0:
+            if burst:
+                return
+            prune()
+            time.sleep(poll_interval)
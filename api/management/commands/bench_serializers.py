@@ -0,0 +1,49 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import Category, Product, User
+from api.serializers import ProductSerializer
+
+
+class Command(BaseCommand):
+    help = "Measure ProductSerializer throughput (products/second)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000, help="Fixture size.")
+        parser.add_argument('--page-size', type=int, default=50, help="Rows serialized per call, like one API page.")
+        parser.add_argument('--from-db', action='store_true', help="Serialize rows from the database instead of an in-memory fixture.")
+
+    def in_memory_fixture(self, count):
+        now = timezone.now()
+        categories = [Category(pk=i, name=f'Category {i}', description='') for i in range(1, 51)]
+        sellers = [User(pk=i, full_name=f'Seller {i}', email=f'seller{i}@example.com', role='seller') for i in range(1, 1001)]
+        return [
+            Product(
+                pk=i, title=f'Product {i}', details='Handmade ' * 20, price=Decimal('19.99'),
+                image=f'media/product_images/product_{i}.jpg',
+                category=categories[i % len(categories)], seller=sellers[i % len(sellers)],
+                created_at=now - timedelta(seconds=i), updated_at=now,
+            )
+            for i in range(1, count + 1)
+        ]
+
+    def handle(self, *args, **options):
+        if options['from_db']:
+            products = list(Product.objects.select_related('category', 'seller')[:options['products']])
+        else:
+            products = self.in_memory_fixture(options['products'])
+        size = options['page_size']
+
+        started = time.perf_counter()
+        for offset in range(0, len(products), size):
+            ProductSerializer(products[offset:offset + size], many=True).data
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f"{len(products)} products in {elapsed:.2f}s: "
+            f"{len(products) / elapsed:,.0f} products/s, {elapsed / max(len(products) // size, 1) * 1000:.2f} ms per {size}-row page"
+        )
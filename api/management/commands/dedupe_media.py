@@ -0,0 +1,115 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.backends import forget_cached_users
+from api.http_cache import purge_keys
+from api.models import Product, User
+from api.moderation import remove_unreferenced_media
+from api.storage import REUSED_SUFFIX, is_content_name, media_storage
+from api.thumbnails import available_formats, derivative_name
+
+
+class Command(BaseCommand):
+    help = "Move product images and user photos uploaded before content addressing to shared blobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only report how many files would merge and the space it would free.")
+        parser.add_argument('--prune', action='store_true',
+                            help="Also delete files under the upload directories that no row references. "
+                                 "Run it while nothing is uploading.")
+
+    def handle(self, *args, **options):
+        storage = media_storage()
+        # Listed before any blob is written, as those are unreferenced until the rows move.
+        orphans = self.orphans(storage) if options['prune'] else []
+        renamed = {}
+        missing = []
+        for model, field in storage.fields():
+            names = (model._default_manager.exclude(**{field.name: ''}).exclude(**{f'{field.name}__isnull': True})
+                     .order_by().values_list(field.name, flat=True).distinct())
+            for name in names:
+                if is_content_name(name) or name in renamed:
+                    continue
+                if not storage.exists(name):
+                    missing.append(name)
+                    continue
+                with storage.open(name, 'rb') as content:
+                    renamed[name] = (storage.content_name(name, content) if options['dry_run']
+                                     else storage.save(name, content))
+
+        for name in missing:
+            self.stderr.write(f"missing on disk: {name}")
+        blobs = defaultdict(list)
+        for old, new in renamed.items():
+            blobs[new].append(old)
+        freed = sum(storage.size(old) for olds in blobs.values() for old in olds[1:])
+        if options['dry_run']:
+            self.stdout.write(f"{len(renamed)} files would become {len(blobs)} blobs, freeing {freed} bytes.")
+            if options['prune']:
+                size = sum(storage.size(name) for name in orphans)
+                self.stdout.write(f"{len(orphans)} unreferenced files would be deleted, freeing {size} bytes.")
+            return
+
+        for old, new in renamed.items():
+            self.move_derivatives(storage, old, new)
+        products, users = self.update_rows(renamed)
+        if users:
+            forget_cached_users(users)
+        if products:
+            purge_keys(['catalog'] + [f'product-{pk}' for pk in products])
+        freed += sum(storage.size(name) for name in orphans)
+        removed = remove_unreferenced_media(list(renamed) + orphans)
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {len(renamed)} files into {len(blobs)} blobs and removed {removed} files, "
+            f"freeing about {freed} bytes."
+        ))
+
+    def move_derivatives(self, storage, old, new):
+        # Derivatives are named after their source, so they follow it. Where the
+        # blob already has its own, the old copies go when the source is released.
+        for width in settings.THUMBNAIL_WIDTHS:
+            for fmt in available_formats():
+                source, target = derivative_name(old, width, fmt), derivative_name(new, width, fmt)
+                if storage.exists(source) and not storage.exists(target):
+                    with storage.open(source, 'rb') as content:
+                        storage.save_named(target, content)
+
+    def orphans(self, storage):
+        """Files under the fields' upload directories that no row names."""
+        names = []
+        for _, field in storage.fields():
+            names.extend(self.walk(storage, field.upload_to.rstrip('/')))
+        names = sorted(set(names))
+        referenced = set()
+        for start in range(0, len(names), 500):
+            referenced.update(storage.references(names[start:start + 500]))
+        return [name for name in names if name not in referenced]
+
+    def walk(self, storage, directory):
+        if not storage.exists(directory):
+            return
+        dirs, files = storage.listdir(directory)
+        for name in files:
+            if not name.endswith(REUSED_SUFFIX):  # goes with its blob
+                yield f'{directory}/{name}'
+        for name in dirs:
+            yield from self.walk(storage, f'{directory}/{name}')
+
+    def update_rows(self, renamed):
+        """Point every row at its blob; return the pks of the products and users changed."""
+        changed = {Product: [], User: []}
+        with transaction.atomic():
+            for model, field in media_storage().fields():
+                extra = {'updated_at': timezone.now()} if model is Product else {}
+                for old, new in renamed.items():
+                    rows = model._default_manager.filter(**{field.name: old})
+                    pks = list(rows.values_list('pk', flat=True))
+                    if pks:
+                        model._default_manager.filter(pk__in=pks).update(**{field.name: new}, **extra)
+                        changed.setdefault(model, []).extend(pks)
+        return changed[Product], changed[User]
@@ -0,0 +1,226 @@
+import itertools
+import multiprocessing
+import random
+import time
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+from io import BytesIO
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from PIL import Image, ImageDraw
+
+from api import aggregates
+from api.models import Category, Product, User
+from api.search import get_search_backend
+from api.thumbnails import generate_thumbnails
+
+# Generated accounts share this domain, so they are easy to spot and never
+# collide with real users. testing/benchmark.py logs in as the bench-*
+# accounts with BENCH_PASSWORD.
+DOMAIN = 'fixtures.nokshibox.test'
+BENCH_PASSWORD = 'bench-pass-123'
+WORDS = ('Aromatic', 'Lavender', 'Resin', 'Ocean', 'Handmade', 'Clay', 'Jute', 'Nakshi', 'Kantha', 'Brass',
+         'Bamboo', 'Terracotta', 'Indigo', 'Silk', 'Wooden', 'Painted', 'Woven', 'Carved', 'Vintage', 'Mini')
+NOUNS = ('Candle', 'Coaster', 'Vase', 'Basket', 'Lamp', 'Bowl', 'Tray', 'Scarf', 'Mirror', 'Frame',
+         'Necklace', 'Bangle', 'Cushion', 'Wall Hanging', 'Planter', 'Mug', 'Box', 'Bag', 'Doll', 'Clock')
+# The head of the category long tail; the rest are numbered.
+CATEGORY_NAMES = ('Candles', 'Resin Art', 'Pottery', 'Jute Crafts', 'Nakshi Kantha', 'Jewellery', 'Home Decor',
+                  'Wall Hangings', 'Woodwork', 'Bamboo Crafts', 'Terracotta', 'Textiles', 'Brass and Metal',
+                  'Paintings', 'Toys and Dolls', 'Bags', 'Lighting', 'Kitchenware', 'Gifts', 'Stationery')
+
+# Rows are built as tuples of database values and written with one
+# executemany per batch: the ORM's per-value preparation would otherwise
+# dominate at a million rows. Each chunk of CHUNK_SIZE rows draws from its
+# own seeded RNG, so the output does not depend on --workers.
+CHUNK_SIZE = 20000
+PRODUCT_COLUMNS = ('title', 'details', 'price', 'image', 'category_id', 'seller_id', 'created_at', 'updated_at')
+USER_COLUMNS = ('email', 'full_name', 'mobile_no', 'role', 'password', 'profile_completed')
+
+_spec = None
+
+
+def zipf_weights(n, exponent):
+    """Cumulative weights where rank r gets 1 / (r + 1) ** exponent."""
+    return list(itertools.accumulate(1 / (rank + 1) ** exponent for rank in range(n)))
+
+
+def _use(spec):
+    global _spec
+    _spec = spec
+
+
+def _init_worker(spec):
+    django.setup()  # a no-op under fork; spawned workers need it
+    _use(spec)
+
+
+def user_rows(role, count, bench, password, chunk):
+    rows = []
+    for i in range(chunk * CHUNK_SIZE, min(count, (chunk + 1) * CHUNK_SIZE)):
+        email = f'bench-{role}-{i}@{DOMAIN}' if i < bench else f'{role}-{i}@{DOMAIN}'
+        rows.append((email, f'Fixture {role.title()} {i}', f'017{i:08d}', role, password, True))
+    return rows
+
+
+def product_rows(chunk):
+    spec = _spec
+    rng = random.Random(f"{spec['seed']}:products:{chunk}")
+    start, span, total = spec['start'], spec['span'], spec['products']
+    first, last = chunk * CHUNK_SIZE, min(total, (chunk + 1) * CHUNK_SIZE)
+    sellers = rng.choices(spec['sellers'], cum_weights=spec['seller_weights'], k=last - first)
+    categories = rng.choices(spec['categories'], cum_weights=spec['category_weights'], k=last - first)
+    rows = []
+    for n, seller, category in zip(range(first, last), sellers, categories):
+        # Listings arrive steadily over the period, oldest first.
+        created = str(start + span * ((n + rng.random()) / total))
+        price = min(99999.0, max(1.0, rng.lognormvariate(3.2, 0.9)))
+        rows.append((
+            f'{rng.choice(WORDS)} {rng.choice(NOUNS)} {n}',
+            ' '.join(rng.choices(WORDS, k=12)).capitalize() + '.',
+            f'{price:.2f}',
+            rng.choice(spec['images']),
+            category, seller, created, created,
+        ))
+    return rows
+
+
+def insert_rows(model, columns, rows):
+    """INSERT ``rows`` of database values for the ``columns`` fields of ``model``.
+
+    Every other concrete field gets its default, prepared once.
+    """
+    opts = model._meta
+    given = set(columns)
+    rest = [f for f in opts.concrete_fields if not f.primary_key and f.attname not in given]
+    defaults = tuple(f.get_db_prep_save(f.get_default(), connection) for f in rest)
+    names = [opts.get_field(name).column for name in columns] + [f.column for f in rest]
+    quote = connection.ops.quote_name
+    sql = (f"INSERT INTO {quote(opts.db_table)} ({', '.join(quote(name) for name in names)}) "
+           f"VALUES ({', '.join(['%s'] * len(names))})")
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(sql, [row + defaults for row in rows])
+
+
+class Command(BaseCommand):
+    help = "Fill an empty database with a deterministic synthetic catalog for benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--sellers', type=int, help="Default: one per 100 products.")
+        parser.add_argument('--buyers', type=int, help="Default: one per 20 products.")
+        parser.add_argument('--categories', type=int, help="Default: one per 5,000 products, at least 20.")
+        parser.add_argument('--seller-skew', type=float, default=1.0,
+                            help="Zipf exponent of products per seller; higher means fewer power sellers own more.")
+        parser.add_argument('--category-skew', type=float, default=1.2,
+                            help="Zipf exponent of products per category; higher means a longer tail.")
+        parser.add_argument('--days', type=int, default=365, help="Spread listing dates over this many days.")
+        parser.add_argument('--images', type=int, default=24, help="Distinct placeholder images to create.")
+        parser.add_argument('--bench-accounts', type=int, default=8,
+                            help="Sellers and buyers named bench-seller-N / bench-buyer-N for testing/benchmark.py.")
+        parser.add_argument('--seed', type=int, default=1, help="Same seed, same rows.")
+        parser.add_argument('--workers', type=int, default=0,
+                            help="Processes building rows while this one writes (default: build inline).")
+
+    def handle(self, *args, **options):
+        if User.objects.filter(email__endswith=f'@{DOMAIN}').exists():
+            raise CommandError("Fixtures were already generated here; start from an empty database.")
+        started = time.perf_counter()
+        products = options['products']
+        bench = options['bench_accounts']
+        # Hashing once keeps user creation fast; every account shares the hash.
+        password = make_password(BENCH_PASSWORD)
+
+        sellers = self.create_users('seller', options['sellers'] or max(1, products // 100), bench, password)
+        buyers = self.create_users('buyer', options['buyers'] or max(1, products // 20), bench, password)
+        categories = self.create_categories(options['categories'] or max(20, products // 5000))
+        images = self.create_images(options['images'], options['seed'])
+
+        # Bench sellers get a typical share rather than a power seller's, so
+        # their pages in the benchmark stay representative.
+        weights = [1 / (rank + 1) ** options['seller_skew'] for rank in range(len(sellers) - bench)]
+        typical = sorted(weights)[len(weights) // 2] if weights else 1.0
+        seller_weights = list(itertools.accumulate([typical] * bench + weights))
+        until = datetime.combine(datetime.now(dt_timezone.utc).date(), dt_time())
+        spec = {
+            'seed': options['seed'], 'products': products, 'images': images,
+            'sellers': sellers, 'seller_weights': seller_weights,
+            'categories': categories, 'category_weights': zipf_weights(len(categories), options['category_skew']),
+            'start': until - timedelta(days=options['days']), 'span': timedelta(days=options['days']),
+        }
+        chunks = range((products + CHUNK_SIZE - 1) // CHUNK_SIZE)
+        created = 0
+        with get_search_backend().bulk_load(), self.pool(options['workers'], spec) as pool:
+            for rows in pool(product_rows, chunks):
+                insert_rows(Product, PRODUCT_COLUMNS, rows)
+                created += len(rows)
+                self.stdout.write(f"{created}/{products} products")
+
+        aggregates.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {len(sellers)} sellers, {len(buyers)} buyers, {len(categories)} categories and "
+            f"{created} products in {time.perf_counter() - started:.1f}s."
+        ))
+
+    def pool(self, workers, spec):
+        """A context giving map(func, chunks): ordered, and parallel with ``workers``."""
+        if workers > 1:
+            return _Pool(workers, spec)
+        _use(spec)
+        return _Inline()
+
+    def create_users(self, role, count, bench, password):
+        count = max(count, bench)
+        for chunk in range((count + CHUNK_SIZE - 1) // CHUNK_SIZE):
+            insert_rows(User, USER_COLUMNS, user_rows(role, count, bench, password, chunk))
+        users = User.objects.filter(email__endswith=f'@{DOMAIN}', role=role)
+        return list(users.order_by('pk').values_list('pk', flat=True))
+
+    def create_categories(self, count):
+        names = list(CATEGORY_NAMES[:count]) + [f'Fixture Category {i + 1}' for i in range(count - len(CATEGORY_NAMES))]
+        Category.objects.bulk_create(
+            [Category(name=name, description='Generated for benchmarks') for name in names],
+            batch_size=1000, ignore_conflicts=True,
+        )
+        return list(Category.objects.filter(name__in=names).order_by('pk').values_list('pk', flat=True))
+
+    def create_images(self, count, seed):
+        """Store ``count`` small distinct JPEGs with their thumbnails; return their storage names."""
+        rng = random.Random(f'{seed}:images')
+        field = Product._meta.get_field('image')
+        names = []
+        for i in range(max(1, count)):
+            image = Image.new('RGB', (800, 600), tuple(rng.randrange(80, 230) for _ in range(3)))
+            draw = ImageDraw.Draw(image)
+            for _ in range(6):
+                x, y = rng.randrange(800), rng.randrange(600)
+                draw.ellipse((x - 90, y - 90, x + 90, y + 90), fill=tuple(rng.randrange(256) for _ in range(3)))
+            buffer = BytesIO()
+            image.save(buffer, format='JPEG', quality=80)
+            name = field.storage.save(field.generate_filename(None, f'placeholder-{i}.jpg'),
+                                      ContentFile(buffer.getvalue()))
+            generate_thumbnails(field.attr_class(None, field, name))
+            names.append(name)
+        return names
+
+
+class _Inline:
+    def __enter__(self):
+        return map
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class _Pool:
+    def __init__(self, workers, spec):
+        self.pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(spec,))
+
+    def __enter__(self):
+        return self.pool.imap
+
+    def __exit__(self, *exc_info):
+        self.pool.terminate()
+        self.pool.join()
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Product, User
+from api.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = "Generate missing or stale thumbnails for product images and user photos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Regenerate even fresh derivatives.")
+
+    def handle(self, *args, **options):
+        written = 0
+        for product in Product.objects.only('image').iterator():
+            written += len(generate_thumbnails(product.image, force=options['force']))
+        for user in User.objects.exclude(photo='').exclude(photo=None).only('photo').iterator():
+            written += len(generate_thumbnails(user.photo, force=options['force']))
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} derivatives."))
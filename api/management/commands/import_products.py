@@ -0,0 +1,54 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.importer import detect_format, file_fingerprint, import_products
+from api.models import User
+
+
+class Command(BaseCommand):
+    help = "Import products for a seller from a JSON Lines, CSV or JSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help="Input file, e.g. testing/products.json.")
+        parser.add_argument('--seller', required=True, help="Email of the seller who will own the products.")
+        parser.add_argument('--images', help="Directory or zip file holding the images the rows name "
+                                             "(default: the input file's directory).")
+        parser.add_argument('--format', choices=['jsonl', 'csv', 'json'], help="Override the format "
+                                                                                 "guessed from the file name.")
+        parser.add_argument('--batch-size', type=int, help="Rows per transaction (default IMPORT_BATCH_SIZE).")
+        parser.add_argument('--workers', type=int, help="Image threads (default IMPORT_IMAGE_WORKERS).")
+        parser.add_argument('--checkpoint', help="Save progress to this file after every batch and "
+                                                 "resume from it if it exists.")
+        parser.add_argument('--create-categories', action='store_true',
+                            help="Create categories the rows name instead of rejecting those rows.")
+
+    def handle(self, *args, **options):
+        source = options['source']
+        try:
+            seller = User.objects.get(email__iexact=options['seller'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user with email {options['seller']}.")
+
+        def progress(result):
+            self.stdout.write(f"{result['resumed_from'] + result['rows']} rows read, "
+                              f"{result['created']} created, {result['skipped']} skipped")
+
+        try:
+            with open(source, 'rb') as stream:
+                result = import_products(
+                    stream, options['format'] or detect_format(source), seller,
+                    images=options['images'] or os.path.dirname(os.path.abspath(source)),
+                    batch_size=options['batch_size'], workers=options['workers'],
+                    checkpoint=options['checkpoint'], fingerprint=file_fingerprint(source),
+                    create_categories=options['create_categories'], progress=progress,
+                )
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        for number, message in result['errors']:
+            self.stderr.write(f"record {number}: {message}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['created']} products, skipped {result['skipped']} "
+            f"in {result['elapsed_ms'] / 1000:.1f}s."
+        ))
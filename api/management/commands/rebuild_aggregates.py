@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import aggregates
+
+
+class Command(BaseCommand):
+    help = "Recompute the catalog aggregates table from Product, or check it with --verify."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help="Only compare the stored rows with Product; fail if any differ.")
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            rows = aggregates.rebuild()
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} aggregate rows."))
+            return
+
+        differences = aggregates.differences()
+        for scope, key, stored, expected in differences:
+            self.stdout.write(f"{scope} {key}: stored {stored}, expected {expected}")
+        if differences:
+            raise CommandError(f"{len(differences)} aggregate rows are out of date; run rebuild_aggregates.")
+        self.stdout.write(self.style.SUCCESS("Aggregates match the product table."))
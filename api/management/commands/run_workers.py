@@ -0,0 +1,40 @@
+import multiprocessing
+import os
+import socket
+
+from django.core.management.base import BaseCommand
+
+
+def _worker_main(index, burst):
+    # Spawned children start from a clean interpreter and must set Django up.
+    import django
+    django.setup()
+
+    from api.jobs import work
+    work(f"{socket.gethostname()}:{os.getpid()}:{index}", burst=burst)
+
+
+class Command(BaseCommand):
+    help = "Run background job workers (thumbnails and other upload post-processing)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--workers', type=int, default=2, help="Number of worker processes.")
+        parser.add_argument('--burst', action='store_true', help="Exit once the queue is empty.")
+
+    def handle(self, *args, **options):
+        ctx = multiprocessing.get_context('spawn')
+        processes = [
+            ctx.Process(target=_worker_main, args=(i, options['burst']), daemon=True)
+            for i in range(options['workers'])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f"Started {len(processes)} workers.")
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
@@ -0,0 +1,213 @@
+import functools
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, SuspiciousFileOperation
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotAllowed
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+
+from .storage import CONTENT_NAME, REUSED_SUFFIX, media_storage
+from .thumbnails import FORMAT_MIME_TYPES
+
+
+# Production serving of MEDIA_URL. Django only decides whether a file may be
+# served and with which headers; MEDIA_SERVE_MODE picks who sends the bytes:
+#
+#   'django'            FileResponse. The WSGI server's wsgi.file_wrapper
+#                       (gunicorn, uWSGI) sends whole files with os.sendfile;
+#                       Range requests are answered here, read in blocks.
+#                       WSGI only: ASGI has no file_wrapper and would stream
+#                       every file through a sync iterator, so it is refused
+#                       there and nokshibox/asgi.py defaults to the next one.
+#   'x-sendfile'        An empty response carrying X-Sendfile with the file's
+#                       path, for Apache mod_xsendfile or lighttpd.
+#   'x-accel-redirect'  X-Accel-Redirect to MEDIA_ACCEL_REDIRECT_PREFIX plus
+#                       the name, for an nginx 'internal' location aliasing
+#                       MEDIA_ROOT.
+#   'off'               No route: the front-end serves MEDIA_URL itself.
+#
+# The front-end answers Range requests itself in the last two modes.
+# Content-addressed blobs (api/storage.py) never change under their name, so
+# their hash is the ETag and they are cached for a year as immutable.
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+@functools.cache
+def servable_prefixes():
+    """Directories of MEDIA_ROOT served to anyone: the upload_to of each media field and their thumbnails.
+
+    Fixed once the models are loaded, so worked out on the first request.
+    """
+    prefixes = []
+    for _, field in media_storage().fields():
+        directory = field.upload_to.rstrip('/') + '/'
+        prefixes += [directory, f'thumbs/{directory}']
+    return tuple(prefixes)
+
+
+def _resolve(name):
+    """Absolute path and stat of the media file ``name``; Http404 unless it may be served."""
+    name = posixpath.normpath(name).lstrip('/')
+    if (not name.startswith(servable_prefixes()) or name.endswith(REUSED_SUFFIX)
+            or any(part.startswith('.') for part in name.split('/'))):
+        raise Http404("Not a media file")
+    try:
+        path = safe_join(settings.MEDIA_ROOT, name)
+        info = os.stat(path)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        raise Http404("No such media file")
+    if not stat.S_ISREG(info.st_mode):
+        raise Http404("No such media file")
+    return name, path, info
+
+
+def _blob_hash(name):
+    """The SHA-256 a content-addressed blob is named after; None for thumbnails, which may be regenerated."""
+    if name.startswith('thumbs/') or not CONTENT_NAME.search(name):
+        return None
+    return posixpath.splitext(posixpath.basename(name))[0]
+
+
+def _etag(name, info):
+    digest = _blob_hash(name)
+    if digest:
+        return f'"{digest}"'
+    return '"%x-%x"' % (int(info.st_mtime), info.st_size)
+
+
+def _content_type(name):
+    extension = posixpath.splitext(name)[1].lstrip('.').lower()
+    return FORMAT_MIME_TYPES.get(extension) or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+
+def parse_range(header, size):
+    """``(start, end)`` inclusive for a single-range ``Range`` header; None to send the whole file.
+
+    Raises ValueError when the range starts beyond the end of the file.
+    Multiple ranges are answered with the whole file, as RFC 9110 allows.
+    """
+    match = RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if size == 0:
+        raise ValueError(header)
+    if not first:
+        # bytes=-N: the last N bytes.
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        raise ValueError(header)
+    if end < start:
+        return None
+    return start, end
+
+
+def _range_applies(request, etag, modified):
+    """If-Range: a range is only served if the client's copy is still current."""
+    condition = request.headers.get('If-Range')
+    if not condition:
+        return True
+    if condition.startswith('"'):
+        return condition == etag
+    since = parse_http_date_safe(condition)
+    return since is not None and int(modified) <= since
+
+
+class FileRange:
+    """Reads at most ``length`` bytes of ``file`` from ``start``.
+
+    It has no fileno(), so a wsgi.file_wrapper reads it in blocks rather than
+    sending the rest of the file with os.sendfile.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def serve_media(request, path):
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    name, full_path, info = _resolve(path)
+    etag = _etag(name, info)
+    response = get_conditional_response(request, etag=etag, last_modified=int(info.st_mtime))
+    if response is None:
+        response = _file_response(request, name, full_path, info, etag)
+    if response.status_code == 416:
+        return response
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(info.st_mtime)
+    if _blob_hash(name):
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=settings.MEDIA_MAX_AGE)
+    return response
+
+
+def _file_response(request, name, full_path, info, etag):
+    content_type = _content_type(name)
+    mode = settings.MEDIA_SERVE_MODE
+    if mode == 'django' and isinstance(request, ASGIRequest):
+        raise ImproperlyConfigured(
+            "MEDIA_SERVE_MODE='django' needs a WSGI server; under ASGI use "
+            "'x-accel-redirect' or 'x-sendfile' behind a front-end, or 'off'."
+        )
+    if mode == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = full_path
+        return response
+    if mode == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + quote(name)
+        return response
+
+    size = info.st_size
+    try:
+        byte_range = parse_range(request.headers.get('Range', ''), size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if byte_range and not _range_applies(request, etag, info.st_mtime):
+        byte_range = None
+
+    start, end = byte_range or (0, size - 1)
+    length = end - start + 1 if size else 0
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+    elif byte_range:
+        response = FileResponse(FileRange(open(full_path, 'rb'), start, length), content_type=content_type)
+    else:
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+    if byte_range:
+        response.status_code = 206
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = str(length)
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.4 on 2026-10-17 02:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+
+
+def populate(apps, schema_editor):
+    # Same values as api.aggregates.rebuild(), using the historical models.
+    Product = apps.get_model('api', 'Product')
+    CatalogAggregate = apps.get_model('api', 'CatalogAggregate')
+    stats = {'product_count': Count('id'), 'min_price': Min('price'), 'max_price': Max('price'),
+             'latest_created_at': Max('created_at')}
+    rows = [('all', 0, Product.objects.all(), Product.objects.aggregate(**stats))]
+    for scope, field in (('category', 'category_id'), ('seller', 'seller_id')):
+        for row in Product.objects.values(field).annotate(**stats).order_by():
+            key = row.pop(field)
+            rows.append((scope, key, Product.objects.filter(**{field: key}), row))
+    CatalogAggregate.objects.bulk_create([
+        CatalogAggregate(
+            scope=scope, key=key, **values,
+            latest_product_id=products.order_by('-created_at', '-id').values_list('pk', flat=True).first(),
+        )
+        for scope, key, products, values in rows
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_updated_at_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('all', 'All products'), ('category', 'Category'), ('seller', 'Seller')], max_length=10)),
+                ('key', models.PositiveBigIntegerField(default=0)),
+                ('product_count', models.PositiveIntegerField(default=0)),
+                ('min_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('max_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('latest_created_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('latest_product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('scope', 'key'), name='catalog_aggregate_scope_key')],
+            },
+        ),
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
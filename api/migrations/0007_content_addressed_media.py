@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-17 02:45
+
+import api.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_catalog_aggregate'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=models.ImageField(storage=api.storage.media_storage, upload_to='media/product_images/'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='photo',
+            field=models.ImageField(blank=True, null=True, storage=api.storage.media_storage, upload_to='user_photos/'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['image'], name='product_image_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['photo'], name='user_photo_idx'),
+        ),
+    ]
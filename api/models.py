@@ -1,8 +1,26 @@
 from django.db import models
+from django.db.models.functions import Lower
+from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 
+from .storage import media_storage
+
+class UserQuerySet(models.QuerySet):
+    def email_prefix(self, prefix):
+        """Case-insensitive email prefix match served by user_email_lower_idx.
+
+        Expressed as a range on LOWER(email) rather than LIKE so the
+        database can seek the index instead of scanning every user.
+        """
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return self
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return self.alias(email_lower=Lower('email')).filter(email_lower__gte=prefix, email_lower__lt=upper)
+
+
 # Custom user manager
-class UserManager(BaseUserManager):
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
     def create_user(self, email, full_name, mobile_no, role, password=None, **extra_fields):
         if not email:
             raise ValueError('Email must be set')
@@ -32,7 +50,7 @@ class User(AbstractBaseUser, PermissionsMixin):
     role = models.CharField(max_length=10, choices=ROLE_CHOICES)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
-    photo = models.ImageField(upload_to='user_photos/', blank=True, null=True)
+    photo = models.ImageField(upload_to='user_photos/', storage=media_storage, blank=True, null=True)
     facebook_link = models.URLField(blank=True, null=True)
 
     profile_completed = models.BooleanField(default=False)
@@ -65,6 +83,14 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['full_name', 'mobile_no']
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['role'], name='user_role_idx'),
+            models.Index(Lower('email'), name='user_email_lower_idx'),
+            # Blobs are shared, so releasing one looks up who else uses it.
+            models.Index(fields=['photo'], name='user_photo_idx'),
+        ]
+
     def __str__(self):
         return f"{self.full_name} ({self.role})"
 
@@ -75,6 +101,10 @@ class Category(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # MAX(updated_at) is the Last-Modified of the catalog pages.
+        indexes = [models.Index(fields=['updated_at'], name='category_updated_idx')]
+
     def __str__(self):
         return self.name
 
@@ -83,11 +113,79 @@ class Product(models.Model):
     title = models.CharField(max_length=255)
     details = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
-    image = models.ImageField(upload_to='media/product_images/')
+    image = models.ImageField(upload_to='media/product_images/', storage=media_storage)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
     seller = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'role': 'seller'})
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Every listing is newest-first: the catalog (optionally per category),
+        # a seller's own products and the admin product list.
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='product_recent_idx'),
+            models.Index(fields=['seller', '-created_at'], name='product_seller_recent_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='product_category_recent_idx'),
+            # MAX(updated_at) is the Last-Modified of the catalog pages.
+            models.Index(fields=['updated_at'], name='product_updated_idx'),
+            # Blobs are shared, so releasing one looks up who else uses it.
+            models.Index(fields=['image'], name='product_image_idx'),
+            # Price range of the catalog, a category or a seller (api/aggregates.py).
+            models.Index(fields=['price'], name='product_price_idx'),
+            models.Index(fields=['category', 'price'], name='product_category_price_idx'),
+            models.Index(fields=['seller', 'price'], name='product_seller_price_idx'),
+        ]
+
+    def __str__(self):
+        return self.title
+
+# Denormalized product statistics for the whole catalog, each category and
+# each seller, kept current by signals (see api/aggregates.py)
+class CatalogAggregate(models.Model):
+    SCOPE_CHOICES = [
+        ('all', 'All products'),
+        ('category', 'Category'),
+        ('seller', 'Seller'),
+    ]
+
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES)
+    key = models.PositiveBigIntegerField(default=0)  # category or seller id; 0 for 'all'
+    product_count = models.PositiveIntegerField(default=0)
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    latest_product = models.ForeignKey(Product, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    latest_created_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['scope', 'key'], name='catalog_aggregate_scope_key')]
+
+    def __str__(self):
+        return f"{self.scope} {self.key}: {self.product_count} products"
+
+# Background job queued for the worker processes (see api/jobs.py)
+class Job(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx')]
+
     def __str__(self):
-        return self.title
\ No newline at end of file
+        return f"{self.name} #{self.pk} ({self.status})"
@@ -0,0 +1,126 @@
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from . import aggregates
+from .backends import forget_cached_users
+from .jobs import enqueue_batched, enqueue_later, job
+from .models import Category, Product, User
+from .storage import media_storage
+from .thumbnails import available_formats, derivative_name
+
+
+# Bulk moderation for the admin dashboard. Rows are deleted in pk batches
+# inside one transaction.
+#
+# Product images and user photos are content-addressed blobs that rows may
+# share (api/storage.py). Whenever a row stops using one, by a delete here or
+# anywhere else, or by an edit replacing it (api/signals.py), its name is
+# passed to release_media(). A transaction queues a single release job, run
+# once it has committed, which deletes the blobs that no row still references,
+# together with their thumbnails.
+
+BATCH_SIZE = 500
+
+
+def _batches(pks, size=BATCH_SIZE):
+    for start in range(0, len(pks), size):
+        yield pks[start:start + size]
+
+
+def _media_names(model, pks):
+    """Storage names of the images owned, directly or by cascade, by ``pks``."""
+    if model is Product:
+        products = Product.objects.filter(pk__in=pks)
+    elif model is Category:
+        products = Product.objects.filter(category__in=pks)
+    else:
+        products = Product.objects.filter(seller__in=pks)
+    names = set(products.values_list('image', flat=True))
+    if model is User:
+        names.update(User.objects.filter(pk__in=pks).values_list('photo', flat=True))
+    return {name for name in names if name}
+
+
+def release_media(names):
+    """Release the blobs ``names`` once the current transaction commits, if nothing uses them."""
+    enqueue_batched('media.remove_unreferenced', 'names', {name for name in names if name})
+
+
+@job('media.remove_unreferenced')
+def remove_unreferenced_media(names):
+    storage = media_storage()
+    deleted, recent = storage.release(names)
+    if recent:
+        # Possibly reused by a row not yet committed; look again later.
+        enqueue_later('media.remove_unreferenced', settings.MEDIA_RELEASE_GRACE, names=recent)
+    removed = 0
+    for name in deleted:
+        removed += 1
+        for width in settings.THUMBNAIL_WIDTHS:
+            for fmt in available_formats():
+                path = derivative_name(name, width, fmt)
+                if storage.exists(path):
+                    storage.delete(path)
+                    removed += 1
+    return removed
+
+
+def _check_expected(matched, expected):
+    # Raised inside the transaction, so nothing is changed.
+    if expected is not None and matched != expected:
+        raise ValueError(f"{matched} rows match now, not {expected}; reload and try again.")
+
+
+def bulk_delete(queryset, expected=None):
+    """Delete every row in ``queryset`` and the media files it leaves unreferenced.
+
+    With ``expected``, nothing is deleted unless exactly that many rows match.
+    """
+    started = time.perf_counter()
+    model = queryset.model
+    result = {'action': 'delete', 'model': model._meta.model_name, 'matched': 0, 'deleted': {}}
+
+    with transaction.atomic():
+        pks = list(queryset.values_list('pk', flat=True))
+        result['matched'] = len(pks)
+        _check_expected(len(pks), expected)
+        names = set()
+        for batch in _batches(pks):
+            names |= _media_names(model, batch)
+            with aggregates.deferred_removals():
+                _, per_model = model.objects.filter(pk__in=batch).delete()
+            for label, count in per_model.items():
+                result['deleted'][label] = result['deleted'].get(label, 0) + count
+
+        release_media(names)
+
+    result['media_files'] = len(names)
+    result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return result
+
+
+def bulk_deactivate(queryset, expected=None):
+    """Deactivate every user in ``queryset`` with one UPDATE per pk batch.
+
+    With ``expected``, nothing is changed unless exactly that many users match.
+    """
+    if queryset.model is not User:
+        raise ValueError("Only users can be deactivated")
+    started = time.perf_counter()
+    with transaction.atomic():
+        _check_expected(queryset.count(), expected)
+        pks = list(queryset.filter(is_active=True).values_list('pk', flat=True))
+        updated = 0
+        for batch in _batches(pks):
+            updated += User.objects.filter(pk__in=batch).update(is_active=False)
+    # update() sends no signals, so the cached session users are dropped here.
+    forget_cached_users(pks)
+    return {
+        'action': 'deactivate',
+        'model': 'user',
+        'matched': updated,
+        'deactivated': updated,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 2),
+    }
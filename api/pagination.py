@@ -0,0 +1,61 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+
+# Keyset (cursor) pagination on (created_at, id), newest first.
+# Pages cost the same no matter how deep the reader goes, unlike OFFSET.
+
+def _encode(created_at, pk):
+    raw = f"{created_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def encode_cursor(obj):
+    return _encode(obj.created_at, obj.pk)
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def normalize_cursor(cursor):
+    """The canonical spelling of ``cursor``; None if it does not decode."""
+    position = decode_cursor(cursor)
+    return _encode(*position) if position else None
+
+
+def _page_queryset(queryset, cursor, per_page):
+    queryset = queryset.order_by('-created_at', '-id')
+    position = decode_cursor(cursor)
+    if position:
+        created_at, pk = position
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    # One extra row tells whether there is a next page.
+    return queryset[:per_page + 1]
+
+
+def _split_page(items, per_page):
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        next_cursor = encode_cursor(items[-1])
+    return items, next_cursor
+
+
+def keyset_page(queryset, cursor=None, per_page=24):
+    """Return (items, next_cursor) for the page starting after ``cursor``."""
+    return _split_page(list(_page_queryset(queryset, cursor, per_page)), per_page)
+
+
+async def akeyset_page(queryset, cursor=None, per_page=24):
+    """Async version of keyset_page."""
+    return _split_page([obj async for obj in _page_queryset(queryset, cursor, per_page)], per_page)
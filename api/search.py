@@ -0,0 +1,185 @@
+import re
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections, router
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .models import Product
+
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class BaseSearchBackend(ABC):
+    """Product search backend. Subclasses implement search(); the index hooks are optional."""
+
+    def install(self, using=DEFAULT_DB_ALIAS):
+        """Create whatever index structures the backend needs (idempotent)."""
+
+    @contextmanager
+    def bulk_load(self, using=DEFAULT_DB_ALIAS):
+        """Wrap inserting a large number of products; the index may be rebuilt on exit."""
+        yield
+
+    def recover(self, using=DEFAULT_DB_ALIAS):
+        """Finish a bulk load that never returned, e.g. because its process was killed."""
+
+    @abstractmethod
+    def search(self, query, offset=0, limit=24):
+        """Ids of the products matching ``query``, best first, sliced by ``offset`` and ``limit``."""
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Portable fallback: substring match on title/details, newest first."""
+
+    def search(self, query, offset=0, limit=24):
+        products = Product.objects.all()
+        for token in TOKEN_RE.findall(query):
+            products = products.filter(Q(title__icontains=token) | Q(details__icontains=token))
+        return list(products.order_by('-created_at', '-id').values_list('id', flat=True)[offset:offset + limit])
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """SQLite FTS5 index over Product.title/details, ranked with bm25.
+
+    The index is an external-content table kept in sync by triggers, so
+    ORM saves, deletes, bulk_create and raw updates are all covered.
+    """
+
+    table = 'api_product_fts'
+    # Exists while a bulk load has the insert trigger dropped.
+    loading_table = 'api_product_fts_loading'
+    title_weight = 10.0
+    details_weight = 1.0
+
+    def install(self, using=DEFAULT_DB_ALIAS):
+        db = connections[using]
+        if db.vendor != 'sqlite' or Product._meta.db_table not in db.introspection.table_names():
+            return
+        with db.cursor() as cursor:
+            cursor.execute(
+                f"SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = '{self.table}'"
+            )
+            created = cursor.fetchone() is None
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+                f"title, details, content='api_product', content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 2')"
+            )
+            # Triggers are dropped whenever a migration rebuilds api_product,
+            # so they are (re)created on every post_migrate.
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {self.table}_ai AFTER INSERT ON api_product BEGIN "
+                f"INSERT INTO {self.table}(rowid, title, details) VALUES (new.id, new.title, new.details); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {self.table}_ad AFTER DELETE ON api_product BEGIN "
+                f"INSERT INTO {self.table}({self.table}, rowid, title, details) "
+                f"VALUES ('delete', old.id, old.title, old.details); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {self.table}_au AFTER UPDATE OF title, details ON api_product BEGIN "
+                f"INSERT INTO {self.table}({self.table}, rowid, title, details) "
+                f"VALUES ('delete', old.id, old.title, old.details); "
+                f"INSERT INTO {self.table}(rowid, title, details) VALUES (new.id, new.title, new.details); END"
+            )
+            interrupted = self._loading(cursor)
+            if created or interrupted:
+                self.rebuild(cursor)
+            if interrupted:
+                cursor.execute(f"DROP TABLE {self.loading_table}")
+
+    def _loading(self, cursor):
+        cursor.execute(f"SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = '{self.loading_table}'")
+        return cursor.fetchone() is not None
+
+    @contextmanager
+    def bulk_load(self, using=DEFAULT_DB_ALIAS):
+        # Rebuilding the index once is several times faster than feeding it
+        # a row at a time through the insert trigger. That is only done to a
+        # database being filled from scratch: on a live one, inserts made
+        # meanwhile by the site would go unindexed until the rebuild.
+        db = connections[using]
+        if db.vendor != 'sqlite' or Product.objects.using(using).exists():
+            yield
+            return
+        with db.cursor() as cursor:
+            # If this process dies before the rebuild, the table is left
+            # behind and install() or recover() restores the trigger.
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {self.loading_table} (id INTEGER)")
+            cursor.execute(f"DROP TRIGGER IF EXISTS {self.table}_ai")
+        try:
+            yield
+        finally:
+            self.install(using)
+
+    def recover(self, using=DEFAULT_DB_ALIAS):
+        db = connections[using]
+        if db.vendor != 'sqlite':
+            return
+        with db.cursor() as cursor:
+            interrupted = self._loading(cursor)
+        if interrupted:
+            self.install(using)
+
+    def rebuild(self, cursor=None):
+        if cursor is None:
+            with connection.cursor() as cursor:
+                return self.rebuild(cursor)
+        cursor.execute(f"INSERT INTO {self.table}({self.table}) VALUES ('rebuild')")
+
+    def match_expression(self, query):
+        # Quote every token so user input can never be parsed as FTS syntax,
+        # and prefix-match the tokens so partial words still find results.
+        return ' '.join(f'"{token}"*' for token in TOKEN_RE.findall(query))
+
+    def search(self, query, offset=0, limit=24):
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        # The index is replicated with the table, so read it where Product reads go.
+        with connections[router.db_for_read(Product)].cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s "
+                f"ORDER BY bm25({self.table}, %s, %s) LIMIT %s OFFSET %s",
+                [expression, self.title_weight, self.details_weight, limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+_backend = None
+
+
+def get_search_backend():
+    global _backend
+    if _backend is None:
+        _backend = import_string(settings.PRODUCT_SEARCH_BACKEND)()
+    return _backend
+
+
+def install_search_backend(sender=None, using=DEFAULT_DB_ALIAS, **kwargs):
+    get_search_backend().install(using)
+
+
+_recovered = set()
+
+
+def recover_search_backend(sender, connection, **kwargs):
+    """connection_created receiver: finish an interrupted bulk load on the first connection of each process.
+
+    Only the database Product is written to is checked; replicas get the
+    repaired index from it.
+    """
+    if connection.alias == router.db_for_write(Product) and connection.alias not in _recovered:
+        _recovered.add(connection.alias)
+        get_search_backend().recover(connection.alias)
+
+
+def search_products(query, offset=0, limit=24):
+    """Return the ranked Product objects for ``query``."""
+    ids = get_search_backend().search(query, offset, limit)
+    found = Product.objects.in_bulk(ids)
+    return [found[pk] for pk in ids if pk in found]
@@ -0,0 +1,43 @@
+from rest_framework import serializers
+
+from .models import Category, Product, User
+
+
+class SparseFieldsMixin:
+    """Serialize only the fields named in ``?fields=a,b`` when it is given."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        requested = request.query_params.get('fields') if request is not None else None
+        if requested:
+            keep = set(requested.split(','))
+            for name in set(self.fields) - keep:
+                self.fields.pop(name)
+
+
+class CategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = ['id', 'name', 'description', 'updated_at']
+
+
+class SellerSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # Public profile only: contact details stay on the HTML profile page.
+    class Meta:
+        model = User
+        fields = ['id', 'full_name', 'photo', 'facebook_link']
+
+
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # Flat related fields: nested serializers cost a serializer instance per row.
+    category_name = serializers.CharField(source='category.name', read_only=True)
+    seller_name = serializers.CharField(source='seller.full_name', read_only=True)
+
+    class Meta:
+        model = Product
+        fields = [
+            'id', 'title', 'details', 'price', 'image',
+            'category_id', 'category_name', 'seller_id', 'seller_name',
+            'created_at', 'updated_at',
+        ]
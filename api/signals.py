@@ -0,0 +1,127 @@
+from django.db.models.fields.files import FieldFile
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import aggregates
+from .backends import forget_cached_users
+from .fragments import forget_product_card
+from .http_cache import product_keys, purge_keys
+from .models import Category, Product, User
+from .moderation import release_media
+from .thumbnails import queue_thumbnails
+
+
+@receiver(post_save, sender=Product)
+def product_image_thumbnails(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'image' in update_fields:
+        queue_thumbnails(instance, 'image')
+
+
+@receiver(post_save, sender=User)
+def user_photo_thumbnails(sender, instance, update_fields=None, **kwargs):
+    # Logins save last_login only; don't queue work for those.
+    if update_fields is None or 'photo' in update_fields:
+        queue_thumbnails(instance, 'photo')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_session_user(sender, instance, **kwargs):
+    forget_cached_users([instance.pk])
+
+
+# Grids are keyed on the catalog state in the database (api/fragments.py)
+# and move on by themselves; a deleted product's card is dropped early.
+@receiver(post_delete, sender=Product)
+def forget_deleted_card(sender, instance, **kwargs):
+    forget_product_card(instance)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def purge_product_pages(sender, instance, **kwargs):
+    purge_keys(product_keys(instance))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def purge_category_pages(sender, instance, **kwargs):
+    purge_keys(['catalog', f'category-{instance.pk}'])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def purge_profile_page(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or set(update_fields) - {'last_login'}:
+        purge_keys([f'seller-{instance.pk}'])
+
+
+@receiver(post_init, sender=Product)
+def remember_aggregate_state(sender, instance, **kwargs):
+    # Read __dict__ directly: touching a deferred field would query.
+    values = instance.__dict__
+    instance._aggregate_state = (values.get('category_id'), values.get('seller_id'), values.get('price'))
+
+
+@receiver(post_save, sender=Product)
+def update_product_aggregates(sender, instance, created, **kwargs):
+    if created:
+        aggregates.product_added(instance)
+    elif None in instance._aggregate_state:
+        # Loaded with deferred fields: the previous values are unknown.
+        for scope, key in aggregates.keys_for(instance.category_id, instance.seller_id):
+            aggregates.recompute(scope, key)
+    elif instance._aggregate_state != (instance.category_id, instance.seller_id, instance.price):
+        aggregates.product_changed(instance, *instance._aggregate_state)
+    instance._aggregate_state = (instance.category_id, instance.seller_id, instance.price)
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_aggregates(sender, instance, **kwargs):
+    aggregates.product_removed(instance.pk, *instance._aggregate_state)
+
+
+@receiver(post_delete, sender=Category)
+def forget_category_aggregates(sender, instance, **kwargs):
+    aggregates.forget('category', instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def forget_seller_aggregates(sender, instance, **kwargs):
+    aggregates.forget('seller', instance.pk)
+
+
+MEDIA_FIELDS = {Product: 'image', User: 'photo'}
+
+
+def _stored_name(instance, field):
+    # From __dict__, as above: a name as loaded, a FieldFile once accessed,
+    # or an upload not yet saved, which names nothing in storage.
+    value = instance.__dict__.get(field)
+    if isinstance(value, FieldFile):
+        return value.name if value._committed else None
+    return value if isinstance(value, str) else None
+
+
+@receiver(post_init, sender=Product)
+@receiver(post_init, sender=User)
+def remember_media_name(sender, instance, **kwargs):
+    instance._media_name = _stored_name(instance, MEDIA_FIELDS[sender])
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=User)
+def release_replaced_media(sender, instance, update_fields=None, **kwargs):
+    field = MEDIA_FIELDS[sender]
+    if update_fields is not None and field not in update_fields:
+        return
+    name = _stored_name(instance, field)
+    if instance._media_name and instance._media_name != name:
+        release_media([instance._media_name])
+    instance._media_name = name
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=User)
+def release_deleted_media(sender, instance, **kwargs):
+    release_media([_stored_name(instance, MEDIA_FIELDS[sender]) or instance._media_name])
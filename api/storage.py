@@ -0,0 +1,154 @@
+import hashlib
+import os
+import posixpath
+import re
+import time
+from collections import Counter
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import models
+
+
+CONTENT_NAME = re.compile(r'(?:^|/)([0-9a-f]{2})/\1[0-9a-f]{62}(?:\.\w+)?$')
+
+# Beside a blob, stamped each time save() hands it out again.
+REUSED_SUFFIX = '.reused'
+
+
+def is_content_name(name):
+    """Whether ``name`` was given by ContentAddressedStorage rather than an older upload."""
+    return bool(CONTENT_NAME.search(name))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Store each distinct file once, named by the SHA-256 of its bytes.
+
+    Saving 'media/product_images/candle.jpg' writes
+    'media/product_images/3f/3f9a…c1.jpg'; saving the same bytes again, under
+    any name, writes nothing and returns that name. Rows share blobs, so a
+    blob may only be deleted through release(), which checks that no file
+    field using this storage still references it.
+
+    A reused name is returned before the row naming it commits, so a
+    release running meanwhile would see no reference. Reuse therefore
+    stamps a '.reused' marker beside the blob, and release() leaves blobs
+    written or reused within MEDIA_RELEASE_GRACE seconds for a later
+    attempt. The blob's own mtime is left alone, as derivatives are judged
+    fresh against it.
+    """
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        extension = posixpath.splitext(name)[1].lower()
+        return posixpath.join(posixpath.dirname(name), digest[:2], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            path = self.path(name)
+            # Stamped before checking the blob is still there: a release that
+            # moved it aside sees the stamp and puts it back, and one that
+            # deleted it leaves this save to write it again.
+            with open(path + REUSED_SUFFIX, 'a'):
+                pass
+            os.utime(path + REUSED_SUFFIX)
+            if os.path.exists(path):
+                return name
+        saved = super().save(name, content, max_length)
+        if saved != name:
+            # Another writer stored the same bytes first and this copy got
+            # a suffixed name; keep theirs.
+            self.delete(saved)
+        return name
+
+    def save_named(self, name, content, max_length=None):
+        """Save under ``name`` itself, e.g. a derivative whose name is derived from its source."""
+        return super().save(name, content, max_length)
+
+    def fields(self):
+        """(model, field) for every file field stored here."""
+        return [
+            (model, field)
+            for model in apps.get_models()
+            for field in model._meta.concrete_fields
+            if isinstance(field, models.FileField) and field.storage is self
+        ]
+
+    def references(self, names):
+        """{name: number of rows referencing it} for those of ``names`` still in use."""
+        counts = Counter()
+        for model, field in self.fields():
+            rows = model._default_manager.filter(**{f'{field.name}__in': names}).order_by()
+            for name, count in rows.values_list(field.name).annotate(count=models.Count('pk')):
+                counts[name] += count
+        return counts
+
+    def release(self, names):
+        """Delete the blobs in ``names`` that no row references.
+
+        Returns ``(deleted, recent)``: the names deleted, and those kept only
+        because they were written or reused within MEDIA_RELEASE_GRACE.
+        """
+        names = {name for name in names if name}
+        deleted, recent = [], []
+        for name in sorted(names - set(self.references(names))):
+            # Only hashed names are ever handed out again by save().
+            grace = settings.MEDIA_RELEASE_GRACE if is_content_name(name) else 0
+            outcome = self._release(name, time.time() - grace)
+            if outcome == 'deleted':
+                deleted.append(name)
+            elif outcome == 'recent':
+                recent.append(name)
+        return deleted, recent
+
+    def _release(self, name, cutoff):
+        path = self.path(name)
+        released = f'{path}.released'
+        try:
+            if os.stat(path).st_mtime > cutoff or self._reused_since(path, cutoff):
+                return 'recent'
+            # Moved aside first: a save() from here on misses it and writes a
+            # fresh copy, and one that found it just before has stamped it.
+            os.rename(path, released)
+        except FileNotFoundError:
+            return 'missing'
+        if self._reused_since(path, cutoff) or self.references([name]):
+            # Same bytes as any copy written since, so either may win.
+            os.replace(released, path)
+            return 'recent'
+        os.remove(released)
+        try:
+            os.remove(path + REUSED_SUFFIX)
+        except FileNotFoundError:
+            pass
+        return 'deleted'
+
+    def _reused_since(self, path, cutoff):
+        try:
+            return os.stat(path + REUSED_SUFFIX).st_mtime > cutoff
+        except FileNotFoundError:
+            return False
+
+
+_media_storage = None
+
+
+def media_storage():
+    """The storage of Product.image and User.photo.
+
+    A callable, so migrations record this function rather than the instance.
+    """
+    global _media_storage
+    if _media_storage is None:
+        _media_storage = ContentAddressedStorage()
+    return _media_storage
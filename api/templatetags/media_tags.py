@@ -0,0 +1,25 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from ..thumbnails import FORMAT_MIME_TYPES, available_formats, srcset
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(fieldfile, alt='', css_class='', sizes='100vw', fallback=''):
+    """<picture> with AVIF/WebP srcsets for ``fieldfile``, falling back to the original."""
+    if not fieldfile:
+        return format_html('<img src="{}" alt="{}" class="{}" loading="lazy">', fallback, alt, css_class)
+
+    sources = []
+    for fmt in available_formats():
+        candidates = srcset(fieldfile, fmt)
+        if candidates:
+            sources.append((FORMAT_MIME_TYPES[fmt], candidates, sizes))
+
+    return format_html(
+        '<picture>{}<img src="{}" alt="{}" class="{}" loading="lazy" decoding="async"></picture>',
+        format_html_join('', '<source type="{}" srcset="{}" sizes="{}">', sources),
+        fieldfile.url, alt, css_class,
+    )
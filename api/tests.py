@@ -1,3 +1,1364 @@
-from django.test import TestCase
+import asyncio
+import base64
+import json
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from itertools import count
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.signals import template_rendered
+from django.test.utils import CaptureQueriesContext
+from django.template import Context, Template
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from PIL import Image
+
+from .models import User, Product, Category
+from . import aggregates, jobs, views_templates
+from .admin_redirect import AdminRedirectMiddleware
+from .backends import authenticate
+from .importer import import_products
+from .instrumentation import REQUEST_LATENCY, REQUEST_QUERIES, REQUEST_TEMPLATE_TIME, RESPONSE_SIZE
+from .db_routing import PIN_COOKIE, ReplicaPinningMiddleware, ReplicaRouter, read_only
+from .metrics import AUTH_LATENCY
+from .models import CatalogAggregate, Job
+from .moderation import bulk_deactivate, bulk_delete
+from .fragments import acached_grid
+from .pagination import decode_cursor
+from .search import BaseSearchBackend, get_search_backend
+from .storage import REUSED_SUFFIX
+from .thumbnails import derivative_name, generate_thumbnails
+
+EMAIL_BACKEND = 'api.backends.EmailBackend'
+
+
+# No request is traced unless a test asks for it: a sampled request slower
+# than INSTRUMENTATION_SLOW_SECONDS would log a warning at random.
+@override_settings(INSTRUMENTATION_TRACE_SAMPLE_RATE=0.0)
+class ApiTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        for cache in caches.all():
+            cache.clear()
+
+
+def listed_ids(response):
+    """Product ids in the order the page links to them."""
+    return [int(pk) for pk in re.findall(r'href="/product/(\d+)/"', response.content.decode())]
+
+
+def make_seller(email='seller@example.com'):
+    return User.objects.create_user(email, 'Test Seller', '01700000000', 'seller', password='pass12345')
+
+
+def make_product(seller, category, title='Candle', price='10.00'):
+    return Product.objects.create(
+        title=title, details='Handmade', price=price,
+        image='media/product_images/missing.jpg', category=category, seller=seller,
+    )
+
+
+@override_settings(CATALOG_PAGE_SIZE=2)
+class CatalogPaginationTests(ApiTestCase):
+    def setUp(self):
+        self.seller = make_seller()
+        self.candles = Category.objects.create(name='Candles')
+        self.resin = Category.objects.create(name='Resin Art')
+        self.products = [make_product(self.seller, self.candles, f'Candle {i}') for i in range(3)]
+        self.coaster = make_product(self.seller, self.resin, 'Coaster')
+
+    def test_pages_follow_cursor_without_overlap(self):
+        seen = []
+        url = reverse('products')
+        response = self.client.get(url)
+        while True:
+            seen += listed_ids(response)
+            cursor = response.context['next_cursor']
+            if not cursor:
+                break
+            response = self.client.get(url, {'cursor': cursor})
+        self.assertEqual(len(seen), 4)
+        self.assertEqual(len(set(seen)), 4)
+        self.assertEqual(seen[0], self.coaster.pk)
+
+    def test_category_filter_is_applied_server_side(self):
+        response = self.client.get(reverse('buyer_home'), {'category': self.resin.pk})
+        self.assertEqual(listed_ids(response), [self.coaster.pk])
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_bad_cursor_falls_back_to_first_page(self):
+        self.assertIsNone(decode_cursor('not-a-cursor'))
+        response = self.client.get(reverse('products'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(listed_ids(response)[0], self.coaster.pk)
+
+    def test_cursor_is_canonical_in_the_grid_cache_key(self):
+        url = reverse('products')
+        cursor = self.client.get(url).context['next_cursor']
+        created_at, pk = decode_cursor(cursor)
+        respelled = base64.urlsafe_b64encode(f'{created_at.isoformat()}|00{pk}'.encode()).decode()
+        with mock.patch('api.views_templates.acached_grid', wraps=acached_grid) as cached:
+            self.client.get(url, {'cursor': respelled})
+            self.client.get(url, {'cursor': 'not-a-cursor'})
+        self.assertEqual([call.args[2] for call in cached.call_args_list], [cursor])
+
+
+class QueryBudgetMixin:
+    """Fail when a view's query count grows with the number of rows it lists."""
+
+    def count_queries(self, url):
+        # Measure cold renders; a warm fragment cache would hide N+1 queries.
+        for cache in caches.all():
+            cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.get('Location'))
+        return len(ctx.captured_queries)
+
+    def assertQueryBudgetFlat(self, url, add_rows, extra_rows=5):
+        before = self.count_queries(url)
+        add_rows(extra_rows)
+        after = self.count_queries(url)
+        self.assertEqual(before, after, f"{url} issued {after - before} extra queries for {extra_rows} more rows")
+
+
+class ViewQueryBudgetTests(QueryBudgetMixin, ApiTestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Candles')
+        self.seller = make_seller()
+        self.product = make_product(self.seller, self.category)
+        self.counter = count()
+
+    def add_products(self, n):
+        for i in (next(self.counter) for _ in range(n)):
+            seller = make_seller(f'seller{i}@example.com')
+            category = Category.objects.create(name=f'Category {i}')
+            make_product(seller, category, f'Product {i}')
+
+    def test_catalog_views(self):
+        for name in ('products', 'buyer_home'):
+            with self.subTest(view=name):
+                self.assertQueryBudgetFlat(reverse(name), self.add_products)
+
+    def test_profile_view(self):
+        url = reverse('profile', args=[self.seller.pk])
+        self.assertQueryBudgetFlat(url, lambda n: [make_product(self.seller, self.category) for _ in range(n)])
+
+    def test_product_detail_view(self):
+        self.client.force_login(self.seller, backend=EMAIL_BACKEND)
+        self.assertLessEqual(self.count_queries(reverse('product_detail', args=[self.product.pk])), 3)
+
+    def test_admin_dashboard(self):
+        admin = get_user_model().objects.create_user('admin', password='pass12345', is_staff=True)
+        self.client.force_login(admin)
+        for section in ('users', 'products', 'categories'):
+            with self.subTest(section=section):
+                self.assertQueryBudgetFlat(reverse('admin_section', args=[section]), self.add_products)
+
+
+class ProductSearchTests(ApiTestCase):
+    def setUp(self):
+        self.seller = make_seller()
+        self.category = Category.objects.create(name='Candles')
+        self.lavender = make_product(self.seller, self.category, 'Aromatic Lavender Candle')
+        self.coaster = make_product(self.seller, self.category, 'Ocean Wave Coaster')
+        self.coaster.details = 'Resin coaster with a lavender scent'
+        self.coaster.save()
+
+    def search(self, q, **params):
+        return self.client.get(reverse('search'), {'q': q, **params})
+
+    def test_title_matches_rank_above_detail_matches(self):
+        response = self.search('laven')
+        self.assertEqual(listed_ids(response), [self.lavender.pk, self.coaster.pk])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.lavender.title = 'Rose Candle'
+        self.lavender.save()
+        self.assertEqual(listed_ids(self.search('rose')), [self.lavender.pk])
+        self.lavender.delete()
+        self.assertEqual(listed_ids(self.search('rose')), [])
+
+    def test_fts_syntax_in_query_is_treated_as_text(self):
+        response = self.search('"ocean" (*')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(listed_ids(response), [self.coaster.pk])
+
+    def test_backend_must_implement_search(self):
+        class Incomplete(BaseSearchBackend):
+            pass
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+    def test_bulk_load_into_a_live_catalog_keeps_indexing(self):
+        with get_search_backend().bulk_load():
+            basket = make_product(self.seller, self.category, 'Jute Basket')
+            self.assertEqual(listed_ids(self.search('jute')), [basket.pk])
+
+    def test_interrupted_bulk_load_is_recovered(self):
+        Product.objects.all().delete()
+        backend = get_search_backend()
+        # Entered but never exited, as when the loading process is killed.
+        load = backend.bulk_load()
+        load.__enter__()
+        basket = make_product(self.seller, self.category, 'Jute Basket')
+        self.assertEqual(listed_ids(self.search('jute')), [])
+        backend.recover()
+        self.assertEqual(listed_ids(self.search('jute')), [basket.pk])
+        mug = make_product(self.seller, self.category, 'Jute Mug')
+        self.assertEqual(sorted(listed_ids(self.search('jute'))), [basket.pk, mug.pk])
+
+    def test_category_filters_show_product_counts(self):
+        response = self.search('candle')
+        self.assertEqual(response.context['total_count'], 2)
+        self.assertEqual([c.product_count for c in response.context['categories']], [2])
+        self.assertContains(response, '(2)')
+
+    @override_settings(CATALOG_PAGE_SIZE=1)
+    def test_results_are_paginated(self):
+        first = self.search('lavender')
+        self.assertEqual(first.context['next_url'], '?q=lavender&page=2')
+        second = self.search('lavender', page=2)
+        self.assertEqual(listed_ids(second), [self.coaster.pk])
+        self.assertIsNone(second.context['next_url'])
+
+
+def make_image_upload(name='photo.jpg', size=(1200, 800)):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'orange').save(buffer, format='JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class MediaRootMixin:
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+@override_settings(THUMBNAIL_WIDTHS=(160, 320), THUMBNAIL_FORMATS=('webp',))
+class ThumbnailTests(MediaRootMixin, ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        seller = make_seller()
+        category = Category.objects.create(name='Candles')
+        self.product = Product.objects.create(
+            title='Candle', details='Handmade', price='10.00',
+            image=make_image_upload(), category=category, seller=seller,
+        )
+        jobs.run_pending()
+
+    def test_derivatives_are_generated_on_upload(self):
+        storage = self.product.image.storage
+        for width in (160, 320):
+            name = derivative_name(self.product.image.name, width, 'webp')
+            with storage.open(name) as f:
+                self.assertEqual(Image.open(f).width, width)
+
+    def test_fresh_derivatives_are_not_regenerated(self):
+        self.assertEqual(generate_thumbnails(self.product.image), [])
+        self.assertEqual(len(generate_thumbnails(self.product.image, force=True)), 2)
+
+    def test_pages_cached_before_the_derivatives_are_refreshed(self):
+        product = Product.objects.create(
+            title='Lamp', details='x', price='5.00', image=SimpleUploadedFile('lamp.jpg', image_bytes('navy'), content_type='image/jpeg'),
+            category=self.product.category, seller=self.product.seller,
+        )
+        url = reverse('product_detail', args=[product.pk])
+        grid = self.client.get(reverse('products')).content.decode()
+        first = self.client.get(url)
+        self.assertNotIn(f'{product.image.name[:-4]}_160w.webp', grid + first.content.decode())
+
+        jobs.run_pending()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+        self.assertIn(f'{product.image.name[:-4]}_160w.webp', self.client.get(reverse('products')).content.decode())
+
+    def test_template_tag_emits_srcset(self):
+        html = Template('{% load media_tags %}{% responsive_image image alt="Candle" %}').render(
+            Context({'image': self.product.image})
+        )
+        self.assertIn('type="image/webp"', html)
+        self.assertIn('_160w.webp 160w', html)
+        self.assertIn(f'src="{self.product.image.url}"', html)
+
+
+@jobs.job('tests.flaky')
+def flaky_job(fail_times, key):
+    calls = FLAKY_CALLS.setdefault(key, [])
+    calls.append(1)
+    if len(calls) <= fail_times:
+        raise RuntimeError('boom')
+
+
+FLAKY_CALLS = {}
+
+
+@jobs.job('tests.collect')
+def collect_job(items):
+    pass
+
+
+class JobQueueTests(ApiTestCase):
+    def test_upload_queues_thumbnail_job_instead_of_processing_inline(self):
+        seller = make_seller()
+        make_product(seller, Category.objects.create(name='Candles'))
+        self.assertEqual(Job.objects.filter(name='thumbnails.generate', status='queued').count(), 1)
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(Job.objects.get(name='thumbnails.generate').status, 'done')
+
+    def test_batched_calls_queue_one_job_per_transaction(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            jobs.enqueue_batched('tests.collect', 'items', ['a'])
+            jobs.enqueue_batched('tests.collect', 'items', ['b', 'a'])
+        self.assertEqual([job.payload for job in Job.objects.filter(name='tests.collect')], [{'items': ['a', 'b']}])
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            jobs.enqueue_batched('tests.collect', 'items', ['lost'])
+            raise RuntimeError
+        with self.captureOnCommitCallbacks(execute=True):
+            jobs.enqueue_batched('tests.collect', 'items', ['c'])
+        latest = Job.objects.filter(name='tests.collect').latest('id')
+        self.assertIn('c', latest.payload['items'])
+        self.assertEqual(Job.objects.filter(name='tests.collect').count(), 2)
+
+    def test_login_does_not_queue_work(self):
+        seller = make_seller()
+        Job.objects.all().delete()
+        self.client.login(email='seller@example.com', password='pass12345')
+        self.assertFalse(Job.objects.exists())
+
+    def test_failed_job_is_retried_with_backoff_then_given_up(self):
+        queued = jobs.enqueue('tests.flaky', fail_times=10, key='giveup')
+        queued.max_attempts = 2
+        queued.save()
+        with self.assertLogs('api.jobs', 'WARNING'):
+            jobs.run_pending()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('queued', 1))
+        self.assertIn('boom', queued.last_error)
+
+        Job.objects.filter(pk=queued.pk).update(run_after=queued.created_at)
+        with self.assertLogs('api.jobs', 'ERROR'):
+            jobs.run_pending()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('failed', 2))
+
+    def test_claimed_job_is_not_claimed_twice(self):
+        jobs.enqueue('tests.flaky', fail_times=0, key='once')
+        self.assertIsNotNone(jobs.claim('a'))
+        self.assertIsNone(jobs.claim('b'))
+
+
+class FragmentCacheTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = make_seller()
+        self.category = Category.objects.create(name='Candles')
+        self.product = make_product(self.seller, self.category)
+
+    def product_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        # The Last-Modified validator's MAX(updated_at) seek is not a listing query.
+        return response, [q for q in ctx.captured_queries if 'FROM "api_product"' in q['sql'] and 'MAX(' not in q['sql']]
+
+    def test_warm_catalog_skips_product_query(self):
+        url = reverse('products')
+        cold, cold_queries = self.product_queries(url)
+        warm, warm_queries = self.product_queries(url)
+        self.assertEqual(len(cold_queries), 1)
+        self.assertEqual(warm_queries, [])
+        self.assertEqual(listed_ids(cold), listed_ids(warm))
+
+    def test_product_and_category_changes_invalidate_grid(self):
+        url = reverse('products')
+        self.client.get(url)
+        self.product.title = 'Renamed Candle'
+        self.product.save()
+        self.assertContains(self.client.get(url), 'Renamed Candle')
+
+        other = make_product(self.seller, self.category, 'Second Candle')
+        self.assertEqual(listed_ids(self.client.get(url)), [other.pk, self.product.pk])
+        other.delete()
+        self.assertEqual(listed_ids(self.client.get(url)), [self.product.pk])
+
+        self.category.delete()
+        self.assertEqual(listed_ids(self.client.get(url)), [])
+
+    def test_grid_follows_changes_made_by_other_processes(self):
+        url = reverse('products')
+        self.client.get(url)
+        # Written without signals, as by another worker or a job process
+        # whose cache this one never sees.
+        Product.objects.filter(pk=self.product.pk).update(title='Renamed Candle', updated_at=timezone.now())
+        added = Product.objects.bulk_create([Product(
+            title='Second Candle', details='Handmade', price='5.00',
+            image='media/product_images/missing.jpg', category=self.category, seller=self.seller,
+        )])
+        aggregates.products_added(added)
+        for logged_in in (False, True):
+            with self.subTest(logged_in=logged_in):
+                if logged_in:
+                    self.client.force_login(self.seller, backend=EMAIL_BACKEND)
+                response = self.client.get(url)
+                self.assertEqual(listed_ids(response), [added[0].pk, self.product.pk])
+                self.assertContains(response, 'Renamed Candle')
+
+
+class QueryPlanTests(ApiTestCase):
+    """EXPLAIN QUERY PLAN checks that the hot listings are served by an index."""
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        self.assertNotIn('TEMP B-TREE', plan, 'ordering should come from the index, not a sort')
+
+    def test_catalog_recency(self):
+        self.assertUsesIndex(Product.objects.order_by('-created_at', '-id')[:25], 'product_recent_idx')
+
+    def test_catalog_category(self):
+        queryset = Product.objects.filter(category_id=1).order_by('-created_at', '-id')[:25]
+        self.assertUsesIndex(queryset, 'product_category_recent_idx')
+
+    def test_seller_products(self):
+        self.assertUsesIndex(Product.objects.filter(seller_id=1).order_by('-created_at'), 'product_seller_recent_idx')
+
+    def test_admin_role_filter(self):
+        self.assertIn('user_role_idx', User.objects.filter(role='seller').explain())
+
+    def test_aggregate_price_range(self):
+        prices = Product.objects.values_list('price', flat=True)
+        self.assertUsesIndex(prices.order_by('price')[:1], 'product_price_idx')
+        self.assertUsesIndex(prices.filter(category_id=1).order_by('-price')[:1], 'product_category_price_idx')
+        self.assertUsesIndex(prices.filter(seller_id=1).order_by('price')[:1], 'product_seller_price_idx')
+
+
+class AdminEmailFilterTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = make_seller('Alice.Shop@example.com')
+        self.bob = make_seller('bob@example.com')
+
+    def test_prefix_match_is_case_insensitive(self):
+        self.assertEqual(list(User.objects.email_prefix('ALICE')), [self.alice])
+        self.assertEqual(list(User.objects.email_prefix('alice.shop@example.com')), [self.alice])
+        self.assertEqual(list(User.objects.email_prefix('example')), [])
+        self.assertEqual(User.objects.email_prefix('').count(), 2)
+
+    def test_lookup_seeks_the_lowercase_email_index(self):
+        plan = User.objects.email_prefix('ali').explain()
+        self.assertIn('user_email_lower_idx', plan)
+        self.assertNotIn('SCAN', plan)
+
+    def test_dashboard_filters_products_by_seller_prefix(self):
+        category = Category.objects.create(name='Candles')
+        mine = make_product(self.alice, category)
+        make_product(self.bob, category)
+        self.client.force_login(get_user_model().objects.create_user('admin', is_staff=True))
+        response = self.client.get(reverse('admin_section', args=['products']), {'seller_email': 'alice'})
+        self.assertEqual(list(response.context['page']), [mine])
+
+
+@override_settings(ADMIN_PAGE_SIZE=2)
+class AdminDashboardSectionTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(get_user_model().objects.create_user('admin', is_staff=True))
+        self.sellers = [make_seller(f'seller{i}@example.com') for i in range(3)]
+
+    def test_shell_does_not_query_listings(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('admin_dashboard'))
+        self.assertContains(response, 'data-admin-section="users"')
+        self.assertFalse([q for q in ctx.captured_queries if 'api_user' in q['sql'] or 'api_product' in q['sql']])
+
+    def test_sections_page_independently_and_keep_filters(self):
+        url = reverse('admin_section', args=['users'])
+        response = self.client.get(url, {'role': 'seller', 'users_page': 2, 'products_page': 3})
+        self.assertEqual(response.context['page'].number, 2)
+        self.assertEqual(len(response.context['page']), 1)
+        self.assertEqual(response.context['prev_query'], '?role=seller&users_page=1&products_page=3')
+        self.assertIn(('products_page', '3'), response.context['preserved_filters'])
+
+    def test_json_format(self):
+        response = self.client.get(reverse('admin_section', args=['users']), {'format': 'json'})
+        data = response.json()
+        self.assertEqual((data['count'], data['num_pages'], len(data['results'])), (3, 2, 2))
+        self.assertEqual(data['results'][0]['email'], 'seller2@example.com')
+
+    def test_unknown_section_is_404(self):
+        self.assertEqual(self.client.get(reverse('admin_section', args=['nope'])).status_code, 404)
+
+    def test_sections_are_framed_without_javascript(self):
+        response = self.client.get(reverse('admin_dashboard'), {'role': 'seller', 'users_page': 2})
+        self.assertContains(response, f'<iframe src="{reverse("admin_section", args=["users"])}?role=seller&amp;users_page=2"')
+        section = self.client.get(reverse('admin_section', args=['users']))
+        self.assertEqual(section['X-Frame-Options'], 'SAMEORIGIN')
+        self.assertContains(section, 'data-section-link target="_top"')
+
+    def test_products_listed_in_the_same_instant_page_stably(self):
+        category = Category.objects.create(name='Candles')
+        products = [make_product(self.sellers[0], category, f'Candle {i}') for i in range(5)]
+        Product.objects.update(created_at=timezone.now())
+        url = reverse('admin_section', args=['products'])
+        seen = []
+        for page in (1, 2, 3):
+            seen += [row['id'] for row in self.client.get(url, {'format': 'json', 'products_page': page}).json()['results']]
+        self.assertEqual(seen, sorted((p.pk for p in products), reverse=True))
+
+
+@override_settings(MEDIA_RELEASE_GRACE=0)
+class BulkModerationTests(MediaRootMixin, ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(get_user_model().objects.create_user('admin', is_staff=True))
+        self.category = Category.objects.create(name='Candles')
+        self.spammers = [make_seller(f'spam{i}@example.com') for i in range(3)]
+        self.honest = make_seller('honest@example.com')
+        for seller in self.spammers + [self.honest]:
+            make_product(seller, self.category, f'Item by {seller.email}')
+
+    def bulk(self, **data):
+        return self.client.post(reverse('admin_bulk'), data, HTTP_ACCEPT='application/json')
+
+    def test_delete_by_ids_cascades_and_reports(self):
+        ids = ','.join(str(u.pk) for u in self.spammers[:2])
+        result = self.bulk(model='user', action='delete', ids=ids).json()
+        self.assertEqual(result['matched'], 2)
+        self.assertEqual(result['deleted'], {'api.Product': 2, 'api.User': 2})
+        self.assertIn('elapsed_ms', result)
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_aggregates_are_updated_once_per_batch(self):
+        def delete_queries(n):
+            seller = make_seller(f'bulk{n}@example.com')
+            Product.objects.bulk_create([Product(
+                title=f'Bulk {i}', details='x', price=f'{i + 1}.00', image='', category=self.category, seller=seller,
+            ) for i in range(n)])
+            aggregates.rebuild()
+            with CaptureQueriesContext(connection) as ctx:
+                bulk_delete(Product.objects.filter(seller=seller))
+            return len(ctx.captured_queries)
+
+        self.assertEqual(delete_queries(3), delete_queries(30))
+        self.assertEqual(aggregates.differences(), [])
+
+    def test_filtered_scope_uses_dashboard_filters(self):
+        result = self.bulk(model='user', action='deactivate', scope='filtered', user_email='spam', expected=3).json()
+        self.assertEqual(result['deactivated'], 3)
+        self.assertEqual(list(User.objects.filter(is_active=True)), [self.honest])
+
+    def test_filtered_scope_needs_a_filter_and_the_matched_count(self):
+        self.assertEqual(self.bulk(model='category', action='delete', scope='filtered', expected=1).status_code, 400)
+        self.assertEqual(self.bulk(model='user', action='delete', scope='filtered', user_email='',
+                                   expected=4).status_code, 400)
+        self.assertEqual(self.bulk(model='user', action='delete', scope='filtered', user_email='spam').status_code, 400)
+        response = self.bulk(model='user', action='delete', scope='filtered', user_email='spam', expected=2)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(User.objects.count(), 4)
+        self.assertEqual(Product.objects.count(), 4)
+
+    def test_requires_selection_or_explicit_filtered_scope(self):
+        self.assertEqual(self.bulk(model='user', action='delete').status_code, 400)
+        self.assertEqual(self.bulk(model='product', action='deactivate', ids='1').status_code, 400)
+        self.assertEqual(User.objects.count(), 4)
+
+    def test_unreferenced_media_is_removed_after_commit(self):
+        product = Product.objects.create(
+            title='Photo', details='x', price='1.00', image=make_image_upload(),
+            category=self.category, seller=self.honest,
+        )
+        jobs.run_pending()
+        storage = product.image.storage
+        self.assertTrue(storage.exists(product.image.name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bulk(model='product', action='delete', ids=str(product.pk))
+        jobs.run_pending()
+        self.assertFalse(storage.exists(product.image.name))
+        self.assertFalse(storage.exists(derivative_name(product.image.name, settings.THUMBNAIL_WIDTHS[0], 'webp')))
+
+
+@override_settings(MEDIA_RELEASE_GRACE=0)
+class MediaStorageTests(MediaRootMixin, ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = make_seller()
+        self.category = Category.objects.create(name='Candles')
+
+    def add_product(self, name='candle.jpg'):
+        product = Product.objects.create(
+            title='Candle', details='x', price='1.00', image=make_image_upload(name),
+            category=self.category, seller=self.seller,
+        )
+        jobs.run_pending()
+        return product
+
+    def test_identical_uploads_share_one_blob(self):
+        first, second = self.add_product('a.jpg'), self.add_product('b.jpg')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^media/product_images/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(len(list(Path(self.media_root).rglob('*.jpg'))), 1)
+
+    def test_blob_is_removed_with_its_last_reference(self):
+        first, second = self.add_product(), self.add_product()
+        storage, name = first.image.storage, first.image.name
+        thumbnail = derivative_name(name, settings.THUMBNAIL_WIDTHS[0], 'webp')
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        jobs.run_pending()
+        self.assertTrue(storage.exists(name))
+        self.assertTrue(storage.exists(thumbnail))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        jobs.run_pending()
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(storage.exists(thumbnail))
+
+    @override_settings(MEDIA_RELEASE_GRACE=600)
+    def test_blob_reused_before_its_row_commits_survives_release(self):
+        product = self.add_product()
+        storage, name = product.image.storage, product.image.name
+        os.utime(storage.path(name), (0, 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        # A new upload of the same bytes, its row not yet written.
+        self.assertEqual(storage.save('media/product_images/again.jpg', make_image_upload()), name)
+        jobs.run_pending()
+        self.assertTrue(storage.exists(name))
+        retry = Job.objects.get(name='media.remove_unreferenced', status='queued')
+        self.assertEqual(retry.payload, {'names': [name]})
+        self.assertGreater(retry.run_after, timezone.now())
+
+        # Once the grace period has passed with no row using it, it goes.
+        os.utime(storage.path(name) + REUSED_SUFFIX, (0, 0))
+        Job.objects.filter(pk=retry.pk).update(run_after=timezone.now())
+        jobs.run_pending()
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(storage.exists(name + REUSED_SUFFIX))
+
+    def test_reused_blob_keeps_its_derivatives(self):
+        first = self.add_product()
+        storage, name = first.image.storage, first.image.name
+        thumbnail = derivative_name(name, settings.THUMBNAIL_WIDTHS[0], 'webp')
+        written = storage.get_modified_time(thumbnail)
+        self.add_product('again.jpg')
+        self.assertEqual(storage.get_modified_time(thumbnail), written)
+        self.assertEqual(generate_thumbnails(first.image), [])
+
+    def test_replaced_image_is_released(self):
+        product = self.add_product()
+        old = product.image.name
+        product.image = SimpleUploadedFile('new.jpg', image_bytes('navy'), content_type='image/jpeg')
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        jobs.run_pending()
+        self.assertNotEqual(product.image.name, old)
+        self.assertFalse(product.image.storage.exists(old))
+
+    def test_dedupe_media_merges_legacy_uploads(self):
+        storage = Product._meta.get_field('image').storage
+        legacy = []
+        for i in range(2):
+            name = storage.save_named(f'media/product_images/candle_{i}.jpg', make_image_upload())
+            Product.objects.create(title='Old', details='x', price='1.00', image=name,
+                                   category=self.category, seller=self.seller)
+            legacy.append(name)
+        jobs.run_pending()
+        self.assertTrue(storage.exists(derivative_name(legacy[0], settings.THUMBNAIL_WIDTHS[0], 'webp')))
+
+        out = StringIO()
+        call_command('dedupe_media', '--dry-run', stdout=out)
+        self.assertIn('2 files would become 1 blobs', out.getvalue())
+        self.assertEqual(set(Product.objects.values_list('image', flat=True)), set(legacy))
+
+        call_command('dedupe_media', stdout=StringIO())
+        names = set(Product.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertTrue(storage.exists(name))
+        self.assertTrue(storage.exists(derivative_name(name, settings.THUMBNAIL_WIDTHS[0], 'webp')))
+        for old in legacy:
+            self.assertFalse(storage.exists(old))
+            self.assertFalse(storage.exists(derivative_name(old, settings.THUMBNAIL_WIDTHS[0], 'webp')))
+
+
+class MediaServingTests(MediaRootMixin, ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(
+            title='Candle', details='x', price='1.00', image=make_image_upload(),
+            category=Category.objects.create(name='Candles'), seller=make_seller(),
+        )
+        self.url = self.product.image.url
+        with open(self.product.image.path, 'rb') as f:
+            self.data = f.read()
+
+    def test_blob_is_served_whole_and_cached_as_immutable(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        self.assertEqual(response['Content-Length'], str(len(self.data)))
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn(response['ETag'].strip('"'), self.url)
+
+        again = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+    def test_range_requests(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.data)}')
+        self.assertEqual(b''.join(response.streaming_content), self.data[10:20])
+
+        tail = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(tail.streaming_content), self.data[-5:])
+        stale = self.client.get(self.url, HTTP_RANGE='bytes=0-4', HTTP_IF_RANGE='"other"')
+        self.assertEqual(stale.status_code, 200)
+        outside = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.data)}-')
+        self.assertEqual(outside.status_code, 416)
+        self.assertEqual(outside['Content-Range'], f'bytes */{len(self.data)}')
+
+    @override_settings(MEDIA_SERVE_MODE='x-accel-redirect')
+    def test_front_end_sends_the_file(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.product.image.name}')
+        self.assertEqual(response.content, b'')
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_served_directories_are_worked_out_once(self):
+        self.client.get(self.url)
+        with mock.patch.object(type(self.product.image.storage), 'fields') as fields:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        fields.assert_not_called()
+
+    async def test_django_mode_is_refused_under_asgi(self):
+        with self.assertRaises(ImproperlyConfigured):
+            await self.async_client.get(self.url)
+        with self.settings(MEDIA_SERVE_MODE='x-accel-redirect'):
+            response = await self.async_client.get(self.url)
+        self.assertIn('X-Accel-Redirect', response)
+
+    def test_only_upload_directories_are_served(self):
+        Path(self.media_root, 'backup.sqlite3').write_bytes(b'secret')
+        self.assertEqual(self.client.get('/media/backup.sqlite3').status_code, 404)
+        self.assertEqual(self.client.get('/media/media/product_images/../../backup.sqlite3').status_code, 404)
+        self.assertEqual(self.client.get('/media/user_photos/missing.jpg').status_code, 404)
+        Path(self.product.image.path + REUSED_SUFFIX).touch()
+        self.assertEqual(self.client.get(self.url + REUSED_SUFFIX).status_code, 404)
+
+
+class CatalogApiTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = make_seller()
+        self.category = Category.objects.create(name='Candles')
+        self.products = [make_product(self.seller, self.category, f'Candle {i}') for i in range(3)]
+
+    def test_cursor_paginated_sparse_fields(self):
+        response = self.client.get('/api/v1/products/', {'page_size': 2, 'fields': 'id,title'})
+        data = response.json()
+        self.assertEqual(data['results'], [{'id': p.pk, 'title': p.title} for p in self.products[:0:-1]])
+        self.assertIn('cursor=', data['next'])
+        self.assertEqual(self.client.get(data['next']).json()['results'][0]['id'], self.products[0].pk)
+
+    def test_sparse_fields_skip_unused_joins(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/v1/products/', {'fields': 'id,title'})
+        self.assertNotIn('JOIN', ctx.captured_queries[-1]['sql'])
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/v1/products/', {'fields': 'id,seller_name'})
+        self.assertIn('"api_user"', ctx.captured_queries[-1]['sql'])
+
+    def test_unchanged_page_returns_304(self):
+        first = self.client.get('/api/v1/products/')
+        etag = first['ETag']
+        again = self.client.get('/api/v1/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.content, b'')
+
+        self.products[0].title = 'Changed'
+        self.products[0].save()
+        self.assertEqual(self.client.get('/api/v1/products/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detail_last_modified(self):
+        url = f'/api/v1/products/{self.products[0].pk}/'
+        response = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+    def test_public_seller_profile_hides_contact_details(self):
+        data = self.client.get(f'/api/v1/sellers/{self.seller.pk}/').json()
+        self.assertEqual(set(data), {'id', 'full_name', 'photo', 'facebook_link'})
+
+
+class HttpCacheTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = make_seller()
+        self.category = Category.objects.create(name='Candles')
+        self.product = make_product(self.seller, self.category)
+
+    def test_anonymous_catalog_is_publicly_cacheable(self):
+        response = self.client.get(reverse('products'), {'category': self.category.pk})
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('s-maxage', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+        self.assertEqual(response['Surrogate-Key'], f'catalog category-{self.category.pk}')
+
+        again = self.client.get(reverse('products'), {'category': self.category.pk}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+    def test_catalog_etag_changes_with_products(self):
+        etag = self.client.get(reverse('buyer_home'))['ETag']
+        self.product.title = 'Renamed'
+        self.product.save()
+        self.assertEqual(self.client.get(reverse('buyer_home'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_catalog_etag_follows_changes_made_elsewhere(self):
+        etag = self.client.get(reverse('buyer_home'))['ETag']
+        # An update no signal in this process sees, as made by another worker.
+        Product.objects.filter(pk=self.product.pk).update(title='Renamed', updated_at=timezone.now())
+        self.assertEqual(self.client.get(reverse('buyer_home'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_not_modified_skips_rendering_the_listing(self):
+        url = reverse('product_detail', args=[self.product.pk])
+        first = self.client.get(url)
+        self.assertEqual(first['Surrogate-Key'], f'product-{self.product.pk}')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_static_pages_are_cacheable(self):
+        for name in ('home', 'about', 'contact'):
+            with self.subTest(name):
+                response = self.client.get(reverse(name))
+                self.assertIn(f'max-age={settings.HTTP_CACHE_STATIC_MAX_AGE}', response['Cache-Control'])
+                self.assertEqual(self.client.get(reverse(name), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_logged_in_responses_are_private(self):
+        self.client.force_login(self.seller, backend=EMAIL_BACKEND)
+        response = self.client.get(reverse('profile', args=[self.seller.pk]))
+        self.assertIn('private', response['Cache-Control'])
+        self.assertNotIn('Surrogate-Key', response)
+
+    @override_settings(SURROGATE_PURGE_URL='http://proxy.invalid/purge')
+    def test_changes_queue_one_purge_per_transaction(self):
+        deleted_pk = self.product.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            second = make_product(self.seller, self.category, 'Second')
+            self.product.delete()
+        purge = Job.objects.get(name='http_cache.purge')
+        for key in ('catalog', f'product-{deleted_pk}', f'product-{second.pk}', f'seller-{self.seller.pk}'):
+            self.assertIn(key, purge.payload['keys'])
+
+
+# LocMem is shared within the test process, standing in for Redis.
+@override_settings(USER_CACHE_ALIAS='fragments')
+class SessionUserCacheTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = make_seller()
+        self.client.force_login(self.seller, backend=EMAIL_BACKEND)
+
+    def user_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('about'))
+        return [q for q in ctx.captured_queries if 'FROM "api_user"' in q['sql']]
+
+    def test_session_user_is_cached(self):
+        self.assertEqual(len(self.user_queries()), 1)
+        self.assertEqual(self.user_queries(), [])
+
+    @override_settings(USER_CACHE_ALIAS=None)
+    def test_no_shared_cache_reads_the_row_each_time(self):
+        self.assertEqual(len(self.user_queries()), 1)
+        self.assertEqual(len(self.user_queries()), 1)
+
+    def test_save_invalidates_cached_user(self):
+        self.user_queries()
+        self.seller.full_name = 'Renamed Seller'
+        self.seller.save()
+        self.assertEqual(len(self.user_queries()), 1)
+
+    def test_password_change_ends_other_sessions(self):
+        self.user_queries()
+        self.seller.set_password('new-pass-123')
+        self.seller.save()
+        self.assertFalse(self.client.get(reverse('about')).wsgi_request.user.is_authenticated)
+
+    def test_bulk_deactivate_invalidates_cached_user(self):
+        self.user_queries()
+        bulk_deactivate(User.objects.filter(pk=self.seller.pk))
+        self.assertFalse(self.client.get(reverse('about')).wsgi_request.user.is_authenticated)
+
+
+class AuthenticationTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        AUTH_LATENCY.clear()
+
+    def login(self, email, password):
+        return self.client.post(reverse('login'), {'email': email, 'password': password})
+
+    def test_email_login_only_reaches_email_backend(self):
+        make_seller()
+        with mock.patch('django.contrib.auth.backends.ModelBackend.authenticate') as model_backend:
+            self.assertRedirects(self.login('seller@example.com', 'pass12345'), reverse('seller_home'))
+        model_backend.assert_not_called()
+
+    def test_credentials_no_backend_handles_are_refused(self):
+        make_seller()
+        self.assertIsNone(authenticate(None, phone='01700000000', password='pass12345'))
+
+    def test_deactivated_user_cannot_log_in(self):
+        seller = make_seller()
+        bulk_deactivate(User.objects.filter(pk=seller.pk))
+        response = self.login('seller@example.com', 'pass12345')
+        self.assertNotIn('_auth_user_id', self.client.session)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(AUTH_LATENCY.count(backend='email', outcome='failure'), 1)
+
+    def test_unknown_email_still_hashes_once(self):
+        with mock.patch('api.models.User.set_password') as set_password:
+            self.login('nobody@example.com', 'pass12345')
+        set_password.assert_called_once_with('pass12345')
+        self.assertEqual(AUTH_LATENCY.count(backend='email', outcome='failure'), 1)
+
+    def test_admin_login_uses_model_backend(self):
+        get_user_model().objects.create_user('admin', password='pass12345', is_staff=True)
+        response = self.client.post(reverse('admin_login'), {'username': 'admin', 'password': 'pass12345'})
+        self.assertRedirects(response, reverse('admin_dashboard'), fetch_redirect_response=False)
+        self.assertEqual(AUTH_LATENCY.count(backend='username', outcome='success'), 1)
+
+    def test_hash_upgraded_on_login_after_cost_change(self):
+        with self.settings(PASSWORD_PBKDF2_ITERATIONS=1000):
+            seller = make_seller()
+        self.assertIn('$1000$', seller.password)
+        with self.settings(PASSWORD_PBKDF2_ITERATIONS=2000):
+            self.login('seller@example.com', 'pass12345')
+        seller.refresh_from_db()
+        self.assertIn('$2000$', seller.password)
+
+    def test_metrics_endpoint(self):
+        self.login('nobody@example.com', 'wrong')
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        with self.settings(METRICS_ALLOWED_IPS=['127.0.0.1']):
+            body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('nokshibox_auth_seconds_count{backend="email",outcome="failure"} 1', body)
+        self.assertIn('nokshibox_auth_seconds_bucket{backend="email",outcome="failure",le="+Inf"} 1', body)
+
+
+class AdminRedirectMiddlewareTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = get_user_model().objects.create_user('root', password='pass12345', is_staff=True, is_superuser=True)
+
+    def test_superuser_is_sent_to_dashboard(self):
+        self.client.force_login(self.admin)
+        self.assertRedirects(self.client.get(reverse('about')), reverse('admin_dashboard'), fetch_redirect_response=False)
+        self.assertEqual(self.client.get(reverse('admin_dashboard')).status_code, 200)
+
+    def test_static_and_anonymous_requests_skip_user_loading(self):
+        middleware = AdminRedirectMiddleware(lambda request: HttpResponse())
+        factory = RequestFactory()
+        for request in (factory.get('/about/'), factory.get(settings.MEDIA_URL + 'x.jpg', HTTP_COOKIE='sessionid=abc')):
+            request.user = SimpleLazyObject(mock.Mock(side_effect=AssertionError('user loaded')))
+            self.assertEqual(middleware(request).status_code, 200)
+
+    async def test_async_superuser_is_sent_to_dashboard(self):
+        async def get_response(request):
+            return HttpResponse()
+
+        middleware = AdminRedirectMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = RequestFactory().get('/about/', HTTP_COOKIE='sessionid=abc')
+        request.auser = mock.AsyncMock(return_value=self.admin)
+        self.assertEqual((await middleware(request)).status_code, 302)
+        request.auser = mock.AsyncMock(return_value=AnonymousUser())
+        self.assertEqual((await middleware(request)).status_code, 200)
+
+
+class AsyncViewTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = make_seller()
+        self.category = Category.objects.create(name='Candles')
+        self.product = make_product(self.seller, self.category)
+
+    def test_catalog_and_detail_views_are_async(self):
+        for view in (views_templates.product, views_templates.buyer_home,
+                     views_templates.product_detail, views_templates.profile):
+            with self.subTest(view.__name__):
+                self.assertTrue(iscoroutinefunction(view))
+
+    async def test_logged_in_pages_render_under_asgi(self):
+        await self.async_client.aforce_login(self.seller, backend=EMAIL_BACKEND)
+        for url in (reverse('products'), reverse('buyer_home'),
+                    reverse('product_detail', args=[self.product.pk]), reverse('profile', args=[self.seller.pk])):
+            with self.subTest(url):
+                response = await self.async_client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, reverse('profile', args=[self.seller.pk]))
+
+    async def test_templates_render_off_the_event_loop(self):
+        on_loop = []
+
+        def rendered(sender, template, **kwargs):
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                on_loop.append((template.name, False))
+            else:
+                on_loop.append((template.name, True))
+
+        template_rendered.connect(rendered)
+        self.addCleanup(template_rendered.disconnect, rendered)
+        for url in (reverse('products'), reverse('product_detail', args=[self.product.pk]),
+                    reverse('profile', args=[self.seller.pk])):
+            response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, 200)
+        self.assertIn(('_product_grid.html', False), on_loop)
+        self.assertNotIn(True, [blocking for _, blocking in on_loop])
+
+    async def test_missing_product_is_404(self):
+        response = await self.async_client.get(reverse('product_detail', args=[self.product.pk + 1]))
+        self.assertEqual(response.status_code, 404)
+
+
+class SQLiteProfileTests(TestCase):
+    def test_production_options_apply_pragmas_and_immediate_transactions(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            wrapper = DatabaseWrapper({
+                **connection.settings_dict,
+                'NAME': f'{tmp}/profile.sqlite3',
+                'OPTIONS': settings.SQLITE_PRODUCTION_OPTIONS,
+            }, alias='profile')
+            try:
+                with wrapper.cursor() as cursor:
+                    pragmas = {}
+                    for name in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size'):
+                        cursor.execute(f'PRAGMA {name}')
+                        pragmas[name] = cursor.fetchone()[0]
+                self.assertEqual(pragmas, {
+                    'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 20000,
+                    'mmap_size': settings.SQLITE_PRAGMAS['mmap_size'],
+                })
+                self.assertEqual(wrapper.transaction_mode, 'IMMEDIATE')
+            finally:
+                wrapper.close()
+
+
+@override_settings(DATABASE_REPLICAS=['replica0'])
+class ReplicaRoutingTests(ApiTestCase):
+    def route(self, request, model=Product):
+        @read_only
+        def view(request):
+            return ReplicaRouter().db_for_read(model)
+        return view(request)
+
+    def test_read_only_views_read_from_replicas(self):
+        factory = RequestFactory()
+        self.assertEqual(self.route(factory.get('/products/')), 'replica0')
+        self.assertIsNone(self.route(factory.post('/products/')))
+        self.assertIsNone(ReplicaRouter().db_for_read(Product))
+        self.assertEqual(ReplicaRouter().db_for_write(Product), 'default')
+
+    def test_sessions_and_jobs_stay_on_primary(self):
+        request = RequestFactory().get('/products/')
+        self.assertEqual(self.route(request, Session), 'default')
+        self.assertEqual(self.route(request, Job), 'default')
+
+    def test_client_is_pinned_to_primary_after_a_write(self):
+        middleware = ReplicaPinningMiddleware(lambda request: HttpResponse())
+        response = middleware(RequestFactory().post('/login/'))
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertNotIn(PIN_COOKIE, middleware(RequestFactory().get('/products/')).cookies)
+
+        routed = []
+        pinned = ReplicaPinningMiddleware(lambda request: HttpResponse(routed.append(self.route(request))))
+        pinned(RequestFactory().get('/products/', HTTP_COOKIE=f'{PIN_COOKIE}=1'))
+        self.assertEqual(routed, [None])
+
+    @override_settings(DATABASE_REPLICAS=['default'])
+    def test_catalog_pages_route_reads(self):
+        make_product(make_seller(), Category.objects.create(name='Candles'))
+        with mock.patch('api.db_routing.random.choice', return_value='default') as choice:
+            self.assertEqual(self.client.get(reverse('products')).status_code, 200)
+        self.assertTrue(choice.called)
+
+
+class CatalogAggregateTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = make_seller()
+        self.other_seller = make_seller('other@example.com')
+        self.candles = Category.objects.create(name='Candles')
+        self.lamps = Category.objects.create(name='Lamps')
+
+    def row(self, scope, key=0):
+        return CatalogAggregate.objects.get(scope=scope, key=key)
+
+    def test_signals_keep_rows_consistent(self):
+        cheap = make_product(self.seller, self.candles, 'Cheap', '5.00')
+        dear = make_product(self.seller, self.candles, 'Dear', '50.00')
+        lamp = make_product(self.other_seller, self.lamps, 'Lamp', '20.00')
+        row = self.row('category', self.candles.pk)
+        self.assertEqual((row.product_count, row.min_price, row.max_price, row.latest_product_id), (2, 5, 50, dear.pk))
+
+        dear.price = '7.50'
+        dear.save()
+        self.assertEqual(self.row('seller', self.seller.pk).max_price, Decimal('7.50'))
+        lamp.category = self.candles
+        lamp.save()
+        self.assertEqual(self.row('category', self.lamps.pk).product_count, 0)
+        self.assertEqual(self.row('category', self.candles.pk).latest_product_id, lamp.pk)
+        cheap.delete()
+        self.assertEqual(self.row('all').min_price, Decimal('7.50'))
+        self.assertEqual(aggregates.differences(), [])
+
+        self.other_seller.delete()
+        self.assertFalse(CatalogAggregate.objects.filter(scope='seller', key=self.other_seller.pk).exists())
+        self.assertEqual(aggregates.differences(), [])
+
+    def test_bulk_delete_keeps_rows_consistent(self):
+        for i in range(5):
+            make_product(self.seller, self.candles if i % 2 else self.lamps, f'Item {i}', f'{i + 1}.00')
+        bulk_delete(Product.objects.filter(category=self.lamps))
+        self.assertEqual(self.row('all').product_count, 2)
+        self.assertEqual(aggregates.differences(), [])
+
+    def test_rebuild_and_verify_command(self):
+        make_product(self.seller, self.candles)
+        CatalogAggregate.objects.filter(scope='all').update(product_count=99)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_aggregates', verify=True, stdout=StringIO())
+        call_command('rebuild_aggregates', stdout=StringIO())
+        call_command('rebuild_aggregates', verify=True, stdout=StringIO())
+        self.assertEqual(self.row('all').product_count, 1)
+
+    def test_views_read_precomputed_counts(self):
+        for i in range(3):
+            make_product(self.seller, self.candles, f'Candle {i}', '10.00')
+        self.assertContains(self.client.get(reverse('products')), 'Candles <span class="text-sm font-normal">(3)</span>')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('profile', args=[self.seller.pk]))
+        self.assertContains(response, 'Tk 10.00 &ndash; Tk 10.00')
+        self.assertFalse(any('COUNT(' in q['sql'] for q in ctx.captured_queries))
+
+
+def image_bytes(color='orange'):
+    buffer = BytesIO()
+    Image.new('RGB', (40, 30), color).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+class ProductImportTests(MediaRootMixin, ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = make_seller()
+        self.candles = Category.objects.create(name='Candles')
+        self.work_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.work_dir, ignore_errors=True)
+        (self.work_dir / 'candle.jpg').write_bytes(image_bytes())
+        (self.work_dir / 'broken.jpg').write_bytes(b'not an image')
+
+    def write_jsonl(self, rows):
+        path = self.work_dir / 'products.jsonl'
+        path.write_text('\n'.join(json.dumps(row) for row in rows) + '\n')
+        return path
+
+    def rows(self, n):
+        return [{'title': f'Candle {i}', 'details': 'Soy wax', 'price': f'{i + 1}.50',
+                 'image': 'candle.jpg', 'category': 'candles'} for i in range(n)]
+
+    def test_command_imports_seed_file(self):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_products', str(Path(settings.BASE_DIR, 'testing', 'products.json')),
+                     seller=self.seller.email, create_categories=True, stdout=stdout, stderr=stderr)
+        product = Product.objects.get()
+        self.assertEqual((product.title, product.price, product.category.name),
+                         ('Aromatic Lavender Candle', Decimal('15.99'), 'candel'))
+        self.assertTrue(product.image.storage.exists(product.image.name))
+        self.assertIn('record 2: image: assets/resin_coaster.jpg not found.', stderr.getvalue())
+        self.assertIn('record 3: details:', stderr.getvalue())
+        self.assertEqual(aggregates.differences(), [])
+
+    def test_batches_validate_rows_and_share_images(self):
+        rows = self.rows(5) + [
+            {'title': 'No price', 'details': 'x', 'image': 'candle.jpg', 'category': 'Candles'},
+            {'title': 'Lamp', 'details': 'x', 'price': '3.00', 'image': 'candle.jpg', 'category': 'Lamps'},
+            {'title': 'Broken', 'details': 'x', 'price': '3.00', 'image': 'broken.jpg', 'category': 'Candles'},
+        ]
+        with open(self.write_jsonl(rows), 'rb') as stream:
+            result = import_products(stream, 'jsonl', self.seller, images=str(self.work_dir), batch_size=2)
+        self.assertEqual((result['created'], result['skipped']), (5, 3))
+        self.assertEqual([number for number, _ in result['errors']], [6, 7, 8])
+        self.assertEqual(len(set(Product.objects.values_list('image', flat=True))), 1)
+        self.assertEqual(Job.objects.filter(name='thumbnails.generate').count(), 1)
+        self.assertEqual(CatalogAggregate.objects.get(scope='category', key=self.candles.pk).product_count, 5)
+        self.assertEqual(aggregates.differences(), [])
+
+    def test_checkpoint_resumes_after_a_crash(self):
+        path = self.write_jsonl(self.rows(5))
+        checkpoint = str(self.work_dir / 'checkpoint.json')
+
+        def crash(result):
+            raise RuntimeError('worker died')
+
+        with open(path, 'rb') as stream, self.assertRaises(RuntimeError):
+            import_products(stream, 'jsonl', self.seller, images=str(self.work_dir), batch_size=2,
+                            checkpoint=checkpoint, fingerprint='products', progress=crash)
+        self.assertEqual(Product.objects.count(), 2)
+        with open(path, 'rb') as stream:
+            result = import_products(stream, 'jsonl', self.seller, images=str(self.work_dir), batch_size=2,
+                                     checkpoint=checkpoint, fingerprint='products')
+        self.assertEqual((result['resumed_from'], result['created']), (2, 3))
+        self.assertEqual(sorted(Product.objects.values_list('title', flat=True)), [f'Candle {i}' for i in range(5)])
+        with open(path, 'rb') as stream, self.assertRaises(ValueError):
+            import_products(stream, 'jsonl', self.seller, checkpoint=checkpoint, fingerprint='other')
+
+    @override_settings(MEDIA_RELEASE_GRACE=0)
+    def test_images_of_a_rolled_back_batch_are_released(self):
+        storage = Product._meta.get_field('image').storage
+        with (open(self.write_jsonl(self.rows(2)), 'rb') as stream,
+              mock.patch('api.importer.aggregates.products_added', side_effect=RuntimeError('db gone')),
+              self.captureOnCommitCallbacks(execute=True),
+              self.assertRaises(RuntimeError)):
+            import_products(stream, 'jsonl', self.seller, images=str(self.work_dir))
+        self.assertEqual(Product.objects.count(), 0)
+        release = Job.objects.get(name='media.remove_unreferenced')
+        (name,) = release.payload['names']
+        self.assertTrue(storage.exists(name))
+        jobs.run(release)
+        self.assertFalse(storage.exists(name))
+
+    def test_csv_with_zipped_images(self):
+        archive = self.work_dir / 'images.zip'
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('img/candle.jpg', image_bytes('blue'))
+        csv_path = self.work_dir / 'products.csv'
+        csv_path.write_text('title,details,price,image,category\nBlue candle,Wax,12.00,img/candle.jpg,Candles\n'
+                            'Escape,Wax,1.00,../candle.jpg,Candles\n')
+        with open(csv_path, 'rb') as stream:
+            result = import_products(stream, 'csv', self.seller, images=str(archive))
+        self.assertEqual(result['created'], 1)
+        self.assertEqual(result['errors'], [(2, 'image: ../candle.jpg not found.')])
+
+    def test_seller_upload_endpoint_queues_import(self):
+        buyer = User.objects.create_user('buyer@example.com', 'Buyer', '01700000000', 'buyer', password='pass12345')
+        self.client.force_login(buyer, backend=EMAIL_BACKEND)
+        self.assertEqual(self.client.post(reverse('seller_import')).status_code, 403)
+
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('candle.jpg', image_bytes())
+        upload = SimpleUploadedFile('products.jsonl', self.write_jsonl(self.rows(3)).read_bytes())
+        self.client.force_login(self.seller, backend=EMAIL_BACKEND)
+        with override_settings(IMPORT_WORK_DIR=str(self.work_dir / 'uploads')):
+            response = self.client.post(reverse('seller_import'), {
+                'products': upload, 'images': SimpleUploadedFile('images.zip', archive.getvalue()),
+            })
+            self.assertEqual(response.status_code, 202)
+            queued = Job.objects.get(pk=response.json()['job'])
+            self.assertEqual(Product.objects.count(), 0)
+            jobs.run(queued)
+        self.assertEqual(queued.status, 'done', queued.last_error)
+        self.assertEqual(Product.objects.filter(seller=self.seller).count(), 3)
+        self.assertEqual(list((self.work_dir / 'uploads').rglob('*.*')), [])
+
+
+class RequestMetricsTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        for histogram in (REQUEST_LATENCY, REQUEST_QUERIES, REQUEST_TEMPLATE_TIME, RESPONSE_SIZE):
+            histogram.clear()
+            self.addCleanup(histogram.clear)
+        self.seller = make_seller()
+        self.product = make_product(self.seller, Category.objects.create(name='Candles'))
+
+    def test_records_sql_templates_and_size_per_view(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('products'))
+        self.assertEqual(REQUEST_LATENCY.count(view='products', method='GET', status='2xx'), 1)
+        self.assertEqual(REQUEST_QUERIES.total(view='products'), len(ctx.captured_queries))
+        self.assertGreater(REQUEST_TEMPLATE_TIME.total(view='products'), 0)
+        self.assertEqual(RESPONSE_SIZE.total(view='products'), len(response.content))
+
+        self.client.get('/no-such-page/')
+        self.assertEqual(REQUEST_LATENCY.count(view='unresolved', method='GET', status='4xx'), 1)
+        self.client.generic('X-SCAN-1', '/no-such-page/')
+        self.client.generic('X-SCAN-2', '/no-such-page/')
+        self.assertEqual(REQUEST_LATENCY.count(view='unresolved', method='other', status='4xx'), 2)
+
+        admin = get_user_model().objects.create_user('admin', is_staff=True)
+        self.client.force_login(admin)
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('nokshibox_request_sql_queries_count{view="products"} 1', body)
+
+    def test_async_views_are_measured(self):
+        self.client.get(reverse('product_detail', args=[self.product.pk]))
+        self.assertEqual(REQUEST_LATENCY.count(view='product_detail', method='GET', status='2xx'), 1)
+        self.assertGreater(REQUEST_QUERIES.total(view='product_detail'), 0)
+
+    @override_settings(INSTRUMENTATION_TRACE_SAMPLE_RATE=1.0, INSTRUMENTATION_SLOW_SECONDS=0)
+    def test_sampled_slow_request_is_logged_with_sql(self):
+        with self.assertLogs('api.instrumentation', 'WARNING') as logs:
+            self.client.get(reverse('profile', args=[self.seller.pk]))
+        self.assertIn('(profile)', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    @override_settings(INSTRUMENTATION_TRACE_SAMPLE_RATE=0.0, INSTRUMENTATION_SLOW_SECONDS=0)
+    def test_unsampled_requests_are_not_logged(self):
+        with self.assertNoLogs('api.instrumentation', 'WARNING'):
+            self.client.get(reverse('products'))
+
+
+@override_settings(THUMBNAIL_FORMATS=())
+class GenerateFixturesTests(MediaRootMixin, ApiTestCase):
+    def generate(self, **options):
+        call_command('generate_fixtures', products=60, categories=4, bench_accounts=2, images=2,
+                     stdout=StringIO(), **options)
+        return list(Product.objects.order_by('pk').values_list('title', 'price', 'category__name', 'seller__email'))
+
+    def test_generates_a_deterministic_catalog(self):
+        first = self.generate()
+        self.assertEqual(len(first), 60)
+        self.assertTrue(User.objects.filter(email='bench-seller-1@fixtures.nokshibox.test', role='seller').exists())
+        buyer = User.objects.get(email='bench-buyer-0@fixtures.nokshibox.test')
+        self.assertTrue(buyer.check_password('bench-pass-123'))
+        self.assertEqual(aggregates.differences(), [])
+        # The search index is rebuilt after the bulk load suspends its trigger.
+        self.assertContains(self.client.get(reverse('search'), {'q': first[0][0]}), first[0][0])
+        with self.assertRaises(CommandError):
+            self.generate()
+
+        Product.objects.all().delete()
+        User.objects.all().delete()
+        Category.objects.all().delete()
+        self.assertEqual(self.generate(), first)
@@ -0,0 +1,120 @@
+import os
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from .http_cache import product_keys, purge_keys
+from .jobs import enqueue, job
+
+
+# Derivatives live beside the originals under thumbs/, e.g.
+#   media/product_images/candle.jpg -> thumbs/media/product_images/candle_320w.webp
+
+FORMAT_MIME_TYPES = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+}
+
+
+def available_formats():
+    return [fmt for fmt in settings.THUMBNAIL_FORMATS if features.check(fmt)]
+
+
+def derivative_name(name, width, fmt):
+    stem, _ = os.path.splitext(name)
+    return f"thumbs/{stem}_{width}w.{fmt}"
+
+
+def _is_fresh(storage, source_name, name):
+    if not storage.exists(name):
+        return False
+    try:
+        return storage.get_modified_time(name) >= storage.get_modified_time(source_name)
+    except NotImplementedError:
+        return True
+
+
+def generate_thumbnails(fieldfile, force=False):
+    """Write missing or stale derivatives of ``fieldfile``; return the names written."""
+    if not fieldfile or not fieldfile.name:
+        return []
+    storage, source_name = fieldfile.storage, fieldfile.name
+    targets = [
+        (width, fmt, derivative_name(source_name, width, fmt))
+        for width in settings.THUMBNAIL_WIDTHS
+        for fmt in available_formats()
+    ]
+    if not force:
+        targets = [t for t in targets if not _is_fresh(storage, source_name, t[2])]
+    if not targets:
+        return []
+
+    try:
+        with storage.open(source_name, 'rb') as source:
+            image = Image.open(source)
+            image.load()
+    except (FileNotFoundError, OSError):
+        return []
+
+    # exif_transpose applies the orientation tag; re-encoding then drops the
+    # rest of the EXIF block (camera data, GPS) from every derivative.
+    image = ImageOps.exif_transpose(image)
+    image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+    # A content-addressed storage would rename the derivative after its bytes.
+    save = getattr(storage, 'save_named', storage.save)
+    written = []
+    for width, fmt, name in targets:
+        resized = image.copy()
+        # thumbnail() never upscales, so small sources just get re-encoded.
+        resized.thumbnail((width, width * 4), Image.LANCZOS)
+        buffer = BytesIO()
+        resized.save(buffer, format=fmt.upper(), quality=settings.THUMBNAIL_QUALITY)
+        if storage.exists(name):
+            storage.delete(name)
+        written.append(save(name, ContentFile(buffer.getvalue())))
+    return written
+
+
+def refresh_pages_showing(model, field, name):
+    """Move on the cached cards, grids and pages that show ``name``, rendered before its derivatives existed.
+
+    Cards, grids and product pages are keyed on updated_at (see
+    api/fragments.py); the reverse proxy is purged as for an edit.
+    """
+    rows = model._default_manager.filter(**{field: name})
+    if model._meta.label_lower == 'api.product':
+        keys = {key for product in rows.only('pk', 'category_id', 'seller_id') for key in product_keys(product)}
+        rows.update(updated_at=timezone.now())
+    else:
+        keys = {f'seller-{pk}' for pk in rows.values_list('pk', flat=True)}
+    purge_keys(sorted(keys))
+
+
+@job('thumbnails.generate')
+def generate_thumbnails_job(model, pk, field):
+    instance = apps.get_model(model).objects.filter(pk=pk).only(field).first()
+    if instance is not None and generate_thumbnails(getattr(instance, field)):
+        # Blobs are shared: every row showing this image gains a srcset.
+        refresh_pages_showing(instance._meta.model, field, getattr(instance, field).name)
+
+
+def queue_thumbnails(instance, field):
+    """Hand thumbnail generation for ``instance.<field>`` to the job workers."""
+    if getattr(instance, field):
+        enqueue('thumbnails.generate', model=instance._meta.label_lower, pk=instance.pk, field=field)
+
+
+def srcset(fieldfile, fmt):
+    """``srcset`` value listing the derivatives of ``fieldfile`` that exist."""
+    storage = fieldfile.storage
+    candidates = []
+    for width in settings.THUMBNAIL_WIDTHS:
+        name = derivative_name(fieldfile.name, width, fmt)
+        if storage.exists(name):
+            candidates.append(f"{storage.url(name)} {width}w")
+    return ', '.join(candidates)
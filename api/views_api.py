@@ -0,0 +1,106 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import viewsets
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+from .models import Category, Product, User
+from .serializers import CategorySerializer, ProductSerializer, SellerSerializer
+
+
+class RecentCursorPagination(CursorPagination):
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class NameCursorPagination(RecentCursorPagination):
+    ordering = ('name',)
+
+
+class IdCursorPagination(RecentCursorPagination):
+    ordering = ('-id',)
+
+
+class ConditionalReadMixin:
+    """ETag/Last-Modified for list and detail responses.
+
+    Validators are computed from the rows' ids and ``updated_at`` before
+    serialization, so an unchanged page is answered with a bodyless 304
+    without paying for the serializer. Lists only get an ETag: a deleted
+    row changes a page without raising its newest ``updated_at``.
+    """
+
+    def validators(self, objects):
+        stamps = [(obj.pk, getattr(obj, 'updated_at', None)) for obj in objects]
+        digest = hashlib.md5(repr((self.request.get_full_path(), stamps)).encode()).hexdigest()
+        modified = [stamp for _, stamp in stamps if stamp is not None]
+        last_modified = int(max(modified).timestamp()) if modified else None
+        return f'"{digest}"', last_modified
+
+    def conditional(self, objects, build_response, use_last_modified=True):
+        etag, last_modified = self.validators(objects)
+        if not use_last_modified:
+            last_modified = None
+        not_modified = get_conditional_response(self.request._request, etag=etag, last_modified=last_modified)
+        response = not_modified or build_response()
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        return self.conditional(
+            page,
+            lambda: self.get_paginated_response(self.get_serializer(page, many=True).data),
+            use_last_modified=False,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        return self.conditional([instance], lambda: Response(self.get_serializer(instance).data))
+
+
+class ProductViewSet(ConditionalReadMixin, viewsets.ReadOnlyModelViewSet):
+    serializer_class = ProductSerializer
+    pagination_class = RecentCursorPagination
+
+    def get_queryset(self):
+        products = Product.objects.all()
+        requested = self.request.query_params.get('fields')
+        fields = set(requested.split(',')) if requested else None
+        # Join only the relations the requested fields actually read.
+        related = [name for name in ('category', 'seller') if fields is None or f'{name}_name' in fields]
+        if related:
+            products = products.select_related(*related)
+
+        params = self.request.query_params
+        if params.get('category', '').isdigit():
+            products = products.filter(category_id=params['category'])
+        if params.get('seller', '').isdigit():
+            products = products.filter(seller_id=params['seller'])
+        return products
+
+
+class CategoryViewSet(ConditionalReadMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Category.objects.all()
+    serializer_class = CategorySerializer
+    pagination_class = NameCursorPagination
+
+
+class SellerViewSet(ConditionalReadMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = User.objects.filter(role='seller', is_active=True)
+    serializer_class = SellerSerializer
+    pagination_class = IdCursorPagination
+
+    def validators(self, objects):
+        # Users carry no updated_at; derive the ETag from the public fields.
+        etag = hashlib.md5(repr((self.request.get_full_path(), [
+            (u.pk, u.full_name, str(u.photo), u.facebook_link) for u in objects
+        ])).encode()).hexdigest()
+        return f'"{etag}"', None
@@ -1,33 +1,132 @@
+import os
+import uuid
+import zipfile
+
+from asgiref.sync import sync_to_async
 from django.contrib import messages
-from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth import authenticate, login, logout
+from django.core.paginator import Paginator
+from django.http import Http404, JsonResponse
+from django.views.decorators.clickjacking import xframe_options_sameorigin
+from django.views.decorators.http import require_POST
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
+from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
-from .models import Product, Category, User
+from .models import CatalogAggregate, Product, Category, User
 from .forms import UserSignupForm, UserLoginForm, ProductForm, EditProfileForm, CategoryForm
+from . import aggregates
+from .backends import authenticate
+from .db_routing import read_only
+from .fragments import acached_grid, catalog_state, render_product_grid
+from .http_cache import catalog_page, product_page, profile_page, static_page
+from .importer import FORMATS, upload_storage
+from .jobs import enqueue
+from .moderation import bulk_deactivate, bulk_delete
+from .pagination import akeyset_page, normalize_cursor
+from .search import search_products
+from django.utils.http import urlencode
 from django.utils.http import url_has_allowed_host_and_scheme
 from django.conf import settings
+from django.db import transaction
 
 
 # home page
+@static_page('home.html')
 def home(request):
     return render(request, 'home.html')
 
+@static_page('about.html')
 def about(request):
     return render(request, 'about.html')
 
+@static_page('contact.html')
 def contact(request):
     return render(request, 'contact.html')
 
-def product(request):
-    products = Product.objects.all()
-    categories = Category.objects.all()
-    return render(request, 'products.html', {'products': products, 'categories': categories})
+# The catalog, detail and profile views are async so ASGI serves them on the
+# event loop. Queries run through the async ORM; template rendering is
+# blocking work (the {% cache %} tag, storage.exists() in responsive_image)
+# and goes through _arender, which runs it in the sync thread.
+async def _load_user(request):
+    request.user = await request.auser()
+
+
+_arender = sync_to_async(render)
+
+
+def _count_products(categories, counts):
+    """Set each category's product_count from the aggregate ``counts``; return the total."""
+    for category in categories:
+        category.product_count = counts.get(category.id, 0)
+    return sum(counts.values())
+
+
+# Shared catalog listing: filtered by ?category=<id>, paged by ?cursor=<token>
+async def _catalog_context(request):
+    category_filter = request.GET.get('category')
+    if not (category_filter and category_filter.isdigit()):
+        category_filter = None
+    # Cache keys use the canonical cursor, so each page has one entry.
+    raw_cursor = request.GET.get('cursor')
+    cursor = normalize_cursor(raw_cursor)
+
+    async def build_page():
+        products = Product.objects.all()
+        if category_filter:
+            products = products.filter(category_id=category_filter)
+        page, next_cursor = await akeyset_page(products, cursor, settings.CATALOG_PAGE_SIZE)
+        return await sync_to_async(render_product_grid)(page), next_cursor
+
+    await _load_user(request)
+    if raw_cursor and cursor is None:
+        # Not one of ours: served as the first page, but never cached.
+        grid_html, next_cursor = await build_page()
+    else:
+        # Already read by catalog_validators unless the request is logged in.
+        state = getattr(request, 'catalog_state', None) or await sync_to_async(catalog_state)()
+        grid_html, next_cursor = await acached_grid(state, category_filter, cursor, build_page)
+    base_query = {'category': category_filter} if category_filter else {}
+    categories = [category async for category in Category.objects.all()]
+    return {
+        'grid_html': grid_html,
+        'categories': categories,
+        'total_count': _count_products(categories, await aggregates.acounts('category')),
+        'category_filter': category_filter,
+        'next_cursor': next_cursor,
+        'first_url': f"?{urlencode(base_query)}" if cursor else None,
+        'next_url': f"?{urlencode({**base_query, 'cursor': next_cursor})}" if next_cursor else None,
+    }
+
+
+@read_only
+@catalog_page
+async def product(request):
+    return await _arender(request, 'products.html', await _catalog_context(request))
 
 # Landing page for buyer or unregistered user
-def buyer_home(request):
-    products = Product.objects.all()
-    categories = Category.objects.all()
-    return render(request, 'buyer_home.html', {'products': products, 'categories': categories})
+@read_only
+@catalog_page
+async def buyer_home(request):
+    return await _arender(request, 'buyer_home.html', await _catalog_context(request))
+
+
+# Server-side product search, ranked by relevance
+@read_only
+def search(request):
+    query = request.GET.get('q', '').strip()
+    page = request.GET.get('page', '1')
+    page = int(page) if page.isdigit() and int(page) > 0 else 1
+    per_page = settings.CATALOG_PAGE_SIZE
+
+    results = search_products(query, (page - 1) * per_page, per_page + 1) if query else []
+    categories = list(Category.objects.all())
+    return render(request, 'products.html', {
+        'grid_html': render_product_grid(results[:per_page], f'No products match "{query}".'),
+        'categories': categories,
+        'total_count': _count_products(categories, aggregates.counts('category')),
+        'search_query': query,
+        'first_url': f"?{urlencode({'q': query})}" if page > 1 else None,
+        'next_url': f"?{urlencode({'q': query, 'page': page + 1})}" if len(results) > per_page else None,
+    })
 
 
 # Signup page
@@ -95,7 +194,7 @@ def seller_home(request):
     else:
         form = ProductForm()
 
-    my_products = Product.objects.filter(seller=request.user)
+    my_products = Product.objects.filter(seller=request.user).order_by('-created_at')
 
     # Pass the logged-in user's profile for navbar
     return render(request, 'seller_home.html', {
@@ -105,9 +204,36 @@ def seller_home(request):
     })
 
 
-def product_detail(request, pk):
-    product = get_object_or_404(Product, pk=pk)
-    return render(request, 'product_detail.html', {'product': product})
+@login_required
+@require_POST
+def seller_import(request):
+    """Queue an import of the uploaded ``products`` file, with images from an optional ``images`` zip."""
+    if request.user.role != 'seller':
+        return JsonResponse({'error': 'Only sellers can import products.'}, status=403)
+    upload = request.FILES.get('products')
+    images = request.FILES.get('images')
+    fmt = FORMATS.get(os.path.splitext(upload.name)[1].lower()) if upload else None
+    if fmt is None:
+        return JsonResponse({'error': f"Upload a products file ({', '.join(FORMATS)})."}, status=400)
+    if images and not zipfile.is_zipfile(images):
+        return JsonResponse({'error': 'Images must be uploaded as a zip file.'}, status=400)
+
+    storage = upload_storage()
+    folder = f'{request.user.pk}/{uuid.uuid4().hex}'
+    queued = enqueue(
+        'catalog.import', seller_id=request.user.pk, fmt=fmt,
+        source=storage.save(f'{folder}/{os.path.basename(upload.name)}', upload),
+        images=storage.save(f'{folder}/images.zip', images) if images else None,
+    )
+    return JsonResponse({'job': queued.pk if queued else None, 'status': 'queued' if queued else 'done'}, status=202)
+
+
+@read_only
+@product_page
+async def product_detail(request, pk):
+    product = await aget_object_or_404(Product.objects.select_related('seller'), pk=pk)
+    await _load_user(request)
+    return await _arender(request, 'product_detail.html', {'product': product})
 
 
 @login_required
@@ -132,13 +258,20 @@ def delete_product(request, pk):
     return render(request, 'confirm_delete.html', {'product': product})
 
 
-def profile(request, pk):
-    user = get_object_or_404(User, pk=pk)
-    user_products = Product.objects.filter(seller=user) if user.role == 'seller' else []
+@read_only
+@profile_page
+async def profile(request, pk):
+    user = await aget_object_or_404(User, pk=pk)
+    user_products, stats = [], None
+    if user.role == 'seller':
+        user_products = [p async for p in Product.objects.filter(seller=user).order_by('-created_at')]
+        stats = await CatalogAggregate.objects.filter(scope='seller', key=user.pk).afirst()
+    await _load_user(request)
     is_owner = request.user.is_authenticated and request.user.pk == user.pk
-    return render(request, 'profile.html', {
+    return await _arender(request, 'profile.html', {
         'user_profile': user,
         'products': user_products,
+        'stats': stats,
         'is_owner': is_owner
     })
 
@@ -204,31 +337,49 @@ def forget_password_verify(request):
 
 
 # ---------------- ADMIN DASHBOARD ----------------
-def admin_dashboard(request):
-    if not request.user.is_authenticated or not request.user.is_staff:
-        return redirect('admin_login')
+def _admin_users(params):
+    users = User.objects.order_by('-id')
+    if params.get("role") in ["buyer", "seller"]:
+        users = users.filter(role=params["role"])
+    if params.get("user_email"):
+        users = users.email_prefix(params["user_email"])
+    return users
 
-    users = User.objects.all()
-    products = Product.objects.all()
-    categories = Category.objects.all()
 
-    # User filters
-    role_filter = request.GET.get("role")
-    if role_filter in ["buyer", "seller"]:
-        users = users.filter(role=role_filter)
+def _admin_products(params):
+    # -id breaks ties between rows listed in the same instant (bulk imports),
+    # which would otherwise move between pages.
+    products = Product.objects.select_related('seller', 'category').order_by('-created_at', '-id')
+    if (params.get("category") or '').isdigit():
+        products = products.filter(category_id=params["category"])
+    if params.get("seller_email"):
+        products = products.filter(seller__in=User.objects.email_prefix(params["seller_email"]))
+    return products
 
-    user_email_filter = request.GET.get("user_email")
-    if user_email_filter:
-        users = users.filter(email__icontains=user_email_filter)
 
-    # Product filters
-    category_filter = request.GET.get("category")
-    if category_filter:
-        products = products.filter(category_id=category_filter)
+def _admin_categories(params):
+    return Category.objects.order_by('name')
 
-    seller_email_filter = request.GET.get("seller_email")
-    if seller_email_filter:
-        products = products.filter(seller__email__icontains=seller_email_filter)
+
+# section name -> (queryset builder, page parameter, filter parameters, JSON fields)
+ADMIN_SECTIONS = {
+    'users': (_admin_users, 'users_page', ('role', 'user_email'), ('id', 'email', 'full_name', 'role', 'is_active')),
+    'products': (_admin_products, 'products_page', ('category', 'seller_email'), ('id', 'title', 'price', 'seller__email', 'category__name')),
+    'categories': (_admin_categories, 'categories_page', (), ('id', 'name', 'description')),
+}
+
+
+def _admin_querystring(params, **updates):
+    query = params.copy()
+    for key, value in updates.items():
+        query[key] = value
+    return '?' + query.urlencode()
+
+
+@read_only
+def admin_dashboard(request):
+    if not request.user.is_authenticated or not request.user.is_staff:
+        return redirect('admin_login')
 
     # Add new category
     if request.method == "POST":
@@ -239,18 +390,100 @@ def admin_dashboard(request):
     else:
         form = CategoryForm()
 
-    return render(request, 'admin_dashboard.html', {
-        'users': users,
-        'products': products,
-        'categories': categories,
-        'form': form,
-        'role_filter': role_filter,
-        'user_email_filter': user_email_filter,
-        'category_filter': category_filter,
-        'seller_email_filter': seller_email_filter,
+    # The sections are fetched separately from admin_section so the shell
+    # renders without touching the user or product tables. Without
+    # JavaScript each one is framed instead, with the same query string.
+    return render(request, 'admin_dashboard.html', {'form': form})
+
+
+@read_only
+@xframe_options_sameorigin
+def admin_section(request, section):
+    if not request.user.is_authenticated or not request.user.is_staff:
+        return redirect('admin_login')
+    if section not in ADMIN_SECTIONS:
+        raise Http404("Unknown dashboard section")
+
+    build, page_param, filter_params, fields = ADMIN_SECTIONS[section]
+    paginator = Paginator(build(request.GET), settings.ADMIN_PAGE_SIZE)
+    if section == 'products' and not request.GET.get('seller_email'):
+        # Precomputed: skips a COUNT(*) over the product table.
+        category = request.GET.get('category') or ''
+        paginator.count = aggregates.count('category', int(category)) if category.isdigit() else aggregates.count('all')
+    page = paginator.get_page(request.GET.get(page_param))
+    if section == 'categories':
+        counts = aggregates.counts('category')
+        for category in page:
+            category.product_count = counts.get(category.id, 0)
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'section': section,
+            'count': paginator.count,
+            'page': page.number,
+            'num_pages': paginator.num_pages,
+            'results': list(page.object_list.values(*fields)),
+        })
+
+    return render(request, f'_admin_{section}.html', {
+        'page': page,
+        'section': section,
+        'categories': Category.objects.order_by('name') if section == 'products' else None,
+        'filters': request.GET,
+        'current_filters': [
+            (key, value) for key, values in request.GET.lists() for value in values
+            if key in filter_params and value
+        ],
+        # Other sections' state, carried through this section's filter form
+        'preserved_filters': [
+            (key, value) for key, values in request.GET.lists() for value in values
+            if key not in (page_param, 'format', *filter_params)
+        ],
+        'prev_query': _admin_querystring(request.GET, **{page_param: page.previous_page_number()}) if page.has_previous() else None,
+        'next_query': _admin_querystring(request.GET, **{page_param: page.next_page_number()}) if page.has_next() else None,
     })
 
 
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+@require_POST
+def admin_bulk(request):
+    """Bulk delete/deactivate the posted ``ids``, or everything matching the posted filters."""
+    sections = {'user': 'users', 'product': 'products', 'category': 'categories'}
+    model = request.POST.get('model', '')
+    action = request.POST.get('action')
+    if model not in sections or action not in ('delete', 'deactivate'):
+        return JsonResponse({'error': 'Unknown model or action.'}, status=400)
+
+    build, _, filter_params, _ = ADMIN_SECTIONS[sections[model]]
+    queryset = build(request.POST)
+    expected = None
+    if request.POST.get('scope') != 'filtered':
+        ids = [pk.strip() for value in request.POST.getlist('ids') for pk in value.split(',') if pk.strip().isdigit()]
+        if not ids:
+            return JsonResponse({'error': 'Select rows, or set scope=filtered to act on every match.'}, status=400)
+        queryset = queryset.filter(pk__in=ids)
+    else:
+        # Acting on a whole table is never a filtered action: with no filter
+        # set, a category delete would cascade to every product.
+        if not any(request.POST.get(param) for param in filter_params):
+            return JsonResponse({'error': 'Set a filter before acting on every match.'}, status=400)
+        expected = request.POST.get('expected', '')
+        if not expected.isdigit():
+            return JsonResponse({'error': 'Confirm the number of matching rows in expected.'}, status=400)
+        expected = int(expected)
+
+    try:
+        result = (bulk_delete(queryset, expected=expected) if action == 'delete'
+                  else bulk_deactivate(queryset, expected=expected))
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    if request.headers.get('Accept') == 'application/json':
+        return JsonResponse(result)
+    return redirect('admin_dashboard')
+
+
 @login_required
 @user_passes_test(lambda u: u.is_staff)
 def delete_entry(request, model, pk):
@@ -265,7 +498,9 @@ def delete_entry(request, model, pk):
         return redirect('admin_dashboard')
 
     obj = get_object_or_404(Model, pk=pk)
-    obj.delete()
+    # A category or seller takes its products with it.
+    with transaction.atomic(), aggregates.deferred_removals():
+        obj.delete()
     return redirect('admin_dashboard')
 
 
@@ -23,7 +23,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'django-insecure-fna3hj5va@%fh4pc!xc=3cdo7gcw0xool2^x74)vumf_y9q3kc'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get('DJANGO_DEBUG', '1') == '1'
 
 ALLOWED_HOSTS = ['192.168.0.101', '127.0.0.1']
 
@@ -31,8 +31,90 @@ LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'   # after login, go here by default
 LOGOUT_REDIRECT_URL = '/'  # optional, after logout
 
+# 'asgi' when loaded through nokshibox/asgi.py (uvicorn and the like)
+SERVER_INTERFACE = os.environ.get('SERVER_INTERFACE', 'wsgi')
+
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', os.path.join(BASE_DIR, 'media'))
+
+# Who sends media files (see api/media.py): 'django', 'x-sendfile',
+# 'x-accel-redirect', or 'off' when the front-end serves MEDIA_URL itself.
+# 'django' relies on wsgi.file_wrapper's sendfile, so it is WSGI only.
+MEDIA_SERVE_MODE = os.environ.get('MEDIA_SERVE_MODE', 'x-accel-redirect' if SERVER_INTERFACE == 'asgi' else 'django')
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'  # nginx internal location aliasing MEDIA_ROOT
+MEDIA_MAX_AGE = 24 * 60 * 60  # thumbnails and pre-hash uploads; hashed blobs are immutable
+# Shared blobs written or reused this recently are not deleted yet (api/storage.py)
+MEDIA_RELEASE_GRACE = 10 * 60
+
+# Responsive derivatives generated for Product.image and User.photo
+THUMBNAIL_WIDTHS = (320, 640, 960)
+THUMBNAIL_FORMATS = ('avif', 'webp')  # formats Pillow can't encode are skipped
+THUMBNAIL_QUALITY = 75
+
+# Background jobs (api/jobs.py); run workers with 'manage.py run_workers'
+JOBS_EAGER = False           # run handlers inline instead of queueing
+JOBS_MAX_ATTEMPTS = 5
+JOBS_LOCK_TIMEOUT = 600      # seconds before a crashed worker's job is retried
+JOBS_POLL_INTERVAL = 1.0
+JOBS_KEEP_DONE = 24 * 60 * 60
+
+# Bulk product import (api/importer.py, 'manage.py import_products').
+# Uploaded files wait in IMPORT_WORK_DIR for a worker on the same host.
+IMPORT_BATCH_SIZE = 1000
+IMPORT_IMAGE_WORKERS = min(8, os.cpu_count() or 1)
+IMPORT_WORK_DIR = os.environ.get('IMPORT_WORK_DIR', os.path.join(BASE_DIR, 'imports'))
+
+# Caches. 'fragments' holds rendered catalog HTML (api/fragments.py). It is
+# an in-process LRU by default; set FRAGMENT_CACHE_REDIS_URL to share it
+# between worker processes.
+FRAGMENT_CACHE_ALIAS = 'fragments'
+FRAGMENT_CACHE_TIMEOUT = 24 * 60 * 60
+FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', 5000))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fragments',
+        'TIMEOUT': FRAGMENT_CACHE_TIMEOUT,
+        'OPTIONS': {'MAX_ENTRIES': FRAGMENT_CACHE_SIZE, 'CULL_FREQUENCY': 10},
+    },
+}
+if os.environ.get('FRAGMENT_CACHE_REDIS_URL'):
+    CACHES['fragments'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['FRAGMENT_CACHE_REDIS_URL'],
+        'TIMEOUT': FRAGMENT_CACHE_TIMEOUT,
+        'KEY_PREFIX': 'nokshibox',
+    }
+
+# Session user rows cached by api.backends.EmailBackend.get_user. Only on a
+# cache shared by every worker: a save invalidates the row everywhere,
+# whereas an in-process cache would let other workers keep a deactivated
+# user or an old password hash. None turns the cache off.
+USER_CACHE_ALIAS = FRAGMENT_CACHE_ALIAS if os.environ.get('FRAGMENT_CACHE_REDIS_URL') else None
+USER_CACHE_TIMEOUT = 60
+
+# Products per catalog page (products/ and buyer/ views)
+CATALOG_PAGE_SIZE = 24
+
+# Rows per page in each admin dashboard section
+ADMIN_PAGE_SIZE = 25
+
+# HTTP caching of public pages for anonymous visitors (see api/http_cache.py).
+# Responses carry Surrogate-Key tags; with SURROGATE_PURGE_URL set, a PURGE
+# naming the affected keys is sent there whenever a product or category changes.
+HTTP_CACHE_MAX_AGE = 60                 # browsers revalidate catalog pages quickly
+HTTP_CACHE_S_MAXAGE = 24 * 60 * 60      # the proxy holds them until purged
+HTTP_CACHE_STATIC_MAX_AGE = 60 * 60     # home/about/contact only change on deploy
+SURROGATE_KEY_HEADER = 'Surrogate-Key'
+SURROGATE_PURGE_URL = os.environ.get('SURROGATE_PURGE_URL', '')
+SURROGATE_PURGE_HEADER = os.environ.get('SURROGATE_PURGE_HEADER', 'Surrogate-Key')
+
+# Product search engine; DatabaseSearchBackend works on any database
+PRODUCT_SEARCH_BACKEND = 'api.search.SQLiteFTSBackend'
 
 
 # Application definition
@@ -50,7 +132,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'api.db_routing.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -64,7 +148,7 @@ ROOT_URLCONF = 'nokshibox.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'api.instrumentation.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -90,10 +174,57 @@ WSGI_APPLICATION = 'nokshibox.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
     }
 }
 
+# SQLITE_PROFILE=production tunes every connection for concurrent workers:
+# WAL so readers never block on the writer, synchronous=NORMAL (durable
+# across application crashes; the last commits may be lost on power loss),
+# memory-mapped reads, and BEGIN IMMEDIATE so a write transaction takes
+# the single write lock up front. Writers then queue on the busy timeout
+# instead of failing with "database is locked" when a read lock can't be
+# upgraded. Compare profiles with testing/bench_sqlite.py.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'busy_timeout': 20000,          # ms; matches 'timeout' below
+    'temp_store': 'MEMORY',
+    'cache_size': -32000,           # KiB
+}
+SQLITE_PRODUCTION_OPTIONS = {
+    'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+    'transaction_mode': 'IMMEDIATE',
+    'timeout': 20,
+}
+if os.environ.get('SQLITE_PROFILE') == 'production':
+    DATABASES['default']['OPTIONS'] = SQLITE_PRODUCTION_OPTIONS
+
+# Keep connections open between requests and check them before reuse.
+# Not under ASGI: the async ORM runs queries on executor threads that
+# request_finished never cleans up, so persistent connections pile up
+# there. Set CONN_MAX_AGE to opt in anyway.
+DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('CONN_MAX_AGE', 0 if SERVER_INTERFACE == 'asgi' else 60))
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# Read replicas (see api/db_routing.py): DATABASE_REPLICA_PATHS is a
+# comma-separated list of SQLite files kept in sync with the primary
+# (litestream, rsync of a WAL checkpoint, ...). A Postgres replica is an
+# entry in DATABASES with its alias appended to DATABASE_REPLICAS.
+DATABASE_REPLICAS = []
+for index, path in enumerate(p for p in os.environ.get('DATABASE_REPLICA_PATHS', '').split(',') if p):
+    DATABASES[f'replica{index}'] = {**DATABASES['default'], 'NAME': path, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{index}')
+DATABASE_ROUTERS = ['api.db_routing.ReplicaRouter']
+REPLICA_PIN_SECONDS = 10    # read-your-writes window after a POST
+
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.AllowAny'],
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -142,3 +273,34 @@ AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
     'api.backends.EmailBackend',
 ]
+
+# Which backend api.backends.authenticate sends each credential type to
+AUTH_CREDENTIAL_BACKENDS = {
+    'email': 'api.backends.EmailBackend',
+    'username': 'django.contrib.auth.backends.ModelBackend',
+}
+
+# Password hashing cost, tunable per deployment (see api/hashers.py). Set
+# PASSWORD_HASHER=argon2 (needs argon2-cffi) to hash new and upgraded
+# passwords with Argon2id. Existing hashes are upgraded on the next login.
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 870000))
+PASSWORD_ARGON2_TIME_COST = int(os.environ.get('PASSWORD_ARGON2_TIME_COST', 2))
+PASSWORD_ARGON2_MEMORY_KIB = int(os.environ.get('PASSWORD_ARGON2_MEMORY_KIB', 64 * 1024))
+PASSWORD_ARGON2_PARALLELISM = int(os.environ.get('PASSWORD_ARGON2_PARALLELISM', 2))
+PASSWORD_HASHERS = [
+    'api.hashers.PBKDF2PasswordHasher',
+    'api.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+if os.environ.get('PASSWORD_HASHER') == 'argon2':
+    PASSWORD_HASHERS.insert(0, PASSWORD_HASHERS.pop(1))
+
+# Per-request instrumentation (api/instrumentation.py). A sampled request
+# that runs longer than the threshold is logged with its slowest SQL.
+INSTRUMENTATION_SLOW_SECONDS = float(os.environ.get('INSTRUMENTATION_SLOW_SECONDS', 0.5))
+INSTRUMENTATION_TRACE_SAMPLE_RATE = float(os.environ.get('INSTRUMENTATION_TRACE_SAMPLE_RATE', 0.1))
+INSTRUMENTATION_TRACE_QUERIES = 10
+
+# Clients allowed to scrape /metrics/ without a staff login
+METRICS_ALLOWED_IPS = [ip for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip]
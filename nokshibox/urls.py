@@ -15,9 +15,16 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.conf import settings
-from django.urls import path
-from api import views_templates
-from django.conf.urls.static import static
+from django.urls import include, path
+from rest_framework.routers import DefaultRouter
+from api import views_api, views_templates
+from api.media import serve_media
+from api.metrics import metrics_view
+
+api_v1 = DefaultRouter()
+api_v1.register('products', views_api.ProductViewSet, basename='product')
+api_v1.register('categories', views_api.CategoryViewSet, basename='category')
+api_v1.register('sellers', views_api.SellerViewSet, basename='seller')
 
 urlpatterns = [
     # Template views
@@ -26,10 +33,12 @@ urlpatterns = [
     path('contact/', views_templates.contact, name='contact'),
     path('products/', views_templates.product, name='products'),
     path('buyer/', views_templates.buyer_home, name='buyer_home'),
+    path('search/', views_templates.search, name='search'),
     path('signup/', views_templates.signup_view, name='signup'),
     path('login/', views_templates.login_view, name='login'),
     path('logout/', views_templates.logout_view, name='logout'),
     path('seller/', views_templates.seller_home, name='seller_home'),
+    path('seller/import/', views_templates.seller_import, name='seller_import'),
     path('product/<int:pk>/', views_templates.product_detail, name='product_detail'),
     path('profile/<int:pk>/', views_templates.profile, name='profile'),
     path('profile/<int:pk>/edit/', views_templates.edit_profile, name='edit_profile'),
@@ -38,12 +47,20 @@ urlpatterns = [
     path('forget-password/', views_templates.forget_password_request, name='forget_password_request'),
     path('forget-password/verify/', views_templates.forget_password_verify, name='forget_password_verify'),
     path('admin/', views_templates.admin_dashboard, name='admin_dashboard'),
+    path('admin/section/<str:section>/', views_templates.admin_section, name='admin_section'),
     path('admin/login/', views_templates.admin_login, name='admin_login'),
     path('admin/logout/', views_templates.admin_logout, name='admin_logout'),
     path('admin/delete/<str:model>/<int:pk>', views_templates.delete_entry, name='delete_entry'),
+    path('admin/bulk/', views_templates.admin_bulk, name='admin_bulk'),
+
+    # JSON read API
+    path('api/v1/', include((api_v1.urls, 'api_v1'))),
+
+    # Prometheus scrape endpoint
+    path('metrics/', metrics_view, name='metrics'),
 
 ]
 
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+if settings.MEDIA_SERVE_MODE != 'off':
+    urlpatterns += [path(f"{settings.MEDIA_URL.lstrip('/')}<path:path>", serve_media, name='media')]
\ No newline at end of file
@@ -0,0 +1,178 @@
+# bench_media.py
+
+"""
+Throughput of the media serving path (api/media.py) for one server worker.
+
+Random files of each --sizes are written as content-addressed blobs into a
+temporary MEDIA_ROOT. One server process is started on it and --clients
+threads fetch them for --duration seconds per scenario:
+
+  whole       GET the file; with gunicorn this goes out through os.sendfile
+  range       GET a random --range-kb slice with a Range header
+  revalidate  GET with If-None-Match, answered 304 without a body
+
+Reported per scenario and size: requests/s, MB/s of body served (the figure
+per worker, as there is one) and latency percentiles. The clients are
+Python threads on the same machine; with small files they, not the server,
+may be the limit, so compare runs made on the same host.
+
+    python testing/bench_media.py --sizes 64k,1m,16m
+    python testing/bench_media.py --mode x-accel-redirect
+
+The default server is gunicorn (gthread, one worker), the WSGI deployment
+the 'django' mode is meant for: its wsgi.file_wrapper sends whole files
+with os.sendfile. --server runserver measures Django's development server,
+which copies every file through Python.
+
+With --mode x-sendfile or x-accel-redirect no front-end is involved, so the
+run measures only what Django adds before handing the file over.
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+from loadtest import percentile
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+UPLOAD_DIR = 'media/product_images'  # Product.image's upload_to
+SCENARIOS = ('whole', 'range', 'revalidate')
+
+
+def parse_size(text):
+    units = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+    text = text.strip().lower()
+    if text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def write_blob(media_root, size, rng):
+    """Store ``size`` random bytes the way ContentAddressedStorage names them; return the URL path."""
+    data = rng.randbytes(size)
+    digest = hashlib.sha256(data).hexdigest()
+    path = Path(media_root, UPLOAD_DIR, digest[:2], f'{digest}.bin')
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return f'/media/{UPLOAD_DIR}/{digest[:2]}/{digest}.bin'
+
+
+def serve(server, port, clients, env):
+    if server == 'gunicorn':
+        command = ['gunicorn', 'nokshibox.wsgi', '--bind', f'127.0.0.1:{port}', '--workers', '1',
+                   '--worker-class', 'gthread', '--threads', str(clients)]
+    else:
+        command = [sys.executable, str(BASE_DIR / 'manage.py'), 'runserver', f'127.0.0.1:{port}', '--noreload']
+    process = subprocess.Popen(command, cwd=BASE_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        try:
+            requests.get(base_url + '/media/', timeout=1)
+            return process, base_url
+        except requests.RequestException:
+            time.sleep(0.1)
+    process.terminate()
+    raise SystemExit(f"The {server} server on port {port} did not start.")
+
+
+def client(url, scenario, size, range_bytes, deadline, seed, results, lock):
+    rng = random.Random(seed)
+    session = requests.Session()
+    etag = session.head(url).headers['ETag']
+    latencies, served, errors = [], 0, 0
+    while time.perf_counter() < deadline:
+        headers = {}
+        if scenario == 'range':
+            start = rng.randrange(max(1, size - range_bytes))
+            headers['Range'] = f'bytes={start}-{start + range_bytes - 1}'
+        elif scenario == 'revalidate':
+            headers['If-None-Match'] = etag
+        started = time.perf_counter()
+        try:
+            response = session.get(url, headers=headers)
+            body = response.content
+        except requests.RequestException:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+        if response.status_code not in (200, 206, 304):
+            errors += 1
+        served += len(body)
+    with lock:
+        results['latencies'] += latencies
+        results['bytes'] += served
+        results['errors'] += errors
+
+
+def measure(url, scenario, size, args):
+    results = {'latencies': [], 'bytes': 0, 'errors': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+    threads = [
+        threading.Thread(target=client, args=(url, scenario, size, args.range_kb * 1024, deadline,
+                                              args.seed + i, results, lock))
+        for i in range(args.clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies = sorted(results['latencies'])
+    return {
+        'rps': len(latencies) / args.duration,
+        'mb_s': results['bytes'] / args.duration / 1024 ** 2,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'errors': results['errors'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='64k,1m,16m', help="comma-separated file sizes, e.g. 64k,1m")
+    parser.add_argument('--server', choices=('gunicorn', 'runserver'), default='gunicorn')
+    parser.add_argument('--mode', choices=('django', 'x-sendfile', 'x-accel-redirect'), default='django',
+                        help="MEDIA_SERVE_MODE for the server")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--clients', type=int, default=4, help="concurrent connections")
+    parser.add_argument('--range-kb', type=int, default=256, help="slice size of the range scenario")
+    parser.add_argument('-d', '--duration', type=float, default=10.0, help='seconds per scenario and size')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-media-')
+    rng = random.Random(args.seed)
+    sizes = [parse_size(size) for size in args.sizes.split(',')]
+    urls = {size: write_blob(workdir, size, rng) for size in sizes}
+    env = {**os.environ, 'MEDIA_ROOT': workdir, 'MEDIA_SERVE_MODE': args.mode,
+           'SQLITE_PATH': os.path.join(workdir, 'bench.sqlite3')}
+    server, base_url = serve(args.server, args.port, args.clients, env)
+    try:
+        print(f"{args.clients} clients, {args.duration:.0f}s each, against one {args.server} worker "
+              f"in '{args.mode}' mode")
+        print(f"{'scenario':<12}{'size':>10}{'req/s':>10}{'MB/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+        for scenario in args.scenarios.split(','):
+            for size in sizes:
+                row = measure(base_url + urls[size], scenario, size, args)
+                print(f"{scenario:<12}{size:>10}{row['rps']:>10.1f}{row['mb_s']:>10.1f}"
+                      f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['errors']:>8}")
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+# bench_sqlite.py
+
+"""
+Mixed read/write throughput of the SQLite profiles with several processes.
+
+Each profile gets a fresh, migrated database file. N worker processes then
+hammer it for a fixed time: most iterations read a catalog page, the rest
+run a write transaction that reads a category and inserts a product, the
+read-then-write shape of a seller upload. Reported per profile: reads/s,
+writes/s and how many operations failed with "database is locked".
+
+    python testing/bench_sqlite.py --workers 8 --duration 20
+
+Profiles are the values of SQLITE_PROFILE understood by nokshibox/settings.py:
+"default" (bare sqlite3) and "production" (WAL, tuned pragmas, BEGIN IMMEDIATE).
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+PROFILES = ('default', 'production')
+
+
+def setup_django():
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nokshibox.settings')
+    import django
+    django.setup()
+
+
+def seed(products):
+    from django.core.management import call_command
+    from api.models import Category, Product, User
+
+    call_command('migrate', verbosity=0)
+    seller = User.objects.create_user('bench@example.com', 'Bench Seller', '01700000000', 'seller')
+    categories = [Category.objects.create(name=f'Category {i}') for i in range(10)]
+    Product.objects.bulk_create(
+        Product(title=f'Product {i}', details='Benchmark product', price='10.00', image='bench.jpg',
+                category=categories[i % len(categories)], seller=seller)
+        for i in range(products)
+    )
+
+
+def worker(duration, write_ratio, seed_value, queue):
+    setup_django()
+    from django.conf import settings
+    from django.db import OperationalError, transaction
+    from api.models import Category, Product, User
+    from api.pagination import keyset_page
+
+    rng = random.Random(seed_value)
+    seller = User.objects.get(email='bench@example.com')
+    category_ids = list(Category.objects.values_list('id', flat=True))
+    counts = {'reads': 0, 'writes': 0, 'locked': 0}
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        try:
+            if rng.random() < write_ratio:
+                with transaction.atomic():
+                    category = Category.objects.get(pk=rng.choice(category_ids))
+                    Product.objects.create(title='Upload', details='Benchmark upload', price='12.50',
+                                           image='bench.jpg', category=category, seller=seller)
+                counts['writes'] += 1
+            else:
+                products = Product.objects.filter(category_id=rng.choice(category_ids))
+                keyset_page(products, None, settings.CATALOG_PAGE_SIZE)
+                counts['reads'] += 1
+        except OperationalError as exc:
+            if 'locked' not in str(exc):
+                raise
+            counts['locked'] += 1
+    queue.put(counts)
+
+
+def run_profile(workers, duration, write_ratio, products):
+    """Runs in a child process whose environment selects the profile."""
+    setup_django()
+    seed(products)
+    from django.db import connection
+    connection.close()
+
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    processes = [context.Process(target=worker, args=(duration, write_ratio, i, queue)) for i in range(workers)]
+    for process in processes:
+        process.start()
+    totals = {'reads': 0, 'writes': 0, 'locked': 0}
+    for _ in processes:
+        for key, value in queue.get().items():
+            totals[key] += value
+    for process in processes:
+        process.join()
+    print(json.dumps(totals))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-w', '--workers', type=int, default=4)
+    parser.add_argument('-d', '--duration', type=float, default=10.0, help='seconds per profile')
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--products', type=int, default=5000, help='rows seeded before the run')
+    parser.add_argument('--profile', action='append', choices=PROFILES, dest='profiles')
+    parser.add_argument('--run', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_profile(args.workers, args.duration, args.write_ratio, args.products)
+        return
+
+    print(f"{args.workers} processes, {args.duration:.0f}s, {args.write_ratio:.0%} writes")
+    print(f"{'profile':<12}{'reads/s':>10}{'writes/s':>10}{'locked':>8}")
+    for profile in args.profiles or PROFILES:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {**os.environ, 'SQLITE_PROFILE': profile, 'SQLITE_PATH': os.path.join(tmp, 'bench.sqlite3')}
+            output = subprocess.run(
+                [sys.executable, __file__, '--run', '-w', str(args.workers), '-d', str(args.duration),
+                 '--write-ratio', str(args.write_ratio), '--products', str(args.products)],
+                env=env, check=True, capture_output=True, text=True,
+            ).stdout
+        totals = json.loads(output.strip().splitlines()[-1])
+        print(f"{profile:<12}{totals['reads'] / args.duration:>10.1f}"
+              f"{totals['writes'] / args.duration:>10.1f}{totals['locked']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,341 @@
+# benchmark.py
+
+"""
+Headless replay of the demo.py seller and buyer journeys as concurrent HTTP
+sessions, with per-endpoint throughput and latency percentiles.
+
+Every virtual user logs in through the real login form (CSRF included) as
+one of the bench-seller-N / bench-buyer-N accounts made by
+'manage.py generate_fixtures', then repeats its journey until time is up:
+
+  seller  seller home, create a product with an image, view it, edit its
+          price, view the seller profile, delete the product
+  buyer   buyer home, a category, a search, a product, its seller's
+          profile, the home and about pages
+
+The simplest run builds the dataset once, starts its own server on it and
+compares the result with the stored baseline for that dataset:
+
+    python testing/benchmark.py --dataset 100k --generate --serve
+    python testing/benchmark.py --dataset 100k --serve --save-baseline
+
+--serve starts gunicorn (gthread, one worker, a thread per virtual user)
+with DJANGO_DEBUG=0, so no SQL is recorded per query as under DEBUG; with
+--server runserver it measures Django's development server instead. The
+server and DEBUG setting are printed with the results and recorded with a
+baseline, so runs against different servers are not compared.
+
+Datasets are 1k, 100k and 1m products. Generated databases are kept in
+testing/data/ and reused. Without --serve the suite runs against --base-url,
+which must be serving the same dataset. The run exits with status 1 when an
+endpoint has errors, or its p95 latency or throughput is more than
+--tolerance worse than the baseline in testing/baselines.json. A baseline
+records the --sellers, --buyers, --duration and --seed it was made with;
+a run with different ones is not compared and exits with status 2.
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+from loadtest import percentile
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = BASE_DIR / 'testing' / 'data'
+BASELINES = BASE_DIR / 'testing' / 'baselines.json'
+IMAGE = BASE_DIR / 'testing' / 'assets' / 'candle.jpg'
+DATASETS = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+# Run options that change the load, so results are only comparable when they match.
+PARAMETERS = ('sellers', 'buyers', 'duration', 'seed', 'server', 'debug')
+# Keep in sync with api/management/commands/generate_fixtures.py.
+DOMAIN = 'fixtures.nokshibox.test'
+BENCH_PASSWORD = 'bench-pass-123'
+SEARCH_TERMS = ('candle', 'resin', 'lamp', 'basket', 'kantha', 'clay vase')
+
+
+class JourneyError(Exception):
+    pass
+
+
+class Session:
+    """One logged-in browser: a cookie jar, the CSRF token and latency samples."""
+
+    def __init__(self, base_url, rng):
+        self.base_url = base_url
+        self.rng = rng
+        self.http = requests.Session()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def request(self, label, method, path, expect=(200,), **kwargs):
+        if method == 'POST':
+            kwargs['data'] = {**kwargs.get('data', {}), 'csrfmiddlewaretoken': self.http.cookies.get('csrftoken', '')}
+            kwargs['headers'] = {'Referer': self.base_url + path}
+        started = time.perf_counter()
+        try:
+            response = self.http.request(method, self.base_url + path, allow_redirects=False, timeout=30, **kwargs)
+        except requests.RequestException as exc:
+            self.errors[label] += 1
+            raise JourneyError(f'{label}: {exc}') from None
+        elapsed = time.perf_counter() - started
+        if response.status_code not in expect:
+            self.errors[label] += 1
+            raise JourneyError(f'{label}: HTTP {response.status_code}')
+        self.latencies[label].append(elapsed)
+        return response
+
+    def login(self, email):
+        self.request('GET /login/', 'GET', '/login/')
+        self.request('POST /login/', 'POST', '/login/', expect=(302,),
+                     data={'email': email, 'password': BENCH_PASSWORD})
+
+    def pick(self, pattern, html, label):
+        found = re.findall(pattern, html)
+        if not found:
+            raise JourneyError(f'{label}: nothing matching {pattern!r}')
+        return self.rng.choice(found)
+
+
+def seller_journey(session, n):
+    home = session.request('GET /seller/', 'GET', '/seller/').text
+    category = session.pick(r'<option value="(\d+)"', home, 'GET /seller/')
+    profile = session.pick(r'href="/profile/(\d+)/"', home, 'GET /seller/')
+    with open(IMAGE, 'rb') as image:
+        session.request('POST /seller/', 'POST', '/seller/', expect=(302,), files={'image': image}, data={
+            'title': f'Benchmark candle {n}', 'details': 'Created by testing/benchmark.py',
+            'price': '15.99', 'category': category,
+        })
+    home = session.request('GET /seller/', 'GET', '/seller/').text
+    product = re.search(r'href="/product/(\d+)/edit/"', home)
+    if product is None:
+        raise JourneyError('POST /seller/: the new product is not listed')
+    product = product.group(1)
+    session.request('GET /product/<id>/', 'GET', f'/product/{product}/')
+    session.request('POST /product/<id>/edit/', 'POST', f'/product/{product}/edit/', expect=(302,), data={
+        'title': f'Benchmark candle {n}', 'details': 'Edited by testing/benchmark.py',
+        'price': '19.99', 'category': category,
+    })
+    session.request('GET /profile/<id>/', 'GET', f'/profile/{profile}/')
+    session.request('POST /product/<id>/delete/', 'POST', f'/product/{product}/delete/', expect=(302,))
+
+
+def buyer_journey(session, n):
+    home = session.request('GET /buyer/', 'GET', '/buyer/').text
+    category = session.pick(r'\?category=(\d+)"', home, 'GET /buyer/')
+    listing = session.request('GET /buyer/?category=', 'GET', f'/buyer/?category={category}').text
+    session.request('GET /search/', 'GET', '/search/', params={'q': session.rng.choice(SEARCH_TERMS)})
+    product = session.pick(r'href="/product/(\d+)/"', listing + home, 'GET /buyer/')
+    detail = session.request('GET /product/<id>/', 'GET', f'/product/{product}/').text
+    seller = session.pick(r'href="/profile/(\d+)/"', detail, 'GET /product/<id>/')
+    session.request('GET /profile/<id>/', 'GET', f'/profile/{seller}/')
+    session.request('GET /', 'GET', '/')
+    session.request('GET /about/', 'GET', '/about/')
+
+
+def virtual_user(base_url, role, index, deadline, seed):
+    session = Session(base_url, random.Random(seed))
+    journey = seller_journey if role == 'seller' else buyer_journey
+    failures = []
+    try:
+        session.login(f'bench-{role}-{index}@{DOMAIN}')
+    except JourneyError as exc:
+        failures.append(str(exc))
+        return session, failures
+    n = 0
+    while time.perf_counter() < deadline:
+        n += 1
+        try:
+            journey(session, f'{index}-{n}')
+        except JourneyError as exc:
+            failures.append(str(exc))
+    return session, failures
+
+
+def run(base_url, sellers, buyers, duration, seed):
+    deadline = time.perf_counter() + duration
+    users = [('seller', i) for i in range(sellers)] + [('buyer', i) for i in range(buyers)]
+    with ThreadPoolExecutor(max_workers=len(users)) as pool:
+        futures = [pool.submit(virtual_user, base_url, role, i, deadline, seed * 1000 + n)
+                   for n, (role, i) in enumerate(users)]
+        outcomes = [future.result() for future in futures]
+
+    latencies, errors, failures = defaultdict(list), defaultdict(int), []
+    for session, session_failures in outcomes:
+        for label, samples in session.latencies.items():
+            latencies[label].extend(samples)
+        for label, count in session.errors.items():
+            errors[label] += count
+        failures.extend(session_failures)
+    return summarize(latencies, errors, duration), failures
+
+
+def summarize(latencies, errors, duration):
+    results = {}
+    for label in sorted(set(latencies) | set(errors)):
+        samples = sorted(latencies[label])
+        results[label] = {
+            'requests': len(samples),
+            'errors': errors[label],
+            'rps': round(len(samples) / duration, 2),
+            'p50_ms': round(percentile(samples, 50) * 1000, 2),
+            'p95_ms': round(percentile(samples, 95) * 1000, 2),
+            'p99_ms': round(percentile(samples, 99) * 1000, 2),
+        }
+    return results
+
+
+def report(results, baseline):
+    print(f"{'endpoint':<28}{'requests':>9}{'errors':>7}{'rps':>8}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'p99 ms':>9}{'base p95':>10}")
+    for label, row in results.items():
+        base = baseline.get(label, {}).get('p95_ms')
+        print(f"{label:<28}{row['requests']:>9}{row['errors']:>7}{row['rps']:>8.1f}{row['p50_ms']:>9.1f}"
+              f"{row['p95_ms']:>9.1f}{base if base is not None else '-':>10}")
+
+
+def regressions(results, baseline, tolerance, floor_ms):
+    """Why the run is worse than ``baseline``; empty when it is not."""
+    problems = []
+    for label, row in results.items():
+        if row['errors']:
+            problems.append(f"{label}: {row['errors']} errors")
+    for label, base in baseline.items():
+        row = results.get(label)
+        if row is None:
+            problems.append(f"{label}: not exercised")
+            continue
+        # The floor keeps sub-millisecond jitter on fast pages from failing a run.
+        if row['p95_ms'] > base['p95_ms'] * (1 + tolerance) and row['p95_ms'] - base['p95_ms'] > floor_ms:
+            problems.append(f"{label}: p95 {row['p95_ms']:.1f} ms, baseline {base['p95_ms']:.1f} ms")
+        if row['rps'] < base['rps'] * (1 - tolerance):
+            problems.append(f"{label}: {row['rps']:.1f} rps, baseline {base['rps']:.1f} rps")
+    return problems
+
+
+def mismatches(params, baseline):
+    """How this run's ``params`` differ from those ``baseline`` was recorded with; empty when they match."""
+    recorded = baseline.get('params', {})
+    return [
+        f"--{name} {params[name]}, baseline {recorded.get(name, 'unrecorded')}"
+        for name in PARAMETERS if recorded.get(name) != params[name]
+    ]
+
+
+def load_baselines():
+    return json.loads(BASELINES.read_text()) if BASELINES.exists() else {}
+
+
+def database_path(dataset):
+    return DATA_DIR / f'bench-{dataset}.sqlite3'
+
+
+def generate(dataset, env):
+    DATA_DIR.mkdir(exist_ok=True)
+    path = database_path(dataset)
+    path.unlink(missing_ok=True)
+    manage = [sys.executable, str(BASE_DIR / 'manage.py')]
+    subprocess.run([*manage, 'migrate', '-v0'], env=env, check=True)
+    subprocess.run([*manage, 'generate_fixtures', '--products', str(DATASETS[dataset])], env=env, check=True)
+
+
+def serve(server, port, threads, env):
+    if server == 'gunicorn':
+        command = ['gunicorn', 'nokshibox.wsgi', '--bind', f'127.0.0.1:{port}', '--workers', '1',
+                   '--worker-class', 'gthread', '--threads', str(threads)]
+    else:
+        command = [sys.executable, str(BASE_DIR / 'manage.py'), 'runserver', f'127.0.0.1:{port}', '--noreload']
+    process = subprocess.Popen(command, cwd=BASE_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        try:
+            requests.get(base_url + '/', timeout=1)
+            return process, base_url
+        except requests.RequestException:
+            time.sleep(0.1)
+    process.terminate()
+    raise SystemExit(f"The {server} server on port {port} did not start.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dataset', choices=DATASETS, default='1k')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--generate', action='store_true', help="(Re)build the dataset's database first.")
+    parser.add_argument('--serve', action='store_true', help="Start a server on the dataset's database.")
+    parser.add_argument('--server', choices=('gunicorn', 'runserver'), default='gunicorn',
+                        help="what --serve starts; with --base-url, what is already serving it")
+    parser.add_argument('--debug', action='store_true', help="Serve with DEBUG on, as in development.")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--sellers', type=int, default=2, help="concurrent seller sessions")
+    parser.add_argument('--buyers', type=int, default=6, help="concurrent buyer sessions")
+    parser.add_argument('-d', '--duration', type=float, default=30.0, help='seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+    parser.add_argument('--floor-ms', type=float, default=5.0, help="ignore p95 changes smaller than this")
+    parser.add_argument('--save-baseline', action='store_true', help="Store this run as the dataset's baseline.")
+    parser.add_argument('--json', type=Path, help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    env = {**os.environ, 'SQLITE_PATH': str(database_path(args.dataset)),
+           'MEDIA_ROOT': str(DATA_DIR / 'media'), 'SQLITE_PROFILE': os.environ.get('SQLITE_PROFILE', 'production'),
+           'DJANGO_DEBUG': '1' if args.debug else '0'}
+    if args.generate:
+        generate(args.dataset, env)
+    if args.serve:
+        server, base_url = serve(args.server, args.port, args.sellers + args.buyers, env)
+        setup = f"{args.server}, DEBUG {'on' if args.debug else 'off'}"
+    else:
+        server, base_url = None, args.base_url.rstrip('/')
+        setup = f"{args.server}, settings as that server was started with"
+    try:
+        print(f"{args.sellers} sellers and {args.buyers} buyers for {args.duration:.0f}s "
+              f"against {base_url} ({args.dataset} products; {setup})")
+        results, failures = run(base_url, args.sellers, args.buyers, args.duration, args.seed)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    params = {name: getattr(args, name) for name in PARAMETERS}
+    baselines = load_baselines()
+    baseline = baselines.get(args.dataset, {})
+    differences = mismatches(params, baseline) if baseline else []
+    endpoints = {} if differences else baseline.get('endpoints', {})
+    report(results, endpoints)
+    for failure in sorted(set(failures))[:10]:
+        print(f"  failed: {failure}")
+    if args.json:
+        args.json.write_text(json.dumps({'params': params, 'endpoints': results}, indent=2))
+    if args.save_baseline:
+        baselines[args.dataset] = {
+            'params': params,
+            'endpoints': {label: {'p95_ms': row['p95_ms'], 'rps': row['rps']} for label, row in results.items()},
+        }
+        BASELINES.write_text(json.dumps(baselines, indent=2, sort_keys=True) + '\n')
+        print(f"Saved the {args.dataset} baseline to {BASELINES.relative_to(BASE_DIR)}.")
+        return
+    if differences:
+        for difference in differences:
+            print(f"NOT COMPARABLE {difference}")
+        print(f"Rerun with the baseline's options, or --save-baseline to replace the {args.dataset} baseline.")
+        sys.exit(2)
+    problems = regressions(results, endpoints, args.tolerance, args.floor_ms)
+    for problem in problems:
+        print(f"REGRESSION {problem}")
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# loadtest.py
+
+"""
+Closed-loop HTTP load test for the catalog and detail pages.
+
+Runs a fixed number of concurrent clients against a running server for a
+fixed time and reports requests per second and p50/p95/p99 latency per URL.
+Use it to compare the WSGI and ASGI deployments on the same database:
+
+    gunicorn nokshibox.wsgi -w 4 -b 127.0.0.1:8000
+    python testing/loadtest.py --base-url http://127.0.0.1:8000
+
+    uvicorn nokshibox.asgi:application --workers 4 --port 8001
+    python testing/loadtest.py --base-url http://127.0.0.1:8001
+
+Pass --session <sessionid> to measure logged-in traffic, which skips the
+shared-cache headers and loads the user on every request.
+"""
+
+import argparse
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+
+DEFAULT_PATHS = ['/products/', '/buyer/', '/product/1/', '/profile/1/']
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not samples:
+        return 0.0
+    rank = max(0, min(len(samples) - 1, round(pct / 100 * len(samples)) - 1))
+    return samples[rank]
+
+
+def client(base_url, paths, deadline, headers, results, lock):
+    """Request ``paths`` round-robin until ``deadline``, recording latencies."""
+    opener = urllib.request.build_opener()
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    i = 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        request = urllib.request.Request(base_url + path, headers=headers)
+        started = time.perf_counter()
+        try:
+            with opener.open(request, timeout=30) as response:
+                response.read()
+        except (urllib.error.URLError, OSError):
+            errors[path] += 1
+            continue
+        latencies[path].append(time.perf_counter() - started)
+    with lock:
+        for path, samples in latencies.items():
+            results['latencies'][path].extend(samples)
+        for path, count in errors.items():
+            results['errors'][path] += count
+
+
+def run(base_url, paths, concurrency, duration, session=None):
+    headers = {'Cookie': f'sessionid={session}'} if session else {}
+    results = {'latencies': defaultdict(list), 'errors': defaultdict(int)}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(client, base_url.rstrip('/'), paths, deadline, headers, results, lock)
+    return results
+
+
+def report(results, duration):
+    print(f"{'path':<24}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    everything = []
+    for path in sorted(set(results['latencies']) | set(results['errors'])):
+        samples = sorted(results['latencies'][path])
+        everything.extend(samples)
+        print(f"{path:<24}{len(samples):>10}{results['errors'][path]:>8}{len(samples) / duration:>10.1f}"
+              f"{percentile(samples, 50) * 1000:>10.1f}{percentile(samples, 95) * 1000:>10.1f}"
+              f"{percentile(samples, 99) * 1000:>10.1f}")
+    everything.sort()
+    if everything:
+        print(f"{'total':<24}{len(everything):>10}{sum(results['errors'].values()):>8}"
+              f"{len(everything) / duration:>10.1f}{statistics.median(everything) * 1000:>10.1f}"
+              f"{percentile(everything, 95) * 1000:>10.1f}{percentile(everything, 99) * 1000:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--path', action='append', dest='paths', help='URL path to request (repeatable)')
+    parser.add_argument('-c', '--concurrency', type=int, default=32)
+    parser.add_argument('-d', '--duration', type=float, default=30.0, help='seconds')
+    parser.add_argument('--session', help='sessionid cookie value for logged-in traffic')
+    args = parser.parse_args()
+
+    print(f"{args.concurrency} clients for {args.duration:.0f}s against {args.base_url}")
+    results = run(args.base_url, args.paths or DEFAULT_PATHS, args.concurrency, args.duration, args.session)
+    report(results, args.duration)
+
+
+if __name__ == '__main__':
+    main()